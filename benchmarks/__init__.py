@@ -0,0 +1,8 @@
+"""
+Benchmark suites for Pharmacy AI application.
+Run with: python manage.py benchmark <suite>
+
+Kept outside pharmacy_app so they are not deployed with it. Every suite
+runs in a scratch database created for the run (see run_suite).
+"""
+from .suites import SUITES, compare_results, run_suite, scratch_database  # noqa: F401
@@ -0,0 +1,1776 @@
+"""
+Benchmark suites for Pharmacy AI application.
+Run with: python manage.py benchmark <suite>
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from pharmacy_app.models import Medicine, PrescriptionLine
+from pharmacy_app.index_utils import MedicineNameIndex
+from concurrent.futures import ThreadPoolExecutor
+from pharmacy_app.ocr_utils import (
+    extract_text_from_pdf, iter_pdf_text, create_ocr_engine, ocr_file,
+    OCRWorkerPool, PytesseractEngine,
+)
+from pharmacy_app.image_utils import preprocess_image
+from pharmacy_app.analytics_utils import DEMAND_STATUSES, with_rates
+
+
+ONSETS = ['', 'b', 'c', 'd', 'f', 'g', 'h', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'x', 'z',
+          'br', 'cl', 'dr', 'fl', 'gl', 'pr', 'st', 'tr', 'th', 'ph', 'ch']
+VOWELS = ['a', 'e', 'i', 'o', 'u', 'y', 'ae', 'io', 'ou']
+CODAS = ['', 'l', 'm', 'n', 'r', 's', 't', 'x', 'nd', 'st', 'zol', 'cin', 'pril', 'mab']
+STRENGTHS = ['5mg', '10mg', '20mg', '40mg', '100mg', '250mg', '500mg', '1g']
+
+
+def synthetic_medicine_names(count, seed=42):
+    """
+    Generate unique, realistic-looking medicine names with strengths.
+
+    Like a real catalogue, each generic stem is sold at several strengths.
+    """
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        stem = ''.join(
+            rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+            for _ in range(rng.randint(2, 3))
+        )
+        for strength in rng.sample(STRENGTHS, rng.randint(1, 4)):
+            names.add(f"{stem.capitalize()} {strength}")
+    return sorted(names)[:count]
+
+
+def add_typo(name, rng):
+    """Replace one letter of the base name with a random letter."""
+    positions = [i for i, ch in enumerate(name.split()[0]) if ch.isalpha()]
+    i = rng.choice(positions)
+    return name[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[i + 1:]
+
+
+def add_ocr_noise(name, rng):
+    """Apply an OCR-style substitution (o->0, l->1) to a name, if possible."""
+    positions = [i for i, ch in enumerate(name) if ch in 'ol']
+    if not positions:
+        return name
+    i = rng.choice(positions)
+    return name[:i] + {'o': '0', 'l': '1'}[name[i]] + name[i + 1:]
+
+
+def timed(func, *args, **kwargs):
+    """Run func and return (result, elapsed milliseconds)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summarize(samples_ms):
+    """Summarize a list of latencies in milliseconds."""
+    ordered = sorted(samples_ms)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.mean(ordered), 4),
+        'p50_ms': round(ordered[len(ordered) // 2], 4),
+        'p95_ms': round(ordered[int(len(ordered) * 0.95) - 1], 4),
+        'max_ms': round(ordered[-1], 4),
+    }
+
+
+def bench_index(size=50000, queries=200, seed=42):
+    """
+    Compare the in-memory name index against the ORM icontains lookup.
+
+    The synthetic catalogue is inserted inside a transaction that is
+    rolled back, so the benchmark leaves the database unchanged.
+    """
+    rng = random.Random(seed)
+    names = synthetic_medicine_names(size, seed)
+    sample = rng.sample(names, queries)
+    exact = list(sample)
+    noisy = [add_ocr_noise(name, rng) for name in sample]
+    typos = [add_typo(name, rng) for name in sample]
+
+    index = MedicineNameIndex()
+    _, build_ms = timed(index.build, enumerate(names, start=1))
+
+    def run_index(batch, limit=1):
+        latencies, hits = [], 0
+        for query, expected in zip(batch, sample):
+            candidates, elapsed = timed(index.search, query, limit=limit)
+            latencies.append(elapsed)
+            hits += bool(candidates and candidates[0].name == expected)
+        return summarize(latencies), hits / len(batch)
+
+    def run_orm(batch):
+        latencies, hits = [], 0
+        for query, expected in zip(batch, sample):
+            medicine, elapsed = timed(
+                lambda q: Medicine.objects.filter(
+                    Q(name__icontains=q) | Q(name__iexact=q)
+                ).first(),
+                query
+            )
+            latencies.append(elapsed)
+            hits += bool(medicine and medicine.name == expected)
+        return summarize(latencies), hits / len(batch)
+
+    results = {'size': size, 'queries': queries, 'index_build_ms': round(build_ms, 2)}
+    results['index_exact'], results['index_exact_recall'] = run_index(exact)
+    results['index_noisy'], results['index_noisy_recall'] = run_index(noisy)
+    results['index_typo'], results['index_typo_recall'] = run_index(typos)
+    results['index_typo_top5'], _ = run_index(typos, limit=5)
+
+    with transaction.atomic():
+        Medicine.objects.bulk_create(
+            [Medicine(name=name, stock_quantity=10) for name in names],
+            batch_size=5000
+        )
+        results['orm_exact'], results['orm_exact_recall'] = run_orm(exact)
+        results['orm_noisy'], results['orm_noisy_recall'] = run_orm(noisy)
+        results['orm_typo'], results['orm_typo_recall'] = run_orm(typos)
+        transaction.set_rollback(True)
+
+    return results
+
+
+def write_synthetic_pdf(path, pages, lines_per_page=40, seed=42, names=None):
+    """Write a text-only PDF whose pages list names (synthetic medicine names by default)."""
+    if names is None:
+        names = synthetic_medicine_names(pages * lines_per_page, seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page in range(pages):
+        lines = names[page * lines_per_page:(page + 1) * lines_per_page]
+        stream = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(
+            f"({line}) Tj T*" for line in lines
+        ) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+        content_ref = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>".encode()
+        )
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {pages} >>".encode()
+
+    with open(path, 'wb') as pdf:
+        pdf.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(pdf.tell())
+            pdf.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref_offset = pdf.tell()
+        pdf.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            pdf.write(f"{offset:010d} 00000 n \n".encode())
+        pdf.write(
+            f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+
+def legacy_extract_text_from_pdf(pdf_path):
+    """The original sequential extractor, kept as the benchmark baseline."""
+    import PyPDF2
+
+    text = ""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+    return text.strip()
+
+
+def bench_pdf(size=200):
+    """Compare sequential and process-pool PDF text extraction."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic.pdf')
+        write_synthetic_pdf(path, size)
+
+        baseline, baseline_ms = timed(legacy_extract_text_from_pdf, path)
+        parallel_cold, cold_ms = timed(extract_text_from_pdf, path)
+        parallel, warm_ms = timed(extract_text_from_pdf, path)
+
+        start = time.perf_counter()
+        pages = iter_pdf_text(path)
+        next(pages)
+        first_page_ms = (time.perf_counter() - start) * 1000
+        pages.close()
+
+    return {
+        'pages': size,
+        'workers': settings.PDF_WORKERS,
+        'sequential_ms': round(baseline_ms, 2),
+        'parallel_cold_ms': round(cold_ms, 2),
+        'parallel_warm_ms': round(warm_ms, 2),
+        'speedup_warm': round(baseline_ms / warm_ms, 2),
+        'stream_first_page_ms': round(first_page_ms, 2),
+        'output_identical': baseline == parallel == parallel_cold,
+    }
+
+
+def write_synthetic_photo(path, names, size=(4000, 3000), angle=3.0, seed=42):
+    """
+    Write a JPEG resembling a phone photo of a prescription.
+
+    Medicine names are printed on a page with a lighting gradient, sensor
+    noise and a slight tilt, and the EXIF orientation is set so the pixels
+    are stored sideways, as many phones do.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = size
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=height // 30)
+    y = height // 10
+    for name in names:
+        draw.text((width // 10, y), name, fill=20, font=font)
+        y += height // 20
+
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(page, dtype=np.float64)
+    gradient = np.linspace(1.0, 0.55, width)[None, :] * np.linspace(1.0, 0.8, height)[:, None]
+    pixels = pixels * gradient + rng.normal(0, 12, pixels.shape)
+    photo = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode='L')
+    photo = photo.rotate(angle, expand=False, fillcolor=200, resample=Image.BICUBIC)
+
+    # Store the pixels rotated; orientation 6 tells readers to turn them back
+    photo = photo.convert('RGB').transpose(Image.ROTATE_90)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    photo.save(path, 'JPEG', quality=90, exif=exif)
+
+
+def name_recall(text, names):
+    """Fraction of names whose base word appears in the OCR text."""
+    words = set(text.lower().split())
+    return sum(name.split()[0].lower() in words for name in names) / len(names)
+
+
+def bench_preprocess(size=5, names_per_image=12):
+    """Time image preprocessing stages and, if Tesseract is installed, recall."""
+    from PIL import Image
+
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+    except Exception:
+        pytesseract = None
+
+    stage_samples = {}
+    totals, raw_ocr_ms, pre_ocr_ms, raw_recall, pre_recall = [], [], [], [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(size):
+            names = synthetic_medicine_names(names_per_image, seed=i)
+            path = os.path.join(tmp, f'photo_{i}.jpg')
+            write_synthetic_photo(path, names, seed=i)
+
+            start = time.perf_counter()
+            with Image.open(path) as image:
+                processed, timings = preprocess_image(image)
+            totals.append((time.perf_counter() - start) * 1000)
+            for stage, ms in timings.items():
+                stage_samples.setdefault(stage, []).append(ms)
+
+            if pytesseract is not None:
+                with Image.open(path) as image:
+                    raw_text, ms = timed(pytesseract.image_to_string, image)
+                raw_ocr_ms.append(ms)
+                raw_recall.append(name_recall(raw_text, names))
+                pre_text, ms = timed(pytesseract.image_to_string, processed)
+                pre_ocr_ms.append(ms)
+                pre_recall.append(name_recall(pre_text, names))
+
+    result = {
+        'images': size,
+        'stages': {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        'preprocess_total': summarize(totals),
+    }
+    if pytesseract is None:
+        result['ocr'] = 'unavailable (tesseract not installed)'
+    else:
+        result['ocr'] = {
+            'raw': summarize(raw_ocr_ms),
+            'preprocessed': summarize(pre_ocr_ms),
+            'raw_recall': round(statistics.mean(raw_recall), 3),
+            'preprocessed_recall': round(statistics.mean(pre_recall), 3),
+        }
+    return result
+
+
+def run_concurrently(func, items, concurrency):
+    """Call func on every item from concurrency threads; return (latencies, wall ms)."""
+    def call(item):
+        return timed(func, item)[1]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, items))
+    return latencies, (time.perf_counter() - start) * 1000
+
+
+def bench_ocr(size=24, concurrency_levels=(1, 4, 8)):
+    """Compare per-call pytesseract with the persistent OCR worker pool."""
+    from PIL import Image
+
+    try:
+        create_ocr_engine().recognize(Image.new('L', (64, 32), 255))
+    except Exception as e:
+        return {'ocr': f'unavailable ({e.__class__.__name__}: {e})'}
+
+    def per_call(path):
+        # The pre-pool path: a fresh tesseract process for every image
+        with Image.open(path) as image:
+            processed, _ = preprocess_image(image)
+        return PytesseractEngine().recognize(processed)
+
+    results = {'images': size, 'workers': settings.OCR_WORKERS, 'engine': settings.OCR_ENGINE}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(size):
+            path = os.path.join(tmp, f'photo_{i}.jpg')
+            write_synthetic_photo(path, synthetic_medicine_names(8, seed=i), size=(2000, 1500), seed=i)
+            paths.append(path)
+
+        pool = OCRWorkerPool(
+            workers=settings.OCR_WORKERS,
+            max_pending=max(concurrency_levels),
+            timeout=settings.OCR_TIMEOUT
+        )
+        try:
+            _, cold_ms = timed(pool.ocr_file, paths[0])
+            results['pool_cold_start_ms'] = round(cold_ms, 2)
+            for concurrency in concurrency_levels:
+                baseline, baseline_ms = run_concurrently(per_call, paths, concurrency)
+                pooled, pooled_ms = run_concurrently(pool.ocr_file, paths, concurrency)
+                results[f'concurrency_{concurrency}'] = {
+                    'per_call_images_per_s': round(size / (baseline_ms / 1000), 2),
+                    'pool_images_per_s': round(size / (pooled_ms / 1000), 2),
+                    'speedup': round(baseline_ms / pooled_ms, 2),
+                    'per_call_latency': summarize(baseline),
+                    'pool_latency': summarize(pooled),
+                }
+            results['pool_stats'] = pool.stats()
+        finally:
+            pool.shutdown()
+        results['output_identical'] = [per_call(p) for p in paths[:3]] == [ocr_file(p) for p in paths[:3]]
+    return results
+
+
+def synthetic_scan_png(names):
+    """Return the bytes of a small PNG scan listing the given names."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('L', (800, 600), 255)
+    draw = ImageDraw.Draw(image)
+    for i, name in enumerate(names):
+        draw.text((40, 40 + 30 * i), name, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def bench_batch(size=500):
+    """
+    Compare one upload request per file with a single ZIP batch upload.
+
+    Measures ingest only (storage writes, hashing, row inserts and the
+    response): inside the rolled-back transaction no job is ever handed
+    to the workers. Files are written to a temporary MEDIA_ROOT.
+    """
+    import zipfile
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+    from pharmacy_app.models import User, Prescription
+
+    files = [
+        synthetic_scan_png(synthetic_medicine_names(6, seed=i))
+        for i in range(size)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp):
+        archive_path = os.path.join(tmp, 'batch.zip')
+        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED) as archive:
+            for i, data in enumerate(files):
+                archive.writestr(f'scans/rx_{i:04d}.png', data)
+        archive_bytes = os.path.getsize(archive_path)
+
+        with transaction.atomic():
+            client = APIClient()
+            client.force_authenticate(User.objects.create_user('batch-benchmark'))
+
+            latencies = []
+            start = time.perf_counter()
+            for i, data in enumerate(files):
+                upload = io.BytesIO(data)
+                upload.name = f'rx_{i:04d}.png'
+                response, elapsed = timed(
+                    client.post, '/api/prescriptions/upload/', {'file': upload}
+                )
+                latencies.append(elapsed)
+            single_ms = (time.perf_counter() - start) * 1000
+            single_ok = response.status_code == 202
+
+            with open(archive_path, 'rb') as archive:
+                response, batch_ms = timed(
+                    client.post, '/api/prescriptions/batch/', {'files': archive}
+                )
+            batch_ok = response.status_code == 202 and response.json()['total_files'] == size
+
+            batch_id = response.json()['batch_id']
+            _, status_ms = timed(client.get, f'/api/prescriptions/batch/{batch_id}/')
+            rows = Prescription.objects.count()
+            transaction.set_rollback(True)
+
+    return {
+        'files': size,
+        'archive_bytes': archive_bytes,
+        'single_requests_ms': round(single_ms, 2),
+        'single_files_per_s': round(size / (single_ms / 1000), 2),
+        'single_request_latency': summarize(latencies),
+        'batch_request_ms': round(batch_ms, 2),
+        'batch_files_per_s': round(size / (batch_ms / 1000), 2),
+        'speedup': round(single_ms / batch_ms, 2),
+        'batch_status_ms': round(status_ms, 2),
+        'rows_created': rows,
+        'ok': single_ok and batch_ok,
+    }
+
+
+def peak_memory_kib(func, *args, **kwargs):
+    """Run func under tracemalloc and return its peak traced memory in KiB."""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def bench_medicines(size=100000):
+    """
+    Compare the old full medicines listing with keyset pages and NDJSON.
+
+    Reports time and peak Python memory for each; the catalogue is
+    inserted inside a transaction that is rolled back.
+    """
+    from rest_framework.test import APIClient
+    from pharmacy_app.models import User
+
+    def legacy_listing():
+        # The pre-pagination view body
+        return [
+            {
+                'id': med.id,
+                'name': med.name,
+                'composition': med.composition,
+                'stock_quantity': med.stock_quantity,
+                'manufacturer': med.manufacturer,
+                'created_at': med.created_at.isoformat(),
+            }
+            for med in Medicine.objects.all().order_by('name')
+        ]
+
+    def stream_all(client):
+        response = client.get('/api/medicines/?stream=ndjson')
+        return sum(chunk.count(b'\n') for chunk in response.streaming_content)
+
+    def last_page(client):
+        # Walk to the final page, as a client syncing the catalogue would
+        url, pages = '/api/medicines/?page_size=500', 0
+        while url:
+            start = time.perf_counter()
+            data = client.get(url).json()
+            page_ms = (time.perf_counter() - start) * 1000
+            url, pages = data['next'], pages + 1
+        return pages, page_ms
+
+    with transaction.atomic():
+        Medicine.objects.bulk_create(
+            [
+                Medicine(name=name, composition=name.split()[0], stock_quantity=i % 200,
+                         manufacturer='Synthetic Labs')
+                for i, name in enumerate(synthetic_medicine_names(size))
+            ],
+            batch_size=5000
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('medicines-benchmark', role='admin'))
+
+        client.get('/api/medicines/')  # warm up URL resolution and auth
+
+        rows, legacy_ms = timed(legacy_listing)
+        first, first_ms = timed(client.get, '/api/medicines/')
+        streamed, stream_ms = timed(stream_all, client)
+        (pages, deepest_page_ms), walk_ms = timed(last_page, client)
+        legacy_kib = peak_memory_kib(legacy_listing)
+        first_kib = peak_memory_kib(client.get, '/api/medicines/')
+        stream_kib = peak_memory_kib(stream_all, client)
+        transaction.set_rollback(True)
+
+    return {
+        'size': size,
+        'legacy_all_rows': {'ms': round(legacy_ms, 2), 'peak_kib': legacy_kib, 'rows': len(rows)},
+        'keyset_first_page': {'ms': round(first_ms, 2), 'peak_kib': first_kib,
+                              'rows': len(first.json()['results'])},
+        'keyset_last_page_ms': round(deepest_page_ms, 2),
+        'keyset_walk_500_per_page': {'ms': round(walk_ms, 2), 'pages': pages},
+        'ndjson_stream': {'ms': round(stream_ms, 2), 'peak_kib': stream_kib, 'rows': streamed},
+    }
+
+
+def bench_history(size=10000, users=5):
+    """
+    Compare the old unpaginated prescription history with keyset pages.
+
+    Creates size prescriptions (with realistic text and result blobs)
+    for each of several users inside a rolled-back transaction and
+    measures one user's history.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from pharmacy_app.models import User, Prescription
+
+    rng = random.Random(42)
+    names = synthetic_medicine_names(500)
+
+    def synthetic_results():
+        return [
+            {'medicine_name': name, 'status': 'Available', 'stock': rng.randint(1, 200),
+             'alternative': None}
+            for name in rng.sample(names, 5)
+        ]
+
+    def legacy_history(user):
+        # The pre-pagination view body
+        return [
+            {
+                'id': presc.id,
+                'file_url': presc.file.url if presc.file else None,
+                'created_at': presc.created_at.isoformat(),
+                'results_count': len(presc.results_json) if presc.results_json else 0
+            }
+            for presc in Prescription.objects.filter(uploaded_by=user).order_by('-created_at')
+        ]
+
+    with transaction.atomic():
+        accounts = [User.objects.create_user(f'history-benchmark-{i}') for i in range(users)]
+        now = timezone.now()
+        text = '\n'.join(names[:60])
+        for user in accounts:
+            rows = []
+            for i in range(size):
+                results = synthetic_results()
+                rows.append(Prescription(
+                    file=f'prescriptions/bench/{user.id}_{i}.jpg',
+                    extracted_text=text,
+                    results_json=results,
+                    results_count=len(results),
+                    status=Prescription.STATUS_COMPLETED,
+                    uploaded_by=user
+                ))
+            Prescription.objects.bulk_create(rows, batch_size=2000)
+        # bulk_create stamps one created_at; spread them out like real history
+        for offset, prescription_id in enumerate(
+            Prescription.objects.filter(uploaded_by__in=accounts).values_list('id', flat=True)
+        ):
+            Prescription.objects.filter(id=prescription_id).update(
+                created_at=now - timedelta(minutes=offset)
+            )
+
+        user = accounts[0]
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get('/api/prescriptions/history/')  # warm up
+
+        legacy = [timed(legacy_history, user)[1] for _ in range(3)]
+        first = [timed(client.get, '/api/prescriptions/history/')[1] for _ in range(20)]
+
+        deep, url, pages = [], '/api/prescriptions/history/?page_size=100', 0
+        while url:
+            response, elapsed = timed(client.get, url)
+            deep.append(elapsed)
+            url, pages = response.json()['next'], pages + 1
+
+        plan = Prescription.objects.filter(uploaded_by=user).only(
+            'id', 'file', 'status', 'results_count', 'created_at'
+        ).order_by('-created_at', '-id')[:21].explain()
+        legacy_kib = peak_memory_kib(legacy_history, user)
+        page_kib = peak_memory_kib(client.get, '/api/prescriptions/history/')
+        transaction.set_rollback(True)
+
+    return {
+        'prescriptions_per_user': size,
+        'users': users,
+        'legacy_full_history': dict(summarize(legacy), peak_kib=legacy_kib),
+        'first_page': dict(summarize(first), peak_kib=page_kib),
+        'every_page_100_per_page': dict(summarize(deep), pages=pages),
+        'first_page_plan': plan,
+    }
+
+
+def bench_search(size=100000, queries=200, seed=42):
+    """
+    Compare the old three-column icontains scan with full-text search.
+
+    Queries are typeahead prefixes of names, compositions and
+    manufacturers. The catalogue is inserted in a rolled-back transaction
+    (the FTS triggers index it as it goes).
+    """
+    from pharmacy_app.search_utils import MedicineTextIndex, get_search_backend
+
+    rng = random.Random(seed)
+    names = synthetic_medicine_names(size, seed)
+    suffixes = ['Pharma', 'Labs', 'Healthcare', 'Biotech', 'Lifesciences', 'Remedies']
+    manufacturers = [
+        f'{name.split()[0]} {suffixes[i % len(suffixes)]}'
+        for i, name in enumerate(synthetic_medicine_names(300, seed + 1))
+    ]
+    rows = [
+        (i, name, f'{name.split()[0]} {rng.choice(STRENGTHS)}', rng.choice(manufacturers))
+        for i, name in enumerate(names, start=1)
+    ]
+
+    sample = rng.sample(rows, queries)
+    fields = [row[rng.choice((1, 2, 3))] for row in sample]
+    # What the search box sends after three keystrokes, and a complete word
+    query_sets = {
+        'typeahead': [rng.choice(text.split())[:3] for text in fields],
+        'word': [text.split()[0] for text in fields],
+    }
+
+    def legacy(query):
+        return list(Medicine.objects.filter(
+            Q(name__icontains=query) |
+            Q(composition__icontains=query) |
+            Q(manufacturer__icontains=query)
+        ).order_by('name')[:20])
+
+    text_index = MedicineTextIndex()
+    _, build_ms = timed(text_index.build, rows)
+
+    results = {'size': size, 'queries': queries, 'python_index_build_ms': round(build_ms, 2)}
+    with transaction.atomic():
+        Medicine.objects.bulk_create(
+            [
+                Medicine(name=name, composition=composition, manufacturer=manufacturer)
+                for _, name, composition, manufacturer in rows
+            ],
+            batch_size=5000
+        )
+        backend = get_search_backend()
+        results['database_backend'] = backend.name
+        for label, batch in query_sets.items():
+            results[f'{label}_legacy_icontains'] = summarize([timed(legacy, q)[1] for q in batch])
+            results[f'{label}_database_fulltext'] = summarize(
+                [timed(backend.search, q, 20)[1] for q in batch]
+            )
+        transaction.set_rollback(True)
+
+    for label, batch in query_sets.items():
+        results[f'{label}_python_index'] = summarize(
+            [timed(text_index.search, q, 20)[1] for q in batch]
+        )
+    return results
+
+
+def bench_autocomplete(size=100000, queries=200, seed=42):
+    """
+    Time typeahead lookups against loading the whole catalogue.
+
+    The alternatives page used to load every medicine into two <select>
+    lists; the autocomplete index answers each keystroke instead. Queries
+    are 1-4 character prefixes of name words, so broad one-letter
+    prefixes are included.
+    """
+    from pharmacy_app.search_utils import MedicineAutocompleteIndex
+
+    rng = random.Random(seed)
+    names = synthetic_medicine_names(size, seed)
+    rows = [(i, name, rng.randint(0, 500)) for i, name in enumerate(names, start=1)]
+
+    index = MedicineAutocompleteIndex()
+    _, build_ms = timed(index.build, rows)
+
+    results = {'size': size, 'queries': queries, 'index_build_ms': round(build_ms, 2)}
+    for length in (1, 2, 3, 4):
+        prefixes = [rng.choice(name.split())[:length] for name in rng.sample(names, queries)]
+        results[f'prefix_{length}_index'] = summarize(
+            [timed(index.complete, prefix, 10)[1] for prefix in prefixes]
+        )
+
+    updates = rng.sample(rows, min(queries, size))
+    results['index_update'] = summarize(
+        [timed(index.add, i, name, rng.randint(0, 500))[1] for i, name, _ in updates]
+    )
+
+    with transaction.atomic():
+        Medicine.objects.bulk_create(
+            [Medicine(name=name, stock_quantity=stock) for _, name, stock in rows],
+            batch_size=5000
+        )
+        results['full_catalogue_load'] = summarize(
+            [timed(lambda: list(Medicine.objects.all().order_by('name')))[1] for _ in range(3)]
+        )
+        transaction.set_rollback(True)
+    return results
+
+
+def bench_alternatives(size=1000000, nodes=200000, queries=1000, seed=42):
+    """
+    Time multi-hop alternative suggestions on a synthetic graph.
+
+    Builds a graph with `size` random Alternative edges over `nodes`
+    medicines (a third of them out of stock, compositions drawn from a
+    small pool so matches occur). For out-of-stock medicines, compares
+    how often the old first-alternative lookup found an in-stock
+    substitute with how often the graph search does.
+    """
+    from pharmacy_app.alternatives_utils import AlternativesGraph
+
+    rng = random.Random(seed)
+    ingredients = [name.split()[0] for name in synthetic_medicine_names(400, seed + 1)]
+    compositions = [
+        ' + '.join(
+            f'{ingredient} {rng.choice(STRENGTHS)}'
+            for ingredient in rng.sample(ingredients, rng.randint(1, 2))
+        )
+        for _ in range(2000)
+    ]
+    medicines = [
+        (i, 0 if rng.random() < 1 / 3 else rng.randint(1, 500), rng.choice(compositions))
+        for i in range(1, nodes + 1)
+    ]
+    edges = set()
+    while len(edges) < size:
+        source, target = rng.randint(1, nodes), rng.randint(1, nodes)
+        if source != target:
+            edges.add((source, target))
+    edges = sorted(edges)
+
+    graph = AlternativesGraph()
+    _, build_ms = timed(graph.build, medicines, edges)
+    build_kib = peak_memory_kib(AlternativesGraph().build, medicines, edges)
+
+    stock = {medicine_id: quantity for medicine_id, quantity, _ in medicines}
+    first_alternative = {}
+    for source, target in edges:
+        first_alternative.setdefault(source, target)
+
+    sources = rng.sample([m[0] for m in medicines if m[1] == 0 and m[0] in first_alternative], queries)
+    results = {
+        'edges': size,
+        'nodes': nodes,
+        'queries': queries,
+        'build_ms': round(build_ms, 2),
+        'build_peak_kib': build_kib,
+        'first_alternative_in_stock_rate': round(
+            sum(1 for source in sources if stock[first_alternative[source]] > 0) / queries, 3
+        ),
+    }
+    for max_hops in (1, 2, 3):
+        samples, found = [], 0
+        for source in sources:
+            suggestions, elapsed = timed(graph.suggest, source, 3, max_hops)
+            samples.append(elapsed)
+            found += bool(suggestions)
+        results[f'suggest_{max_hops}_hops'] = summarize(samples)
+        results[f'suggest_{max_hops}_hops_found_rate'] = round(found / queries, 3)
+
+    updates = rng.sample(edges, queries)
+    results['edge_remove_add'] = summarize([
+        timed(graph.remove_edge, *edge)[1] + timed(graph.add_edge, *edge)[1] for edge in updates
+    ])
+    return results
+
+
+def bench_ingredients(size=100000, queries=200, seed=42):
+    """
+    Time same-composition lookups: ingredient index against a scan.
+
+    The scan compares pre-parsed compositions, so the difference is
+    only the cost of visiting every medicine versus one posting list.
+    """
+    from pharmacy_app.ingredient_utils import IngredientIndex, parse_composition
+
+    rng = random.Random(seed)
+    ingredients = [name.split()[0] for name in synthetic_medicine_names(2000, seed + 1)]
+    salts = ['', ' Hydrochloride', ' Sodium']
+    rows = []
+    for i, name in enumerate(synthetic_medicine_names(size, seed), start=1):
+        parts = rng.sample(ingredients, rng.choice((1, 1, 1, 2)))
+        composition = ' + '.join(
+            f'{part}{rng.choice(salts)} {rng.choice(STRENGTHS[3:6])}' for part in parts
+        )
+        rows.append((i, name, composition, rng.randint(0, 200)))
+
+    index = IngredientIndex()
+    _, build_ms = timed(index.build, rows)
+    parsed = [(row[0], parse_composition(row[2], row[1])) for row in rows]
+    compositions = dict(parsed)
+
+    def scan(medicine_id):
+        target = compositions[medicine_id]
+        return [
+            other for other, composition in parsed
+            if composition == target and other != medicine_id
+        ]
+
+    sources = [row[0] for row in rng.sample(rows, queries)]
+    scan_results, scan_ms = zip(*(timed(scan, source) for source in sources))
+    index_results, index_ms = zip(*(timed(index.substitutes, source) for source in sources))
+    return {
+        'size': size,
+        'queries': queries,
+        'index_build_ms': round(build_ms, 2),
+        'scan': summarize(scan_ms),
+        'index': summarize(index_ms),
+        'same_results': all(
+            sorted(a) == sorted(b) for a, b in zip(scan_results, index_results)
+        ),
+        'mean_substitutes': round(statistics.mean(len(r) for r in index_results), 2),
+    }
+
+
+def bench_import(size=1000000, legacy_rows=500, seed=42):
+    """
+    Time the chunked catalogue import against one-row API creates.
+
+    A synthetic CSV of `size` rows is imported twice: once into an empty
+    table (inserts) and once more over itself (every row conflicts and
+    is updated). A third, traced pass reports peak Python memory, which
+    stays flat because the file is streamed and upserted in chunks. All
+    rows are rolled back afterwards.
+    """
+    from django.test import override_settings
+    from pharmacy_app.catalogue_utils import import_medicines_file
+
+    rng = random.Random(seed)
+    chunk_size = settings.CATALOGUE_IMPORT_CHUNK_SIZE
+    results = {'size': size, 'chunk_size': chunk_size}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'catalogue.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write('name,composition,stock_quantity,manufacturer\n')
+            for i, name in enumerate(synthetic_medicine_names(size, seed)):
+                f.write(f'{name},{name.split()[0]},{rng.randint(0, 500)},Maker {i % 300}\n')
+        results['file_mib'] = round(os.path.getsize(path) / 2 ** 20, 1)
+
+        def run(**kwargs):
+            with open(path, 'rb') as f:
+                return import_medicines_file(f, chunk_size=chunk_size, **kwargs)
+
+        # DEBUG keeps the SQL of recent queries (some 30 KiB per chunk), which
+        # would swamp the memory figure; production runs with DEBUG off
+        with override_settings(DEBUG=False), transaction.atomic():
+            for label in ('insert', 'update'):
+                report = run()
+                results[label] = {
+                    'seconds': report['seconds'],
+                    'rows_per_second': report['rows_per_second'],
+                    'invalid': report['invalid'],
+                }
+            results['update']['peak_kib'] = peak_memory_kib(run)
+            transaction.set_rollback(True)
+
+    # The old sync path: one POST /api/medicines/ per row (in-process, no network)
+    from rest_framework.test import APIClient
+    from pharmacy_app.models import User
+
+    with transaction.atomic():
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(User.objects.create(username='benchmark-import', role='admin'))
+        start = time.perf_counter()
+        for i in range(legacy_rows):
+            response = client.post('/api/medicines/', {
+                'name': f'Legacy import {i}',
+                'composition': 'Legacy',
+                'stock_quantity': rng.randint(0, 500),
+                'manufacturer': 'Maker',
+            }, format='json')
+            assert response.status_code == 201, response.content
+        elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    results['legacy_api_posts'] = {
+        'rows': legacy_rows,
+        'rows_per_second': round(legacy_rows / elapsed, 1),
+    }
+    return results
+
+
+def bench_dashboard(size=1000000, medicines=100000, queries=50):
+    """
+    Time the admin dashboard counts: three COUNT(*)s, one conditional
+    aggregate per table, and the cached counters.
+
+    size prescriptions and medicines medicines are created inside a
+    rolled-back transaction.
+    """
+    from pharmacy_app.models import Prescription, User
+    from pharmacy_app.stats_utils import count_dashboard_stats, dashboard_stats, get_dashboard_stats
+
+    rng = random.Random(42)
+
+    def legacy_counts():
+        return {
+            'total_medicines': Medicine.objects.count(),
+            'low_stock_medicines': Medicine.objects.filter(needs_reorder=True).count(),
+            'total_prescriptions': Prescription.objects.count(),
+        }
+
+    with transaction.atomic():
+        Medicine.objects.bulk_create(
+            [Medicine(name=name, stock_quantity=rng.randint(0, 100))
+             for name in synthetic_medicine_names(medicines)],
+            batch_size=5000
+        )
+        user = User.objects.create_user('dashboard-benchmark')
+        for start in range(0, size, 5000):
+            Prescription.objects.bulk_create(
+                [Prescription(file=f'prescriptions/bench/{i}.jpg', uploaded_by=user)
+                 for i in range(start, min(start + 5000, size))],
+                batch_size=5000
+            )
+
+        legacy = [timed(legacy_counts)[1] for _ in range(queries)]
+        aggregate = [timed(count_dashboard_stats)[1] for _ in range(queries)]
+        dashboard_stats.invalidate()
+        get_dashboard_stats()
+        cached = [timed(get_dashboard_stats)[1] for _ in range(queries)]
+        assert get_dashboard_stats() == legacy_counts()
+        transaction.set_rollback(True)
+    dashboard_stats.invalidate()
+
+    return {
+        'prescriptions': size,
+        'medicines': medicines,
+        'three_counts': summarize(legacy),
+        'conditional_aggregates': summarize(aggregate),
+        'cached_counters': summarize(cached),
+    }
+
+
+def bench_reorder(size=100000, prescriptions=20000, queries=20, seed=42):
+    """
+    Time the reorder queue over size medicines and the recent demand of
+    prescriptions completed prescriptions, against the old hard-coded
+    stock_quantity < 10 filter. Everything is rolled back.
+    """
+    from pharmacy_app.models import Prescription, User
+    from pharmacy_app.reorder_utils import count_demand, reorder_queue, refresh_reorder_flags
+    from pharmacy_app.cache_utils import get_cache
+
+    rng = random.Random(seed)
+    names = synthetic_medicine_names(size, seed)
+
+    with transaction.atomic():
+        Medicine.objects.bulk_create(
+            [Medicine(name=name, stock_quantity=rng.randint(0, 200), reorder_point=rng.randint(5, 50))
+             for name in names],
+            batch_size=5000
+        )
+        refresh_reorder_flags()
+        user = User.objects.create_user('reorder-benchmark')
+        for start in range(0, prescriptions, 2000):
+            Prescription.objects.bulk_create([
+                Prescription(
+                    file=f'prescriptions/bench/{i}.jpg',
+                    status=Prescription.STATUS_COMPLETED,
+                    results_json=[
+                        {'medicine_name': name, 'status': 'Available'}
+                        for name in rng.sample(names[:size // 10], 5)
+                    ],
+                    uploaded_by=user
+                )
+                for i in range(start, min(start + 2000, prescriptions))
+            ])
+
+        fields = ('id', 'name', 'stock_quantity', 'reorder_point')
+        legacy_rows = Medicine.objects.filter(stock_quantity__lt=10).order_by().values(*fields)
+        flagged_rows = Medicine.objects.filter(needs_reorder=True).order_by().values(*fields)
+        legacy = [timed(list, legacy_rows.all())[1] for _ in range(queries)]
+        flagged = [timed(list, flagged_rows.all())[1] for _ in range(queries)]
+        demand = [timed(count_demand, settings.REORDER_DEMAND_DAYS)[1] for _ in range(3)]
+        get_cache('demand').clear()
+        cold = timed(reorder_queue)[1]
+        warm = [timed(reorder_queue)[1] for _ in range(queries)]
+        queue_length = len(reorder_queue())
+        plan = flagged_rows.explain()
+        transaction.set_rollback(True)
+    get_cache('demand').clear()
+
+    return {
+        'medicines': size,
+        'prescriptions': prescriptions,
+        'queue_length': queue_length,
+        'legacy_low_stock_filter': summarize(legacy),
+        'needs_reorder_filter': summarize(flagged),
+        'demand_scan': summarize(demand),
+        'queue_cold_ms': round(cold, 3),
+        'queue_warm': summarize(warm),
+        'flag_plan': plan,
+    }
+
+
+def create_completed_prescriptions(size, names, username, now, seed=42, days=60):
+    """
+    Create the medicines in names and size completed prescriptions (5
+    results each, 20% out of stock) spread evenly over the last days days.
+    Call inside a transaction that the benchmark rolls back.
+    """
+    from datetime import timedelta
+    from pharmacy_app.models import Prescription, User
+
+    rng = random.Random(seed)
+    statuses = ['Available'] * 8 + ['Out of Stock'] * 2
+    Medicine.objects.bulk_create([Medicine(name=name) for name in names], batch_size=5000)
+    user = User.objects.create_user(username)
+    for start in range(0, size, 2000):
+        Prescription.objects.bulk_create([
+            Prescription(
+                file=f'prescriptions/bench/{i}.jpg',
+                status=Prescription.STATUS_COMPLETED,
+                results_json=[
+                    {'medicine_name': name, 'status': rng.choice(statuses),
+                     'alternative': {'name': rng.choice(names), 'stock': 5, 'hops': 1}}
+                    for name in rng.sample(names, 5)
+                ],
+                uploaded_by=user
+            )
+            for i in range(start, min(start + 2000, size))
+        ])
+    # Spread created_at over the days with one UPDATE per day
+    ids = list(Prescription.objects.filter(uploaded_by=user).values_list('id', flat=True))
+    per_day = len(ids) // days + 1
+    for day in range(days):
+        Prescription.objects.filter(id__in=ids[day * per_day:(day + 1) * per_day]).update(
+            created_at=now - timedelta(days=day)
+        )
+    return user
+
+
+def line_counts():
+    """Aggregates shared by the line queries below."""
+    out_of_stock = Q(status=PrescriptionLine.STATUS_OUT_OF_STOCK)
+    return {
+        'demand': Count('id', filter=Q(status__in=DEMAND_STATUSES)),
+        'out_of_stock': Count('id', filter=out_of_stock),
+        'substituted': Count('id', filter=out_of_stock & Q(alternative__isnull=False)),
+        'not_found': Count('id', filter=Q(status=PrescriptionLine.STATUS_NOT_FOUND)),
+    }
+
+
+def lines_between(start, end, medicine_id=None):
+    """Lines created from start (inclusive) to end (exclusive), optionally for one medicine."""
+    lines = PrescriptionLine.objects.filter(created_at__gte=start, created_at__lt=end)
+    if medicine_id is not None:
+        lines = lines.filter(medicine_id=medicine_id)
+    return lines.order_by()
+
+
+def demand_by_medicine(start, end, medicine_id=None, limit=100):
+    """
+    Demand, stock-outs and substitutions per medicine, most demanded first.
+
+    Aggregated straight from prescription lines, as a baseline for the
+    rollups the analytics API reads (rollup_utils.medicine_totals).
+
+    Returns:
+        list: Dicts with medicine_id, name, demand, out_of_stock,
+              substituted, stock_out_rate and substitution_rate
+    """
+    counts = line_counts()
+    del counts['not_found']
+    rows = (
+        lines_between(start, end, medicine_id)
+        .filter(medicine__isnull=False)
+        .values('medicine_id', 'medicine__name')
+        .annotate(**counts)
+        .order_by('-demand', 'medicine_id')[:limit]
+    )
+    return [
+        with_rates({
+            'medicine_id': row['medicine_id'],
+            'name': row['medicine__name'],
+            'demand': row['demand'],
+            'out_of_stock': row['out_of_stock'],
+            'substituted': row['substituted'],
+        })
+        for row in rows
+    ]
+
+
+def demand_by_day(start, end, medicine_id=None):
+    """
+    Demand, stock-outs, substitutions and unknown names per day, oldest first.
+
+    The line-level baseline for rollup_utils.daily_totals.
+
+    Returns:
+        list: Dicts with date (ISO), demand, out_of_stock, substituted,
+              not_found, stock_out_rate and substitution_rate
+    """
+    rows = (
+        lines_between(start, end, medicine_id)
+        .annotate(date=TruncDate('created_at'))
+        .values('date')
+        .annotate(**line_counts())
+        .order_by('date')
+    )
+    return [with_rates(dict(row, date=row['date'].isoformat())) for row in rows]
+
+
+def bench_analytics(size=100000, medicines=5000, queries=10, seed=42):
+    """
+    Compare parsing results_json in Python with aggregate queries over
+    prescription lines, for size completed prescriptions (5 lines each)
+    spread over 60 days. Also times the backfill. Everything is rolled back.
+    """
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from pharmacy_app.models import Prescription, PrescriptionLine
+
+    names = synthetic_medicine_names(medicines, seed)
+
+    with transaction.atomic():
+        now = timezone.now()
+        create_completed_prescriptions(size, names, 'analytics-benchmark', now, seed)
+
+        backfill_start = time.perf_counter()
+        call_command('backfill_prescription_lines', stdout=io.StringIO())
+        backfill_seconds = time.perf_counter() - backfill_start
+        line_count = PrescriptionLine.objects.count()
+
+        since, until = now - timedelta(days=30), now + timedelta(seconds=1)
+        target = names[0]
+
+        def legacy_stock_outs():
+            # "How often was this medicine out of stock last month?" before this change
+            count = 0
+            rows = Prescription.objects.filter(
+                status=Prescription.STATUS_COMPLETED, created_at__gte=since
+            ).values_list('results_json', flat=True)
+            for results in rows.iterator(chunk_size=2000):
+                for result in results:
+                    if result['medicine_name'] == target and result['status'] == 'Out of Stock':
+                        count += 1
+            return count
+
+        medicine_id = Medicine.objects.get(name=target).id
+        legacy = [timed(legacy_stock_outs)[1] for _ in range(3)]
+        one = [timed(demand_by_medicine, since, until, medicine_id)[1] for _ in range(queries)]
+        top = [timed(demand_by_medicine, since, until)[1] for _ in range(queries)]
+        daily = [timed(demand_by_day, since, until)[1] for _ in range(queries)]
+        assert demand_by_medicine(since, until, medicine_id)[0]['out_of_stock'] == legacy_stock_outs()
+        plan = PrescriptionLine.objects.filter(
+            medicine_id=medicine_id, created_at__gte=since
+        ).order_by().values('status').explain()
+        transaction.set_rollback(True)
+
+    return {
+        'prescriptions': size,
+        'lines': line_count,
+        'backfill_seconds': round(backfill_seconds, 2),
+        'backfill_lines_per_second': round(line_count / backfill_seconds, 1),
+        'legacy_json_scan_one_medicine': summarize(legacy),
+        'lines_one_medicine': summarize(one),
+        'lines_top_100_medicines': summarize(top),
+        'lines_by_day': summarize(daily),
+        'one_medicine_plan': plan,
+    }
+
+
+def bench_rollups(size=100000, medicines=5000, queries=10, seed=42):
+    """
+    Compare reading the daily rollups with aggregating prescription lines,
+    for size completed prescriptions spread over 60 days. Also times a full
+    rebuild_rollups and record_prescription for new prescriptions (the cost
+    the pipeline pays per prescription). Everything is rolled back.
+    """
+    from datetime import datetime, timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from pharmacy_app.models import DailyMedicineStats, Prescription
+    from pharmacy_app.rollup_utils import daily_totals, medicine_totals, rebuild_rollups, record_prescription
+
+    names = synthetic_medicine_names(medicines, seed)
+
+    with transaction.atomic():
+        now = timezone.now()
+        user = create_completed_prescriptions(size, names, 'rollups-benchmark', now, seed)
+        call_command('backfill_prescription_lines', stdout=io.StringIO())
+
+        rebuild, rebuild_ms = timed(rebuild_rollups)
+        rebuild_seconds = rebuild_ms / 1000
+        medicine_days = DailyMedicineStats.objects.count()
+
+        # Lines are counted by UTC datetime and rollups by local day, so
+        # compare whole local days
+        today = timezone.localdate()
+        start_day, end_day = today - timedelta(days=29), today
+        since = timezone.make_aware(datetime.combine(start_day, datetime.min.time()))
+        until = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), datetime.min.time()))
+        lines_daily = [timed(demand_by_day, since, until)[1] for _ in range(queries)]
+        rollup_daily = [timed(daily_totals, start_day, end_day)[1] for _ in range(queries)]
+        lines_top = [timed(demand_by_medicine, since, until)[1] for _ in range(queries)]
+        rollup_top = [timed(medicine_totals, start_day, end_day)[1] for _ in range(queries)]
+        assert (sum(row['demand'] for row in demand_by_day(since, until))
+                == sum(row['demand'] for row in daily_totals(start_day, end_day)))
+        assert demand_by_medicine(since, until)[:10] == medicine_totals(start_day, end_day)[:10]
+
+        # Incremental maintenance as the pipeline does it, one transaction each
+        fresh = [
+            Prescription.objects.create(
+                file=f'prescriptions/bench/new-{i}.jpg',
+                status=Prescription.STATUS_COMPLETED,
+                results_json=[{'medicine_name': name, 'status': 'Available', 'alternative': None}
+                              for name in names[i:i + 5]],
+                uploaded_by=user
+            )
+            for i in range(200)
+        ]
+        record = []
+        for prescription in fresh:
+            with transaction.atomic():
+                record.append(timed(record_prescription, prescription)[1])
+        transaction.set_rollback(True)
+
+    return {
+        'prescriptions': size,
+        'medicine_day_rows': medicine_days,
+        'rebuild_seconds': round(rebuild_seconds, 2),
+        'rebuild_prescriptions_per_second': round(rebuild['prescriptions'] / rebuild_seconds, 1),
+        'record_prescription': summarize(record),
+        'lines_by_day_30d': summarize(lines_daily),
+        'rollups_by_day_30d': summarize(rollup_daily),
+        'lines_top_100_medicines_30d': summarize(lines_top),
+        'rollups_top_100_medicines_30d': summarize(rollup_top),
+    }
+
+
+def bench_metrics(size=100000, seed=42):
+    """
+    Cost of the pipeline instrumentation: a timed span (histogram
+    observation included), a tag, and rendering /metrics. Uses a private
+    PipelineMetrics so the process' real metrics are left alone.
+    """
+    from pharmacy_app.metrics_utils import PipelineMetrics, Trace
+
+    rng = random.Random(seed)
+    scratch, metrics = PipelineMetrics(), PipelineMetrics()
+    stages = ['file_save', 'queue', 'ocr', 'extract', 'resolve', 'processing', 'save']
+
+    def spans():
+        for _ in range(size):
+            trace = Trace(metrics=scratch)
+            with trace.span(rng.choice(stages)):
+                pass
+
+    def tags():
+        trace = Trace(metrics=scratch)
+        for _ in range(size):
+            trace.tag('extraction', rng.choice(['llm', 'fallback']))
+
+    # Render histograms filled with realistic durations (median 135 ms)
+    for _ in range(size):
+        metrics.observe(rng.choice(stages), rng.lognormvariate(-2, 1.5))
+
+    _, span_ms = timed(spans)
+    _, tag_ms = timed(tags)
+    renders = [timed(metrics.render)[1] for _ in range(50)]
+    return {
+        'spans': size,
+        'span_us': round(span_ms * 1000 / size, 3),
+        'tag_us': round(tag_ms * 1000 / size, 3),
+        'render': summarize(renders),
+        'render_bytes': len(metrics.render()),
+        'stage_summary': metrics.stage_summary(),
+    }
+
+
+@contextmanager
+def scratch_database():
+    """
+    Run the enclosed block against a new, migrated database that is
+    dropped afterwards, like the test runner's.
+
+    Every suite runs in one (see run_suite), so the rows they create,
+    commit and roll back never touch the configured database. On SQLite
+    the database is a temporary file (threads cannot share an in-memory
+    one); on MySQL it is the usual test_<NAME> database.
+    """
+    from django.db import connection, connections
+
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    tmp = None
+    if connection.vendor == 'sqlite':
+        tmp = tempfile.mkdtemp(prefix='benchmark-db-')
+        test_settings['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def seed_catalogue(size, alternatives=2, seed=42, batch_size=5000):
+    """
+    Create size medicines (one in eight out of stock) and about
+    alternatives Alternative rows per medicine, picked among medicines
+    of the same generic stem where there are any.
+
+    Returns:
+        list: The medicine names
+    """
+    from pharmacy_app.models import Alternative
+    from pharmacy_app.reorder_utils import refresh_reorder_flags
+
+    rng = random.Random(seed)
+    names = synthetic_medicine_names(size, seed)
+    manufacturers = [f'{stem.capitalize()} Labs' for stem in ('synth', 'bench', 'acme', 'nova', 'orbit')]
+    for start in range(0, size, batch_size):
+        Medicine.objects.bulk_create([
+            Medicine(
+                name=name,
+                composition=f'{name.split()[0]}ate {name.split()[1]}',
+                stock_quantity=0 if rng.random() < 0.125 else rng.randint(1, 500),
+                manufacturer=rng.choice(manufacturers),
+            )
+            for name in names[start:start + batch_size]
+        ])
+
+    # Names are sorted, so each stem's strengths are neighbours
+    ids = list(Medicine.objects.order_by('name').values_list('id', flat=True))
+    edges = []
+    for position, medicine_id in enumerate(ids):
+        for _ in range(alternatives):
+            other = ids[min(len(ids) - 1, max(0, position + rng.randint(-3, 3)))]
+            if rng.random() < 0.25:
+                other = rng.choice(ids)
+            if other != medicine_id:
+                edges.append(Alternative(medicine_id=medicine_id, alternative_medicine_id=other))
+        if len(edges) >= batch_size:
+            Alternative.objects.bulk_create(edges, ignore_conflicts=True)
+            edges = []
+    Alternative.objects.bulk_create(edges, ignore_conflicts=True)
+    refresh_reorder_flags()
+    return names
+
+
+def synthetic_prescription_files(names, count, pdf_share=0.2, repeat_share=0.1, seed=42):
+    """
+    Build count prescription uploads: PNG scans and text PDFs listing a
+    header, three to six catalogue names (some with OCR noise) and a name
+    missing from the catalogue. A share of uploads repeat an earlier file,
+    as re-uploads do, so the OCR and LLM caches see hits.
+
+    Returns:
+        list: (filename, content bytes, text, medicine lines) per upload
+    """
+    rng = random.Random(seed)
+    files = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(count):
+            if files and rng.random() < repeat_share:
+                filename, data, text, medicines = rng.choice(files)
+                files.append((f'repeat_{i:05d}_{filename}', data, text, medicines))
+                continue
+            medicines = [
+                add_ocr_noise(name, rng) if rng.random() < 0.2 else name
+                for name in rng.sample(names, rng.randint(3, 6))
+            ] + [f'Unlisted{i}ex 10mg']
+            lines = [f'Dr. Benchmark Clinic #{i}', 'Rx'] + medicines
+            if rng.random() < pdf_share:
+                path = os.path.join(tmp, f'rx_{i:05d}.pdf')
+                write_synthetic_pdf(path, 1, names=lines)
+                with open(path, 'rb') as pdf:
+                    data = pdf.read()
+                filename = os.path.basename(path)
+            else:
+                data, filename = synthetic_scan_png(lines), f'rx_{i:05d}.png'
+            files.append((filename, data, '\n'.join(lines), medicines))
+    return files
+
+
+class StubOCR:
+    """
+    Stands in for Tesseract: returns the known text of a synthetic scan
+    (looked up by content digest) after sleeping delay_ms.
+    """
+
+    def __init__(self, files, delay_ms):
+        self.texts = {hashlib.sha256(data).hexdigest(): text for _, data, text, _ in files}
+        self.delay = delay_ms / 1000
+
+    def __call__(self, file_path):
+        with open(file_path, 'rb') as image:
+            digest = hashlib.sha256(image.read()).hexdigest()
+        time.sleep(self.delay)
+        return self.texts.get(digest, '')
+
+
+class StubLLMClient:
+    """
+    OpenAI-compatible client whose chat completions return, after
+    sleeping delay_ms, the known medicine lines found in the prompt.
+
+    Requests still go through the client manager's concurrency cap,
+    breaker, response parsing and the 'llm' cache.
+    """
+
+    def __init__(self, files, delay_ms):
+        from types import SimpleNamespace
+
+        self.medicines = {line for _, _, _, medicines in files for line in medicines}
+        self.delay = delay_ms / 1000
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        from types import SimpleNamespace
+
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        found = [line.strip() for line in messages[-1]['content'].splitlines()
+                 if line.strip() in self.medicines]
+        message = SimpleNamespace(content=json.dumps(found))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def drive(make_client, request, items, concurrency):
+    """
+    Send one request per item from concurrency threads, each with its own
+    client and database connection.
+
+    Args:
+        make_client: Callable (thread number) -> API client
+        request: Callable (client, item) -> response
+        items: One item per request, split round-robin across threads
+        concurrency: Number of threads
+
+    Returns:
+        dict: Request and error counts, throughput and latency summary
+    """
+    from django.db import connections
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(number):
+        client = make_client(number)
+        try:
+            for item in items[number::concurrency]:
+                response, elapsed = timed(request, client, item)
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_ms = (time.perf_counter() - start) * 1000
+    return {
+        'requests': len(items),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'requests_per_s': round(len(items) / (wall_ms / 1000), 2),
+        'latency': summarize(latencies) if latencies else None,
+    }
+
+
+def peak_rss_mib():
+    """Peak resident set size of this process in MiB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if os.uname().sysname == 'Darwin' else 1024), 1)
+
+
+def bench_api(size=10000, prescriptions=200, history=2000, requests=400, users=4,
+              concurrency=8, ocr_ms=150, llm_ms=400, timeout=600, seed=42):
+    """
+    End-to-end load test of the prescription and inventory APIs.
+
+    Seeds a catalogue of size medicines with an alternatives graph and
+    history completed prescriptions per user, then:
+
+    - uploads prescriptions synthetic scans and PDFs through
+      /api/prescriptions/upload/ from concurrency clients and waits for
+      the worker pool to process them, with Tesseract and the OpenAI
+      client replaced by stubs that sleep ocr_ms and llm_ms;
+    - sends requests searches (typeahead, noisy and misspelt names),
+      medicines pages and history pages from concurrency clients.
+
+    Worker threads need committed rows, which the scratch database
+    (see run_suite) allows; uploads go to a temporary MEDIA_ROOT.
+    """
+    from datetime import timedelta
+    from unittest import mock
+    from urllib.parse import urlencode
+    from django.test import override_settings
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from pharmacy_app import ai_utils, ocr_utils
+    from pharmacy_app.cache_utils import get_cache
+    from pharmacy_app.metrics_utils import pipeline_metrics
+    from pharmacy_app.models import Alternative, Prescription, User
+    from pharmacy_app.signals import reset_medicine_indexes
+
+    rng = random.Random(seed)
+    results = {
+        'parameters': {
+            'size': size, 'prescriptions': prescriptions, 'history': history,
+            'requests': requests, 'users': users, 'concurrency': concurrency,
+            'ocr_ms': ocr_ms, 'llm_ms': llm_ms, 'seed': seed,
+        },
+    }
+
+    def clients(accounts):
+        """make_client for drive(): thread n authenticates as accounts[n % len(accounts)]."""
+        def make_client(number):
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(accounts[number % len(accounts)])
+            return client
+        return make_client
+
+    def upload(client, item):
+        filename, data, _, _ = item
+        file = io.BytesIO(data)
+        file.name = filename
+        return client.post('/api/prescriptions/upload/', {'file': file}, format='multipart')
+
+    def get(client, url):
+        return client.get(url)
+
+    def page_urls(client, url, pages):
+        """Walk up to pages pages from url and return each page's URL."""
+        urls = []
+        while url and len(urls) < pages:
+            urls.append(url)
+            url = client.get(url).json()['next']
+        return urls
+
+    media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+    try:
+        with override_settings(
+            MEDIA_ROOT=media_root,
+            ALLOWED_HOSTS=['localhost'],
+            PRESCRIPTION_PIPELINE_EAGER=False,
+            OPENAI_API_KEY='benchmark-stub',
+            GOOGLE_VISION_API_KEY='',
+        ):
+            names, seed_ms = timed(seed_catalogue, size, seed=seed)
+            accounts = [User.objects.create_user(f'api-benchmark-{i}') for i in range(users)]
+            admin = User.objects.create_user('api-benchmark-admin', role='admin')
+            now = timezone.now()
+            for user in accounts:
+                Prescription.objects.bulk_create([
+                    Prescription(
+                        file=f'prescriptions/bench/{user.id}_{i}.png',
+                        status=Prescription.STATUS_COMPLETED,
+                        results_json=[{'medicine_name': name, 'status': 'Available', 'alternative': None}
+                                      for name in rng.sample(names, 3)],
+                        results_count=3,
+                        uploaded_by=user,
+                    )
+                    for i in range(history)
+                ], batch_size=2000)
+                # bulk_create stamps one created_at; spread them over 30 days
+                ids = list(Prescription.objects.filter(uploaded_by=user).values_list('id', flat=True))
+                per_day = len(ids) // 30 + 1
+                for day in range(30):
+                    Prescription.objects.filter(id__in=ids[day * per_day:(day + 1) * per_day]).update(
+                        created_at=now - timedelta(days=day + 1)
+                    )
+            reset_medicine_indexes()
+            get_cache('ocr').clear()
+            get_cache('llm').clear()
+            pipeline_metrics.reset()
+            results['seed_ms'] = round(seed_ms, 2)
+            results['alternatives'] = Alternative.objects.count()
+
+            files, files_ms = timed(synthetic_prescription_files, names, prescriptions, seed=seed)
+            results['files'] = {
+                'count': len(files),
+                'pdf': sum(name.endswith('.pdf') for name, _, _, _ in files),
+                'repeats': sum(name.startswith('repeat_') for name, _, _, _ in files),
+                'bytes': sum(len(data) for _, data, _, _ in files),
+                'build_ms': round(files_ms, 2),
+            }
+
+            llm = StubLLMClient(files, llm_ms)
+            pending = Prescription.objects.filter(
+                status__in=[Prescription.STATUS_PENDING, Prescription.STATUS_PROCESSING]
+            )
+            with mock.patch.object(ocr_utils, 'extract_text_with_tesseract', StubOCR(files, ocr_ms)), \
+                    mock.patch.object(ai_utils.OpenAIClientManager, 'get_client', lambda self: llm):
+                start = time.perf_counter()
+                results['upload'] = drive(clients(accounts), upload, files, concurrency)
+                deadline = time.monotonic() + timeout
+                while pending.exists() and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                drain_ms = (time.perf_counter() - start) * 1000
+
+            processed = list(
+                Prescription.objects.filter(created_at__gte=now)
+                .values('status', 'created_at', 'updated_at', 'timings')
+            )
+            statuses, stages, tags = {}, {}, {}
+            for row in processed:
+                statuses[row['status']] = statuses.get(row['status'], 0) + 1
+                timings = row['timings'] or {}
+                for stage, ms in timings.get('stages', {}).items():
+                    stages.setdefault(stage, []).append(ms)
+                for name, value in timings.get('tags', {}).items():
+                    key = f'{name}={value}'
+                    tags[key] = tags.get(key, 0) + 1
+            results['pipeline'] = {
+                'statuses': statuses,
+                'unfinished': pending.count(),
+                'prescriptions_per_s': round(len(processed) / (drain_ms / 1000), 2),
+                'end_to_end': summarize([
+                    (row['updated_at'] - row['created_at']).total_seconds() * 1000
+                    for row in processed
+                ]),
+                'stages': {stage: summarize(values) for stage, values in sorted(stages.items())},
+                'llm_calls': llm.calls,
+                'tags': tags,
+            }
+
+            # Typeahead prefixes, OCR-noisy, misspelt and exact names in turn
+            queries = []
+            for i, name in enumerate(rng.sample(names, min(len(names), requests))):
+                queries.append((
+                    name.split()[0][:4], add_ocr_noise(name, rng), add_typo(name, rng), name
+                )[i % 4])
+            search_urls = [f"/api/medicines/search/?{urlencode({'q': query})}" for query in queries]
+            admin_client = clients([admin])(0)
+            user_client = clients(accounts)(0)
+            medicine_urls = page_urls(admin_client, '/api/medicines/?page_size=100', requests)
+            history_urls = page_urls(user_client, '/api/prescriptions/history/?page_size=50', requests)
+
+            for label, make_client, urls in (
+                ('search', clients(accounts), search_urls),
+                ('medicines', clients([admin]), medicine_urls),
+                ('history', clients(accounts), history_urls),
+            ):
+                get(make_client(0), urls[0])  # warm up the in-memory indexes
+                items = [rng.choice(urls) for _ in range(requests)]
+                results[label] = drive(make_client, get, items, concurrency)
+                results[label]['pages' if label != 'search' else 'distinct_queries'] = len(urls)
+                results[label]['peak_kib'] = peak_memory_kib(get, make_client(0), urls[-1])
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    results['peak_rss_mib'] = peak_rss_mib()
+    return results
+
+
+def numeric_leaves(results, prefix=''):
+    """Flatten nested results into {'a.b.c': number} for comparison."""
+    leaves = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            leaves.update(numeric_leaves(value, f'{path}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[path] = value
+    return leaves
+
+
+def compare_results(baseline, current):
+    """
+    Compare two results dicts of the same suite.
+
+    Returns:
+        list: (path, baseline value, current value, % change or None) for
+              every number present in both
+    """
+    before, after = numeric_leaves(baseline), numeric_leaves(current)
+    rows = []
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        change = round((new - old) / old * 100, 1) if old else None
+        rows.append((path, old, new, change))
+    return rows
+
+
+SUITES = {
+    'index': bench_index,
+    'pdf': bench_pdf,
+    'preprocess': bench_preprocess,
+    'ocr': bench_ocr,
+    'batch': bench_batch,
+    'medicines': bench_medicines,
+    'history': bench_history,
+    'search': bench_search,
+    'autocomplete': bench_autocomplete,
+    'alternatives': bench_alternatives,
+    'ingredients': bench_ingredients,
+    'import': bench_import,
+    'dashboard': bench_dashboard,
+    'reorder': bench_reorder,
+    'analytics': bench_analytics,
+    'rollups': bench_rollups,
+    'metrics': bench_metrics,
+    'api': bench_api,
+}
+
+
+def run_suite(name, **kwargs):
+    """
+    Run a suite by name in a scratch database (see scratch_database).
+
+    Returns:
+        dict: The suite's results
+    """
+    from pharmacy_app.signals import reset_medicine_indexes
+
+    with scratch_database():
+        # Process-wide indexes and counters must not mix the two databases
+        reset_medicine_indexes()
+        try:
+            return SUITES[name](**kwargs)
+        finally:
+            reset_medicine_indexes()
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'pharmacy_app.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -195,12 +196,194 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 # Allowed file types for prescription uploads
 ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.pdf']
 
+# Prescription processing pipeline
+# Worker threads per process; set PRESCRIPTION_PIPELINE_EAGER=True to process inline
+PRESCRIPTION_WORKERS = int(os.environ.get('PRESCRIPTION_WORKERS', '4'))
+PRESCRIPTION_PIPELINE_EAGER = os.environ.get('PRESCRIPTION_PIPELINE_EAGER', 'False') == 'True'
+
+# Medicine search (see pharmacy_app/search_utils.py)
+# 'auto' uses MySQL FULLTEXT / SQLite FTS5 when available, else an in-memory index
+MEDICINE_SEARCH_BACKEND = os.environ.get('MEDICINE_SEARCH_BACKEND', 'auto')
+MEDICINE_SEARCH_MAX_RESULTS = int(os.environ.get('MEDICINE_SEARCH_MAX_RESULTS', '500'))
+MEDICINE_AUTOCOMPLETE_LIMIT = int(os.environ.get('MEDICINE_AUTOCOMPLETE_LIMIT', '10'))
+MEDICINE_AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('MEDICINE_AUTOCOMPLETE_MAX_LIMIT', '50'))
+
+# Alternative suggestions (see pharmacy_app/alternatives_utils.py)
+# Alternatives of alternatives are followed up to ALTERNATIVES_MAX_HOPS edges away
+ALTERNATIVES_MAX_SUGGESTIONS = int(os.environ.get('ALTERNATIVES_MAX_SUGGESTIONS', '3'))
+ALTERNATIVES_MAX_HOPS = int(os.environ.get('ALTERNATIVES_MAX_HOPS', '2'))
+ALTERNATIVES_MAX_VISITED = int(os.environ.get('ALTERNATIVES_MAX_VISITED', '500'))
+
+# Batch uploads (many files or ZIP archives per request)
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', '1000'))
+BATCH_MAX_FILE_SIZE = int(os.environ.get('BATCH_MAX_FILE_SIZE', str(20 * 1024 * 1024)))
+# Bytes read across all files of a batch, after decompressing ZIP members
+BATCH_MAX_TOTAL_SIZE = int(os.environ.get('BATCH_MAX_TOTAL_SIZE', str(500 * 1024 * 1024)))
+# ZIP members that would expand more than this many times are rejected
+BATCH_MAX_COMPRESSION_RATIO = int(os.environ.get('BATCH_MAX_COMPRESSION_RATIO', '100'))
+BATCH_INSERT_SIZE = int(os.environ.get('BATCH_INSERT_SIZE', '500'))
+
+# Catalogue import (see pharmacy_app/catalogue_utils.py)
+CATALOGUE_IMPORT_CHUNK_SIZE = int(os.environ.get('CATALOGUE_IMPORT_CHUNK_SIZE', '1000'))
+
+# In-memory medicine indexes (see pharmacy_app/sync_utils.py)
+# Writes from other processes are picked up after INDEX_SYNC_SECONDS, deletes after INDEX_RECONCILE_SECONDS
+INDEX_SYNC_SECONDS = float(os.environ.get('INDEX_SYNC_SECONDS', '5'))
+INDEX_SYNC_OVERLAP_SECONDS = float(os.environ.get('INDEX_SYNC_OVERLAP_SECONDS', '60'))
+INDEX_RECONCILE_SECONDS = float(os.environ.get('INDEX_RECONCILE_SECONDS', '300'))
+
+# Admin dashboard counters (see pharmacy_app/stats_utils.py)
+# Counters are adjusted on every save and recounted after DASHBOARD_STATS_RECONCILE_SECONDS
+DASHBOARD_STATS_RECONCILE_SECONDS = int(os.environ.get('DASHBOARD_STATS_RECONCILE_SECONDS', '300'))
+# Days of daily rollups shown on the admin dashboard (see pharmacy_app/rollup_utils.py)
+DASHBOARD_TREND_DAYS = int(os.environ.get('DASHBOARD_TREND_DAYS', '14'))
+
+# Reorder queue (see pharmacy_app/reorder_utils.py)
+# New medicines get DEFAULT_REORDER_POINT; days of cover use the last REORDER_DEMAND_DAYS of prescriptions
+DEFAULT_REORDER_POINT = int(os.environ.get('DEFAULT_REORDER_POINT', '10'))
+REORDER_DEMAND_DAYS = int(os.environ.get('REORDER_DEMAND_DAYS', '30'))
+REORDER_DEMAND_MAX_DAYS = int(os.environ.get('REORDER_DEMAND_MAX_DAYS', '365'))
+REORDER_QUEUE_LIMIT = int(os.environ.get('REORDER_QUEUE_LIMIT', '100'))
+REORDER_QUEUE_MAX_LIMIT = int(os.environ.get('REORDER_QUEUE_MAX_LIMIT', '1000'))
+
+# Demand analytics (see pharmacy_app/analytics_utils.py)
+ANALYTICS_DEFAULT_DAYS = int(os.environ.get('ANALYTICS_DEFAULT_DAYS', '30'))
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', '366'))
+ANALYTICS_MAX_LIMIT = int(os.environ.get('ANALYTICS_MAX_LIMIT', '1000'))
+
+# Application caches (see pharmacy_app/cache_utils.py)
+# 'ocr' maps a file's SHA-256 digest to its extracted text
+# 'llm' maps normalized prescription text + model + prompt version to medicine names
+# 'demand' maps a day window to prescription lines per medicine id (for the reorder queue)
+PHARMACY_CACHES = {
+    'ocr': {
+        'BACKEND': 'pharmacy_app.cache_utils.LRUCache',
+        'OPTIONS': {
+            'max_entries': int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '1024')),
+        },
+    },
+    'llm': {
+        'BACKEND': 'pharmacy_app.cache_utils.DatabaseCache',
+        'OPTIONS': {
+            'max_entries': int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '10000')),
+            'timeout': int(os.environ.get('LLM_CACHE_TIMEOUT', str(7 * 24 * 3600))),
+        },
+    },
+    'demand': {
+        'BACKEND': 'pharmacy_app.cache_utils.LRUCache',
+        'OPTIONS': {
+            'max_entries': 16,
+            'timeout': int(os.environ.get('DEMAND_CACHE_TIMEOUT', '600')),
+        },
+    },
+}
+
 # OpenAI API Configuration
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', '')
+
+# OpenAI client resilience (timeouts in seconds)
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', '30'))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '2'))
+OPENAI_BACKOFF_BASE = float(os.environ.get('OPENAI_BACKOFF_BASE', '0.5'))
+OPENAI_BACKOFF_MAX = float(os.environ.get('OPENAI_BACKOFF_MAX', '8'))
+OPENAI_MAX_CONCURRENCY = int(os.environ.get('OPENAI_MAX_CONCURRENCY', '4'))
+OPENAI_QUEUE_TIMEOUT = float(os.environ.get('OPENAI_QUEUE_TIMEOUT', '10'))
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('OPENAI_CIRCUIT_FAILURE_THRESHOLD', '5'))
+OPENAI_CIRCUIT_RESET_TIMEOUT = float(os.environ.get('OPENAI_CIRCUIT_RESET_TIMEOUT', '30'))
 
 # Google Vision API Configuration (optional, for OCR)
 GOOGLE_VISION_API_KEY = os.environ.get('GOOGLE_VISION_API_KEY', '')
 
 # Tesseract OCR Configuration
 TESSERACT_CMD = os.environ.get('TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+
+# PDF text extraction
+# Documents with at least PDF_PARALLEL_MIN_PAGES pages are split across PDF_WORKERS processes;
+# pages with fewer than PDF_SCANNED_PAGE_MIN_CHARS characters of text are OCR'd as scans
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', '16'))
+PDF_SCANNED_PAGE_MIN_CHARS = int(os.environ.get('PDF_SCANNED_PAGE_MIN_CHARS', '10'))
+
+# Image preprocessing before OCR (see pharmacy_app/image_utils.py)
+# Set OCR_PREPROCESSING_STAGES to an empty string to pass images to Tesseract unchanged
+OCR_PREPROCESSING_STAGES = [
+    stage.strip() for stage in os.environ.get(
+        'OCR_PREPROCESSING_STAGES',
+        'downscale,exif_rotate,grayscale,adaptive_threshold,deskew,crop_to_text'
+    ).split(',') if stage.strip()
+]
+OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', '300'))
+OCR_PAGE_LONG_SIDE_INCHES = float(os.environ.get('OCR_PAGE_LONG_SIDE_INCHES', '8.27'))
+
+# OCR engine and worker pool
+# OCR_ENGINE: 'tesserocr' keeps language data loaded per worker, 'pytesseract' starts
+# the tesseract binary per image, 'auto' prefers tesserocr when it is installed.
+# Up to OCR_MAX_PENDING images are accepted at once; OCR_WORKERS=0 runs OCR inline.
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto')
+OCR_TESSDATA_PATH = os.environ.get('OCR_TESSDATA_PATH', '')
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+OCR_MAX_PENDING = int(os.environ.get('OCR_MAX_PENDING', str(max(1, OCR_WORKERS) * 4)))
+OCR_QUEUE_TIMEOUT = float(os.environ.get('OCR_QUEUE_TIMEOUT', '30'))
+OCR_TIMEOUT = float(os.environ.get('OCR_TIMEOUT', '120'))
+
+# Pipeline latency metrics (see pharmacy_app/metrics_utils.py)
+# /metrics accepts "Authorization: Bearer $METRICS_TOKEN" (for Prometheus);
+# without a token configured only logged-in admins can read it.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_LATENCY_BUCKETS = tuple(
+    float(bound) for bound in os.environ.get(
+        'METRICS_LATENCY_BUCKETS',
+        '0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120'
+    ).split(',') if bound.strip()
+)
+
+# Per-request SQL profiling (see pharmacy_app/middleware.py)
+# Views over their budget are logged; with QUERY_BUDGET_STRICT the request
+# raises instead (for CI). Server-Timing headers are sent in DEBUG by default.
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'True') == 'True'
+QUERY_PROFILING_HEADERS = os.environ.get('QUERY_PROFILING_HEADERS', str(DEBUG)) == 'True'
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'False') == 'True'
+QUERY_BUDGET_DEFAULT_QUERIES = int(os.environ.get('QUERY_BUDGET_DEFAULT_QUERIES', '20'))
+QUERY_BUDGET_DEFAULT_SQL_MS = float(os.environ.get('QUERY_BUDGET_DEFAULT_SQL_MS', '250'))
+# Queries allowed per request, by URL name: measured by check_query_budgets,
+# plus 2 for authentication. Add 'sql_ms' to override the SQL time budget.
+# 'cold_queries' applies instead to requests that also build or sync the
+# in-memory indexes or recount the dashboard (at most once per process or
+# per INDEX_SYNC_SECONDS); it defaults to 'queries'.
+QUERY_BUDGETS = {
+    'login': {'queries': 12},
+    'register_page': {'queries': 4},
+    'logout': {'queries': 6},
+    'dashboard': {'queries': 5},
+    'upload_prescription': {'queries': 5},
+    'results': {'queries': 5},
+    'inventory': {'queries': 9, 'cold_queries': 13},
+    'admin_dashboard': {'queries': 6, 'cold_queries': 8},
+    'manage_alternatives': {'queries': 8},
+    'delete_alternative': {'queries': 6},
+    'token_obtain_pair': {'queries': 4},
+    'token_refresh': {'queries': 3},
+    'register': {'queries': 4},
+    'api_upload_prescription': {'queries': 3},
+    'api_prescription_history': {'queries': 3},
+    'api_prescription_status': {'queries': 3},
+    'api_upload_prescription_batch': {'queries': 8},
+    'api_prescription_batch_status': {'queries': 4},
+    # One conditional UPDATE per medicine on the prescription
+    'api_dispense_prescription': {'queries': 20},
+    'api_medicines': {'queries': 3},
+    'api_medicine_detail': {'queries': 10},
+    'api_dispense_medicine': {'queries': 7},
+    # Grows by one per CATALOGUE_IMPORT_CHUNK_SIZE rows
+    'api_import_medicines': {'queries': 10, 'sql_ms': 2000},
+    # Rows are streamed after the view returns and are not counted
+    'api_export_medicines': {'queries': 2},
+    'api_reorder_queue': {'queries': 4},
+    'api_search_medicine': {'queries': 5, 'cold_queries': 9},
+    'api_autocomplete_medicine': {'queries': 2, 'cold_queries': 6},
+    'api_demand_analytics': {'queries': 3},
+    'metrics': {'queries': 4},
+}
@@ -3,7 +3,7 @@ Admin configuration for Pharmacy AI application.
 """
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Medicine, Alternative, Prescription
+from .models import User, Medicine, Alternative, Prescription, PrescriptionBatch
 
 
 @admin.register(User)
@@ -22,8 +22,8 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(Medicine)
 class MedicineAdmin(admin.ModelAdmin):
     """Admin interface for Medicine model."""
-    list_display = ['name', 'manufacturer', 'stock_quantity', 'is_available', 'created_at']
-    list_filter = ['manufacturer', 'created_at']
+    list_display = ['name', 'manufacturer', 'stock_quantity', 'reorder_point', 'needs_reorder', 'is_available', 'created_at']
+    list_filter = ['needs_reorder', 'manufacturer', 'created_at']
     search_fields = ['name', 'composition', 'manufacturer']
     readonly_fields = ['created_at', 'updated_at']
     
@@ -39,17 +39,32 @@ class AlternativeAdmin(admin.ModelAdmin):
     list_display = ['medicine', 'alternative_medicine', 'created_at']
     list_filter = ['created_at']
     search_fields = ['medicine__name', 'alternative_medicine__name']
+    
+    def get_queryset(self, request):
+        # __str__ reads both medicines (delete confirmations, change form titles)
+        return super().get_queryset(request).select_related('medicine', 'alternative_medicine')
 
 
 @admin.register(Prescription)
 class PrescriptionAdmin(admin.ModelAdmin):
     """Admin interface for Prescription model."""
     list_display = ['id', 'uploaded_by', 'created_at', 'has_results']
+    # uploaded_by is nullable, so the changelist's automatic select_related() skips it
+    list_select_related = ['uploaded_by']
     list_filter = ['created_at', 'uploaded_by']
     search_fields = ['extracted_text', 'uploaded_by__username']
-    readonly_fields = ['created_at', 'updated_at', 'extracted_text', 'results_json']
+    readonly_fields = ['created_at', 'updated_at', 'file_hash', 'batch', 'source_name', 'extracted_text', 'results_json', 'results_count', 'dispensed_at', 'timings']
     
     def has_results(self, obj):
-        return bool(obj.results_json)
+        return obj.results_count > 0
     has_results.boolean = True
     has_results.short_description = 'Has Results'
+
+
+@admin.register(PrescriptionBatch)
+class PrescriptionBatchAdmin(admin.ModelAdmin):
+    """Admin interface for PrescriptionBatch model."""
+    list_display = ['id', 'uploaded_by', 'total_files', 'created_at']
+    list_select_related = ['uploaded_by']
+    list_filter = ['created_at']
+    readonly_fields = ['created_at']
@@ -2,49 +2,273 @@
 AI utility functions for extracting medicine names from prescription text.
 Uses OpenAI API for intelligent text parsing.
 """
+import hashlib
 import json
+import os
+import random
 import re
+import threading
+import time
 from django.conf import settings
+from .cache_utils import get_cache, SingleFlight
+from .metrics_utils import tag
 
 
-def extract_medicine_names_with_openai(prescription_text):
+# Bump whenever the prompts or response parsing change, so cached
+# extractions produced by the old prompt are no longer used
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = "You are a medical assistant that extracts medicine names from prescriptions. Return only valid JSON arrays."
+
+USER_PROMPT_TEMPLATE = """Extract only the medicine names from the following prescription text. 
+Return them as a clean JSON array of strings. Ignore doctor notes and dosage instructions.
+
+Prescription text:
+{prescription_text}
+
+Return only a JSON array of medicine names, for example: ["Medicine1", "Medicine2", "Medicine3"]
+"""
+
+# Concurrent extractions of the same text share one upstream call
+_inflight = SingleFlight()
+
+
+class LLMUnavailableError(Exception):
+    """Raised when an LLM call is refused locally (circuit open or saturated)."""
+
+
+class CircuitBreaker:
+    """
+    Stop calling an unhealthy upstream for a while.
+
+    After failure_threshold consecutive failures the circuit opens and
+    calls are refused for reset_timeout seconds. One trial call is then
+    let through (half-open); its outcome closes or reopens the circuit.
+    A trial that ends without an outcome (e.g. it never got a
+    concurrency slot) must be handed back with release_trial().
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._trial_thread = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Return True if a call may be made now."""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._trial_thread = threading.get_ident()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        Let another call be the half-open trial; the state is unchanged.
+
+        Does nothing unless this thread holds the trial, so calls allowed
+        while the circuit was closed can call it unconditionally.
+        """
+        with self._lock:
+            if self._trial_in_flight and self._trial_thread == threading.get_ident():
+                self._trial_in_flight = False
+
+
+class OpenAIClientManager:
+    """
+    Process-wide OpenAI client with resilience controls.
+
+    Keeps one client (and so one HTTP connection pool) per process, caps
+    in-flight requests with a semaphore, retries transient errors with
+    jittered exponential backoff and trips a circuit breaker when the
+    upstream keeps failing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._semaphore = threading.BoundedSemaphore(settings.OPENAI_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.OPENAI_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.OPENAI_CIRCUIT_RESET_TIMEOUT
+        )
+
+    def get_client(self):
+        """Return the pooled client, recreating it in forked worker processes."""
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    from openai import OpenAI, Timeout
+                    self._client = OpenAI(
+                        api_key=settings.OPENAI_API_KEY,
+                        base_url=settings.OPENAI_BASE_URL or None,
+                        timeout=Timeout(
+                            settings.OPENAI_READ_TIMEOUT,
+                            connect=settings.OPENAI_CONNECT_TIMEOUT
+                        ),
+                        # Retries are handled by call() so they respect the breaker
+                        max_retries=0
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    def call(self, func, client=None):
+        """
+        Call func(client) under the concurrency cap, retries and breaker.
+
+        Args:
+            func: Callable taking a client and performing one request
+            client: Optional client to use instead of the pooled one
+
+        Returns:
+            The value returned by func
+
+        Raises:
+            LLMUnavailableError: If the circuit is open or no slot frees up
+            Exception: The last error once retries are exhausted
+
+        Only upstream trouble (timeouts, connection errors, 429 and 5xx)
+        counts towards opening the circuit; other errors such as 400 or
+        401 are raised without affecting it.
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailableError("OpenAI circuit breaker is open.")
+
+        recorded = False
+        try:
+            if not self._semaphore.acquire(timeout=settings.OPENAI_QUEUE_TIMEOUT):
+                raise LLMUnavailableError("Too many concurrent OpenAI requests.")
+
+            try:
+                if client is None:
+                    client = self.get_client()
+                attempts = settings.OPENAI_MAX_RETRIES + 1
+                for attempt in range(attempts):
+                    try:
+                        result = func(client)
+                    except Exception as e:
+                        retryable = is_retryable_error(e)
+                        if attempt + 1 < attempts and retryable:
+                            time.sleep(backoff_delay(attempt))
+                            continue
+                        if retryable:
+                            self.breaker.record_failure()
+                            recorded = True
+                        raise
+                    self.breaker.record_success()
+                    recorded = True
+                    return result
+            finally:
+                self._semaphore.release()
+        finally:
+            # Hand back a half-open trial that ended without an outcome
+            if not recorded:
+                self.breaker.release_trial()
+
+
+def is_retryable_error(error):
+    """Return True for transient errors (timeouts, connection, 429, 5xx)."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, (
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    ))
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for a zero-based retry attempt."""
+    ceiling = min(settings.OPENAI_BACKOFF_MAX, settings.OPENAI_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+_client_manager = None
+_client_manager_lock = threading.Lock()
+
+
+def get_client_manager():
+    """Return the process-wide OpenAIClientManager."""
+    global _client_manager
+    if _client_manager is None:
+        with _client_manager_lock:
+            if _client_manager is None:
+                _client_manager = OpenAIClientManager()
+    return _client_manager
+
+
+def get_openai_client():
+    """Return the pooled OpenAI client for this process."""
+    return get_client_manager().get_client()
+
+
+def extract_medicine_names_with_openai(prescription_text, client=None):
     """
     Extract medicine names from prescription text using OpenAI API.
     
     Args:
         prescription_text: Raw text extracted from prescription
+        client: Optional OpenAI-compatible client (defaults to the pooled client)
         
     Returns:
         list: List of medicine names
     """
     try:
-        from openai import OpenAI
-        
         if not settings.OPENAI_API_KEY:
             raise Exception("OpenAI API key not configured.")
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        
         # Create prompt for medicine extraction
-        prompt = f"""Extract only the medicine names from the following prescription text. 
-Return them as a clean JSON array of strings. Ignore doctor notes and dosage instructions.
-
-Prescription text:
-{prescription_text}
-
-Return only a JSON array of medicine names, for example: ["Medicine1", "Medicine2", "Medicine3"]
-"""
+        prompt = USER_PROMPT_TEMPLATE.format(prescription_text=prescription_text)
         
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a medical assistant that extracts medicine names from prescriptions. Return only valid JSON arrays."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+        # Call OpenAI API through the pooled client (timeouts, retries, breaker)
+        response = get_client_manager().call(
+            lambda openai_client: openai_client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=500
+            ),
+            client=client
         )
         
         # Extract response content
@@ -81,6 +305,53 @@ Return only a JSON array of medicine names, for example: ["Medicine1", "Medicine
         raise Exception(f"OpenAI API error: {str(e)}")
 
 
+def normalize_prescription_text(prescription_text):
+    """Collapse whitespace and case so trivially different OCR output shares a key."""
+    return ' '.join(prescription_text.split()).lower()
+
+
+def extraction_cache_key(prescription_text):
+    """
+    Build the LLM cache key for a prescription text.
+    
+    The key covers the normalized text, the configured model and the
+    prompt version, so changing either invalidates earlier results.
+    """
+    raw = f"{PROMPT_VERSION}|{settings.OPENAI_MODEL}|{normalize_prescription_text(prescription_text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def extract_medicine_names_cached(prescription_text, client=None):
+    """
+    Memoized extract_medicine_names_with_openai.
+    
+    Results are kept in the 'llm' cache. Concurrent calls for the same
+    key wait for a single upstream request. Errors are not cached; cache
+    failures count as misses or skipped writes (see BaseCache), so they
+    never discard an LLM result.
+    
+    Args:
+        prescription_text: Raw text extracted from prescription
+        client: Optional OpenAI-compatible client
+        
+    Returns:
+        list: List of medicine names
+    """
+    key = extraction_cache_key(prescription_text)
+    cache = get_cache('llm')
+    
+    medicines = cache.get(key)
+    if medicines is not None:
+        return medicines
+    
+    def fetch():
+        medicines = extract_medicine_names_with_openai(prescription_text, client=client)
+        cache.set(key, medicines)
+        return medicines
+    
+    return _inflight.do(key, fetch)
+
+
 def extract_medicine_names_fallback(prescription_text):
     """
     Fallback method to extract medicine names using regex patterns.
@@ -137,17 +408,20 @@ def extract_medicine_names(prescription_text):
         list: List of medicine names
     """
     if not prescription_text or not prescription_text.strip():
+        tag('extraction', 'none')
         return []
     
     # Try OpenAI first
     if settings.OPENAI_API_KEY:
         try:
-            medicines = extract_medicine_names_with_openai(prescription_text)
+            medicines = extract_medicine_names_cached(prescription_text)
             if medicines:
+                tag('extraction', 'llm')
                 return medicines
         except Exception:
             # Fallback to regex if OpenAI fails
             pass
     
     # Use fallback method
+    tag('extraction', 'fallback')
     return extract_medicine_names_fallback(prescription_text)
@@ -0,0 +1,240 @@
+"""
+In-memory alternative-medicine graph.
+Answers "best in-stock substitutes" with a bounded breadth-first search
+over the Alternative table, so alternatives of alternatives are found too.
+"""
+import threading
+from collections import namedtuple
+from django.conf import settings
+from .models import Medicine, Alternative
+from .profiling import upkeep
+from .search_utils import tokenize
+
+
+# Weights of the ranking terms (each term is between 0 and 1)
+COMPOSITION_WEIGHT = 0.5
+STOCK_WEIGHT = 0.3
+HOP_WEIGHT = 0.2
+
+# Stock at which the stock term reaches one half; more stock helps less and less
+STOCK_HALF_SATURATION = 20
+
+Suggestion = namedtuple('Suggestion', ['id', 'hops', 'score'])
+
+
+def composition_similarity(first, second):
+    """Jaccard similarity of two composition token sets (0 if either is empty)."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class AlternativesGraph:
+    """
+    Directed graph of Alternative rows (medicine -> alternative_medicine).
+
+    Adjacency is a dict of id lists. Each node keeps its stock and the
+    token set of its composition; identical compositions share one
+    frozenset to keep large catalogues small.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._edges = {}
+        self._nodes = {}
+        self._compositions = {}
+        self.is_built = False
+
+    def build(self, medicines, edges):
+        """
+        Replace the graph contents.
+
+        Args:
+            medicines: Iterable of (id, stock_quantity, composition)
+            edges: Iterable of (medicine_id, alternative_medicine_id)
+        """
+        with self._lock:
+            self._nodes = {}
+            self._edges = {}
+            self._compositions = {}
+            for medicine_id, stock, composition in medicines:
+                self._nodes[medicine_id] = (stock, self._composition_tokens(composition))
+            for medicine_id, alternative_id in edges:
+                self._edges.setdefault(medicine_id, []).append(alternative_id)
+            self.is_built = True
+
+    def build_from_db(self):
+        """Build the graph from all Medicine and Alternative rows."""
+        self.build(
+            Medicine.objects.values_list('id', 'stock_quantity', 'composition').iterator(),
+            Alternative.objects.values_list('medicine_id', 'alternative_medicine_id').iterator()
+        )
+
+    def _composition_tokens(self, composition):
+        tokens = frozenset(tokenize(composition))
+        return self._compositions.setdefault(tokens, tokens)
+
+    def set_medicine(self, medicine_id, stock, composition):
+        """Add or refresh a medicine's stock and composition."""
+        with self._lock:
+            self._nodes[medicine_id] = (stock, self._composition_tokens(composition))
+
+    def set_stock(self, medicine_id, stock):
+        """Update the stock of a known medicine (e.g. after a dispense)."""
+        with self._lock:
+            node = self._nodes.get(medicine_id)
+            if node is not None:
+                self._nodes[medicine_id] = (stock, node[1])
+
+    def remove_medicine(self, medicine_id):
+        """
+        Remove a medicine and its outgoing edges.
+
+        Edges pointing at it are skipped by searches; their Alternative
+        rows are deleted by the cascade, which removes them here as well.
+        """
+        with self._lock:
+            self._nodes.pop(medicine_id, None)
+            self._edges.pop(medicine_id, None)
+
+    def add_edge(self, medicine_id, alternative_id):
+        """Record that alternative_id can replace medicine_id."""
+        with self._lock:
+            targets = self._edges.setdefault(medicine_id, [])
+            if alternative_id not in targets:
+                targets.append(alternative_id)
+
+    def remove_edge(self, medicine_id, alternative_id):
+        """Forget an edge, if present."""
+        with self._lock:
+            targets = self._edges.get(medicine_id)
+            if targets and alternative_id in targets:
+                targets.remove(alternative_id)
+                if not targets:
+                    del self._edges[medicine_id]
+
+    def edge_count(self):
+        return sum(len(targets) for targets in self._edges.values())
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def suggest(self, medicine_id, limit=3, max_hops=2, max_visited=500):
+        """
+        Find the best in-stock substitutes for a medicine.
+
+        Breadth-first search follows Alternative edges up to max_hops
+        away and stops expanding after max_visited medicines, so the cost
+        is bounded however dense the graph is. Every reachable in-stock
+        medicine is scored by composition similarity to the original,
+        stock (saturating) and closeness.
+
+        Args:
+            medicine_id: Medicine to replace
+            limit: Maximum number of suggestions
+            max_hops: Maximum path length to follow
+            max_visited: Maximum number of medicines to visit
+
+        Returns:
+            list: Suggestion(id, hops, score) tuples, best first
+        """
+        with self._lock:
+            source = self._nodes.get(medicine_id)
+            if source is None:
+                return []
+            source_composition = source[1]
+
+            visited = {medicine_id}
+            frontier = [medicine_id]
+            suggestions = []
+            for hops in range(1, max_hops + 1):
+                next_frontier = []
+                for current in frontier:
+                    for neighbour in self._edges.get(current, ()):
+                        if neighbour in visited or len(visited) >= max_visited:
+                            continue
+                        node = self._nodes.get(neighbour)
+                        if node is None:
+                            continue
+                        visited.add(neighbour)
+                        next_frontier.append(neighbour)
+
+                        stock, composition = node
+                        if stock <= 0:
+                            continue
+                        score = (
+                            COMPOSITION_WEIGHT * composition_similarity(source_composition, composition)
+                            + STOCK_WEIGHT * stock / (stock + STOCK_HALF_SATURATION)
+                            + HOP_WEIGHT / hops
+                        )
+                        suggestions.append(Suggestion(neighbour, hops, round(score, 4)))
+                if not next_frontier:
+                    break
+                frontier = next_frontier
+
+        suggestions.sort(key=lambda s: (-s.score, s.hops, s.id))
+        return suggestions[:limit]
+
+
+# Process-wide graph, kept in sync by the Medicine and Alternative signal handlers
+# and, for writes made elsewhere, by sync_utils
+alternatives_graph = AlternativesGraph()
+
+
+def get_alternatives_graph():
+    """Return the process-wide alternatives graph, building it on first use."""
+    from .sync_utils import sync_indexes
+    with upkeep():
+        sync_indexes()
+        if not alternatives_graph.is_built:
+            with alternatives_graph._lock:
+                if not alternatives_graph.is_built:
+                    alternatives_graph.build_from_db()
+    return alternatives_graph
+
+
+def suggest_alternatives(medicine_ids, limit=None):
+    """
+    Suggest in-stock substitutes for several medicines.
+
+    Suggestions come from the in-memory graph; the suggested medicines
+    are then loaded in one query, and any whose stock has since dropped
+    to zero are left out.
+
+    Args:
+        medicine_ids: Iterable of medicine ids
+        limit: Suggestions per medicine (defaults to settings.ALTERNATIVES_MAX_SUGGESTIONS)
+
+    Returns:
+        dict: Mapping of medicine id to a list of
+              {'name', 'stock', 'hops'} dicts, best first
+    """
+    if limit is None:
+        limit = settings.ALTERNATIVES_MAX_SUGGESTIONS
+    graph = get_alternatives_graph()
+
+    suggestions = {
+        medicine_id: graph.suggest(
+            medicine_id,
+            limit=limit,
+            max_hops=settings.ALTERNATIVES_MAX_HOPS,
+            max_visited=settings.ALTERNATIVES_MAX_VISITED
+        )
+        for medicine_id in set(medicine_ids)
+    }
+    medicines = Medicine.objects.only('id', 'name', 'stock_quantity').in_bulk(
+        {s.id for found in suggestions.values() for s in found}
+    )
+
+    results = {}
+    for medicine_id, found in suggestions.items():
+        results[medicine_id] = [
+            {
+                'name': medicines[s.id].name,
+                'stock': medicines[s.id].stock_quantity,
+                'hops': s.hops
+            }
+            for s in found
+            if s.id in medicines and medicines[s.id].stock_quantity > 0
+        ]
+    return results
@@ -0,0 +1,118 @@
+"""
+Demand analytics over normalized prescription lines.
+Each row of a prescription's results_json is also stored as a
+PrescriptionLine, so demand, stock-outs and substitutions can be
+counted with indexed aggregate queries instead of parsing JSON.
+"""
+from django.db import transaction
+from django.db.models import Count
+from .models import Medicine, PrescriptionLine
+
+
+# results_json status -> PrescriptionLine status
+LINE_STATUSES = {
+    'Available': PrescriptionLine.STATUS_AVAILABLE,
+    'Out of Stock': PrescriptionLine.STATUS_OUT_OF_STOCK,
+    'Not Found': PrescriptionLine.STATUS_NOT_FOUND,
+    # Not resolved to a medicine until someone confirms a suggestion
+    'Needs Confirmation': PrescriptionLine.STATUS_NOT_FOUND,
+}
+
+# Lines that asked for an inventory medicine
+DEMAND_STATUSES = (PrescriptionLine.STATUS_AVAILABLE, PrescriptionLine.STATUS_OUT_OF_STOCK)
+
+
+def alternative_name(result):
+    """Return the suggested alternative's name (a dict now, a plain name in older results)."""
+    alternative = result.get('alternative')
+    if isinstance(alternative, dict):
+        return alternative.get('name')
+    return alternative or None
+
+
+def build_prescription_lines(prescriptions):
+    """
+    Turn results_json documents into unsaved PrescriptionLine rows.
+
+    Medicine and alternative names are resolved to ids in one query for
+    all the prescriptions passed in.
+
+    Args:
+        prescriptions: Iterable of (prescription id, created_at, results_json)
+
+    Returns:
+        list: PrescriptionLine instances
+    """
+    prescriptions = [
+        (prescription_id, created_at, results)
+        for prescription_id, created_at, results in prescriptions
+        if isinstance(results, list)
+    ]
+    names = set()
+    for _, _, results in prescriptions:
+        for result in results:
+            if LINE_STATUSES.get(result.get('status')) in DEMAND_STATUSES:
+                names.add(result.get('medicine_name'))
+            names.add(alternative_name(result))
+    names.discard(None)
+    ids = dict(Medicine.objects.filter(name__in=names).values_list('name', 'id')) if names else {}
+
+    lines = []
+    for prescription_id, created_at, results in prescriptions:
+        for position, result in enumerate(results):
+            status = LINE_STATUSES.get(result.get('status'))
+            if status is None:
+                continue
+            name = str(result.get('medicine_name') or '')[:200]
+            lines.append(PrescriptionLine(
+                prescription_id=prescription_id,
+                position=position,
+                medicine_id=ids.get(name) if status in DEMAND_STATUSES else None,
+                medicine_name=name,
+                status=status,
+                alternative_id=ids.get(alternative_name(result)),
+                created_at=created_at
+            ))
+    return lines
+
+
+def save_prescription_lines(prescription):
+    """
+    Replace a prescription's lines with those of its current results_json.
+
+    Returns:
+        tuple: (lines removed, lines added)
+    """
+    lines = build_prescription_lines(
+        [(prescription.id, prescription.created_at, prescription.results_json)]
+    )
+    with transaction.atomic():
+        existing = PrescriptionLine.objects.filter(prescription_id=prescription.id)
+        removed = list(existing)
+        if removed:
+            existing.delete()
+        PrescriptionLine.objects.bulk_create(lines)
+    return removed, lines
+
+
+def with_rates(row):
+    """Add stock_out_rate (of demand) and substitution_rate (of stock-outs) to a row."""
+    row['stock_out_rate'] = round(row['out_of_stock'] / row['demand'], 4) if row['demand'] else 0.0
+    row['substitution_rate'] = (
+        round(row['substituted'] / row['out_of_stock'], 4) if row['out_of_stock'] else 0.0
+    )
+    return row
+
+
+def demand_per_medicine(since):
+    """
+    Count the lines per medicine since a datetime (what the reorder queue needs).
+
+    Returns:
+        dict: Medicine id to number of lines asking for it
+    """
+    return dict(
+        PrescriptionLine.objects.filter(
+            created_at__gte=since, status__in=DEMAND_STATUSES, medicine__isnull=False
+        ).order_by().values('medicine_id').annotate(lines=Count('id')).values_list('medicine_id', 'lines')
+    )
@@ -0,0 +1,13 @@
+"""
+App configuration for Pharmacy AI application.
+"""
+from django.apps import AppConfig
+
+
+class PharmacyAppConfig(AppConfig):
+    """Registers signal handlers once the app registry is ready."""
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'pharmacy_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
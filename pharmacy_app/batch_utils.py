@@ -0,0 +1,257 @@
+"""
+Batch prescription uploads.
+Streams many uploaded files, or the members of a ZIP archive, to storage
+and creates their Prescription rows in bulk.
+"""
+import hashlib
+import os
+import zipfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from .models import Prescription, PrescriptionBatch
+from .metrics_utils import Trace
+from .pipeline import submit_prescriptions
+from .stats_utils import dashboard_stats
+
+
+class BatchUploadError(Exception):
+    """Raised when a batch upload cannot be accepted as a whole."""
+
+
+class FileTooLargeError(BatchUploadError):
+    """Raised when a single file exceeds BATCH_MAX_FILE_SIZE; the file is skipped."""
+
+
+class BatchSize:
+    """
+    Running total of the bytes read across every file of one batch.
+
+    Counts decompressed bytes, so a ZIP archive cannot expand past
+    max_total however small it is uploaded.
+    """
+
+    def __init__(self, max_total):
+        self.max_total = max_total
+        self.total = 0
+
+    def add(self, size):
+        self.total += size
+        if self.total > self.max_total:
+            raise BatchUploadError(f"Batch exceeds {self.max_total} bytes in total.")
+
+
+class HashingReader:
+    """
+    File-like wrapper that hashes and size-checks data as it is read.
+
+    Lets a file be copied to storage and digested in a single pass,
+    without holding it in memory. Bytes read are also added to the
+    batch's running total, when one is given.
+    """
+
+    def __init__(self, stream, max_size, batch_size=None):
+        self.stream = stream
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.size += len(data)
+        if self.batch_size is not None:
+            self.batch_size.add(len(data))
+        if self.size > self.max_size:
+            raise FileTooLargeError(f"File exceeds {self.max_size} bytes.")
+        self._digest.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def is_allowed_file(name):
+    """Return True for prescription files (by extension), ignoring hidden files."""
+    base = os.path.basename(name)
+    if not base or base.startswith('.') or name.startswith('__MACOSX/'):
+        return False
+    return os.path.splitext(base)[1].lower() in settings.ALLOWED_EXTENSIONS
+
+
+def iter_batch_files(uploaded_files):
+    """
+    Yield (name, stream) for every prescription file in an upload.
+    
+    ZIP archives are read member by member; each member is decompressed
+    while it is copied, so the archive is never loaded into memory.
+    Unsupported entries are yielded with a stream of None.
+    
+    Args:
+        uploaded_files: List of Django UploadedFile objects
+        
+    Yields:
+        tuple: (file name, readable binary stream or None)
+        
+    Raises:
+        BatchUploadError: If an archive is invalid or a member expands more
+                          than BATCH_MAX_COMPRESSION_RATIO times (a ZIP bomb)
+    """
+    for uploaded in uploaded_files:
+        if os.path.splitext(uploaded.name)[1].lower() != '.zip':
+            yield uploaded.name, (uploaded if is_allowed_file(uploaded.name) else None)
+            continue
+
+        try:
+            archive = zipfile.ZipFile(uploaded)
+        except zipfile.BadZipFile:
+            raise BatchUploadError(f"{uploaded.name} is not a valid ZIP archive.")
+
+        with archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                if not is_allowed_file(member.filename):
+                    yield member.filename, None
+                    continue
+                # file_size is the most a member can expand to; zipfile stops reading there
+                if member.file_size > max(member.compress_size, 1) * settings.BATCH_MAX_COMPRESSION_RATIO:
+                    raise BatchUploadError(
+                        f"{member.filename} in {uploaded.name} has a suspicious compression ratio."
+                    )
+                with archive.open(member) as stream:
+                    yield member.filename, stream
+
+
+def save_batch_file(name, stream, batch_size=None):
+    """
+    Copy one file to prescription storage, hashing it on the way.
+    
+    Args:
+        name: File name (as uploaded or inside the archive)
+        stream: Readable binary stream
+        batch_size: Optional BatchSize the file's bytes are added to
+        
+    Returns:
+        tuple: (stored file name, SHA-256 hex digest)
+        
+    Raises:
+        FileTooLargeError: If the file exceeds BATCH_MAX_FILE_SIZE
+        BatchUploadError: If the batch exceeds BATCH_MAX_TOTAL_SIZE
+    """
+    reader = HashingReader(stream, settings.BATCH_MAX_FILE_SIZE, batch_size)
+    field = Prescription._meta.get_field('file')
+    target = default_storage.get_available_name(
+        field.generate_filename(None, os.path.basename(name))
+    )
+    try:
+        stored_name = default_storage.save(target, File(reader))
+    except BatchUploadError:
+        # Over a limit: remove whatever was written before it was hit
+        default_storage.delete(target)
+        raise
+    return stored_name, reader.hexdigest()
+
+
+def create_batch(user, uploaded_files):
+    """
+    Store every file of a batch upload and queue it for processing.
+    
+    Files are written to storage one at a time; the Prescription rows are
+    then inserted with a single bulk_create and handed to the worker pool
+    once the transaction commits.
+    
+    Args:
+        user: Uploading user
+        uploaded_files: List of Django UploadedFile objects (files or ZIPs)
+        
+    Returns:
+        tuple: (PrescriptionBatch, list of skipped file names)
+        
+    Raises:
+        BatchUploadError: If nothing usable was uploaded or limits are exceeded
+    """
+    stored, skipped = [], []
+    batch_size = BatchSize(settings.BATCH_MAX_TOTAL_SIZE)
+    try:
+        for name, stream in iter_batch_files(uploaded_files):
+            if stream is None:
+                skipped.append(name)
+                continue
+            if len(stored) >= settings.BATCH_MAX_FILES:
+                raise BatchUploadError(
+                    f"A batch may contain at most {settings.BATCH_MAX_FILES} files."
+                )
+            trace = Trace()
+            try:
+                with trace.span('file_save'):
+                    stored_name, file_hash = save_batch_file(name, stream, batch_size)
+            except FileTooLargeError:
+                skipped.append(name)
+                continue
+            stored.append((name, stored_name, file_hash, trace.as_json()))
+    except BatchUploadError:
+        # Do not leave files behind for a batch that is rejected
+        for _, stored_name, _, _ in stored:
+            default_storage.delete(stored_name)
+        raise
+
+    if not stored:
+        raise BatchUploadError('No valid prescription files found. Allowed: jpg, jpeg, png, pdf')
+
+    with transaction.atomic():
+        batch = PrescriptionBatch.objects.create(uploaded_by=user, total_files=len(stored))
+        Prescription.objects.bulk_create(
+            [
+                Prescription(
+                    file=stored_name,
+                    file_hash=file_hash,
+                    source_name=name[:255],
+                    uploaded_by=user,
+                    batch=batch,
+                    timings=timings
+                )
+                for name, stored_name, file_hash, timings in stored
+            ],
+            batch_size=settings.BATCH_INSERT_SIZE
+        )
+        # bulk_create sends no post_save, so count the new rows here
+        transaction.on_commit(lambda: dashboard_stats.add('total_prescriptions', len(stored)))
+        # bulk_create does not return ids on every backend (e.g. MySQL)
+        submit_prescriptions(
+            batch.prescriptions.order_by('id').values_list('id', flat=True)
+        )
+
+    return batch, skipped
+
+
+def batch_status_data(batch):
+    """Build the progress payload for a batch: totals by status and per-file state."""
+    files = list(
+        batch.prescriptions.order_by('id').values(
+            'id', 'source_name', 'status', 'error_message'
+        )
+    )
+    counts = {status_value: 0 for status_value, _ in Prescription.STATUS_CHOICES}
+    for row in files:
+        counts[row['status']] += 1
+
+    finished = counts[Prescription.STATUS_COMPLETED] + counts[Prescription.STATUS_FAILED]
+    return {
+        'batch_id': batch.id,
+        'created_at': batch.created_at.isoformat(),
+        'total_files': batch.total_files,
+        'counts': counts,
+        'progress': round(finished / batch.total_files, 4) if batch.total_files else 1.0,
+        'is_finished': finished == batch.total_files,
+        'files': [
+            {
+                'prescription_id': row['id'],
+                'name': row['source_name'],
+                'status': row['status'],
+                'error': row['error_message'],
+            }
+            for row in files
+        ],
+    }
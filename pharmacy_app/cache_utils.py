@@ -0,0 +1,302 @@
+"""
+Pluggable application caches with hit/miss counters.
+Backends are configured per cache name in settings.PHARMACY_CACHES.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+class BaseCache:
+    """
+    Base class for cache backends.
+
+    Subclasses implement _get, _set, _delete, _clear and __len__;
+    get() keeps the hit/miss counters.
+
+    A cache is an optimization, so get() and set() never raise: a
+    backend error (e.g. "database is locked") is logged and counted,
+    and the lookup is a miss or the write is skipped.
+    """
+
+    def __init__(self, name='default', timeout=None, **options):
+        self.name = name
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss."""
+        try:
+            found, value = self._get(key)
+        except Exception as e:
+            self._error('get', e)
+            found, value = False, None
+        with self._stats_lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value if found else default
+
+    def set(self, key, value, timeout=None):
+        """Store value under key, expiring after timeout seconds (None: default)."""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            self._set(key, value, timeout)
+        except Exception as e:
+            self._error('set', e)
+
+    def _error(self, operation, error):
+        with self._stats_lock:
+            self.errors += 1
+        logger.warning("Cache '%s' %s failed: %s", self.name, operation, error)
+
+    def delete(self, key):
+        """Remove key, if present."""
+        self._delete(key)
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        self._clear()
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def counters(self):
+        """Return (hits, misses) without measuring the size."""
+        with self._stats_lock:
+            return self.hits, self.misses
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        hits, misses = self.counters()
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'errors': self.errors,
+            'size': len(self),
+        }
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, timeout):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class LRUCache(BaseCache):
+    """In-process cache that evicts the least recently used entry when full."""
+
+    def __init__(self, max_entries=1024, **options):
+        super().__init__(**options)
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return False, None
+            expires_at, value = self._data[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def _set(self, key, value, timeout):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        stats = super().stats()
+        stats['max_entries'] = self.max_entries
+        stats['evictions'] = self.evictions
+        return stats
+
+
+class DatabaseCache(BaseCache):
+    """
+    Persistent cache stored in the cache_entries table.
+
+    Survives restarts and is shared by every process. Entries expire after
+    their timeout; when more than max_entries are stored, the least
+    recently used ones are deleted. Values must be JSON-serializable.
+
+    To keep hits and writes to one or two queries, a hit only refreshes
+    last_used_at when it is over touch_interval seconds old, and each
+    process culls at most once every cull_interval seconds, so the
+    table may briefly hold more than max_entries.
+    """
+
+    def __init__(self, max_entries=10000, touch_interval=60, cull_interval=60, **options):
+        super().__init__(**options)
+        self.max_entries = max_entries
+        self.touch_interval = timedelta(seconds=touch_interval)
+        self.cull_interval = cull_interval
+        self.evictions = 0
+        self._culled_at = None
+
+    def _entries(self):
+        from .models import CacheEntry
+        return CacheEntry.objects.filter(cache_name=self.name)
+
+    def _get(self, key):
+        now = timezone.now()
+        entry = self._entries().filter(key=key).values(
+            'id', 'value', 'expires_at', 'last_used_at'
+        ).first()
+        if entry is None:
+            return False, None
+        # Savepoints, so a failed write cannot break the caller's transaction
+        if entry['expires_at'] is not None and entry['expires_at'] <= now:
+            with transaction.atomic():
+                self._entries().filter(id=entry['id']).delete()
+            return False, None
+        if now - entry['last_used_at'] > self.touch_interval:
+            with transaction.atomic():
+                self._entries().filter(id=entry['id']).update(last_used_at=now)
+        return True, entry['value']
+
+    def _set(self, key, value, timeout):
+        from .models import CacheEntry
+        now = timezone.now()
+        with transaction.atomic():
+            CacheEntry.objects.update_or_create(
+                cache_name=self.name,
+                key=key,
+                defaults={
+                    'value': value,
+                    'expires_at': now + timedelta(seconds=timeout) if timeout is not None else None,
+                    'last_used_at': now,
+                }
+            )
+        if self._culled_at is None or time.monotonic() - self._culled_at >= self.cull_interval:
+            self._culled_at = time.monotonic()
+            with transaction.atomic():
+                self._cull()
+
+    def _cull(self):
+        """Delete expired entries, then the least recently used beyond max_entries."""
+        self._entries().filter(expires_at__lte=timezone.now()).delete()
+        excess = self._entries().count() - self.max_entries
+        if excess > 0:
+            stale_ids = list(
+                self._entries().order_by('last_used_at').values_list('id', flat=True)[:excess]
+            )
+            self._entries().filter(id__in=stale_ids).delete()
+            self.evictions += len(stale_ids)
+
+    def _delete(self, key):
+        self._entries().filter(key=key).delete()
+
+    def _clear(self):
+        self._entries().delete()
+
+    def __len__(self):
+        return self._entries().count()
+
+    def stats(self):
+        stats = super().stats()
+        stats['max_entries'] = self.max_entries
+        stats['evictions'] = self.evictions
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function; callers arriving while
+    it runs wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event()}
+
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = func(*args, **kwargs)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """
+    Return the configured cache backend instance for a cache name.
+
+    Args:
+        name: Key in settings.PHARMACY_CACHES (e.g. 'ocr')
+
+    Returns:
+        BaseCache: Shared backend instance for this process
+    """
+    if name not in _caches:
+        with _caches_lock:
+            if name not in _caches:
+                config = settings.PHARMACY_CACHES[name]
+                backend = import_string(config['BACKEND'])
+                _caches[name] = backend(name=name, **config.get('OPTIONS', {}))
+    return _caches[name]
@@ -0,0 +1,282 @@
+"""
+Bulk medicine catalogue import and export.
+Streams CSV or Parquet files, validates each row and upserts them in
+chunks keyed on Medicine.name.
+"""
+import csv
+import io
+import os
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from .models import Medicine
+from .pagination import iter_keyset
+from .reorder_utils import refresh_reorder_flags
+from .signals import reset_medicine_indexes
+
+
+# Columns of the catalogue files, in export order
+CATALOGUE_FIELDS = ('name', 'composition', 'stock_quantity', 'reorder_point', 'manufacturer')
+
+CATALOGUE_FORMATS = ('csv', 'parquet')
+
+# Validation errors kept in an import report (the rest are only counted)
+MAX_REPORTED_ERRORS = 100
+
+
+class CatalogueImportError(Exception):
+    """Raised when a catalogue file cannot be read at all."""
+
+
+def detect_format(filename, default='csv'):
+    """Return 'csv' or 'parquet' from a file name's extension."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    if ext in ('.csv', '.txt'):
+        return 'csv'
+    return default
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise CatalogueImportError("Parquet support needs pyarrow. Install it using: pip install pyarrow")
+    return pyarrow
+
+
+def iter_csv_rows(fileobj):
+    """
+    Yield (line number, row dict) from a binary CSV file with a header row.
+
+    Raises:
+        CatalogueImportError: If the header has no name column
+    """
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or 'name' not in [f.strip().lower() for f in reader.fieldnames]:
+            raise CatalogueImportError("CSV header must include a 'name' column")
+        reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+def iter_parquet_rows(fileobj, batch_size=10000):
+    """
+    Yield (row number, row dict) from a Parquet file, one record batch at a time.
+
+    Raises:
+        CatalogueImportError: If pyarrow is missing or there is no name column
+    """
+    pyarrow = _import_pyarrow()
+    parquet_file = pyarrow.parquet.ParquetFile(fileobj)
+    columns = [name for name in parquet_file.schema_arrow.names if name.lower() in CATALOGUE_FIELDS]
+    if 'name' not in [name.lower() for name in columns]:
+        raise CatalogueImportError("Parquet file must include a 'name' column")
+
+    number = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        for row in batch.to_pylist():
+            number += 1
+            yield number, {key.lower(): value for key, value in row.items()}
+
+
+def clean_row(row):
+    """
+    Validate and normalize one catalogue row.
+
+    Columns missing from the file are left out of the result, so an
+    import only overwrites the columns it provides.
+
+    Returns:
+        dict: Field values for Medicine
+
+    Raises:
+        ValueError: With a message describing the first invalid value
+    """
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > 200:
+        raise ValueError("name is longer than 200 characters")
+    cleaned = {'name': name}
+
+    if 'composition' in row:
+        cleaned['composition'] = str(row['composition'] or '').strip() or None
+
+    if 'manufacturer' in row:
+        manufacturer = str(row['manufacturer'] or '').strip() or None
+        if manufacturer and len(manufacturer) > 200:
+            raise ValueError("manufacturer is longer than 200 characters")
+        cleaned['manufacturer'] = manufacturer
+
+    if 'stock_quantity' in row:
+        cleaned['stock_quantity'] = clean_count(row, 'stock_quantity', 0)
+    if 'reorder_point' in row:
+        cleaned['reorder_point'] = clean_count(row, 'reorder_point', settings.DEFAULT_REORDER_POINT)
+    return cleaned
+
+
+def clean_count(row, field, default):
+    """Parse a non-negative whole number column; blank means default."""
+    raw = str(row[field] if row[field] is not None else '').strip()
+    if not raw:
+        return default
+    try:
+        number = float(raw)
+    except ValueError:
+        raise ValueError(f"{field} {raw!r} is not a number")
+    if not number.is_integer():
+        raise ValueError(f"{field} {raw!r} is not a whole number")
+    if number < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return int(number)
+
+
+def upsert_medicines(rows, update_fields):
+    """
+    Insert or update a chunk of medicines in one statement.
+
+    Args:
+        rows: List of cleaned row dicts with unique names
+        update_fields: Columns to overwrite when the name already exists
+    """
+    options = {'update_conflicts': True, 'update_fields': list(update_fields) + ['updated_at']}
+    # MySQL upserts on any unique key and rejects an explicit target
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['name']
+    Medicine.objects.bulk_create([Medicine(**row) for row in rows], **options)
+    # bulk_create skips Medicine.save(), which keeps needs_reorder
+    refresh_reorder_flags(Medicine.objects.filter(name__in=[row['name'] for row in rows]))
+
+
+def import_medicines(rows, chunk_size=1000, dry_run=False):
+    """
+    Validate and upsert catalogue rows in chunks.
+
+    Each chunk is upserted in its own transaction, so memory stays
+    bounded by chunk_size however large the file is. Within a chunk the
+    last row for a name wins. Invalid rows are skipped and reported.
+
+    Args:
+        rows: Iterable of (line number, row dict), e.g. from iter_csv_rows
+        chunk_size: Rows per bulk upsert
+        dry_run: Validate only
+
+    Returns:
+        dict: rows, imported, invalid, errors (first MAX_REPORTED_ERRORS
+              as {'line', 'error'}), seconds and rows_per_second
+    """
+    start = time.perf_counter()
+    report = {'rows': 0, 'imported': 0, 'invalid': 0, 'errors': []}
+    chunk = {}
+    update_fields = None
+
+    def flush():
+        if chunk and not dry_run:
+            with transaction.atomic():
+                upsert_medicines(list(chunk.values()), update_fields)
+        report['imported'] += len(chunk)
+        chunk.clear()
+
+    for line, row in rows:
+        report['rows'] += 1
+        try:
+            cleaned = clean_row(row)
+        except ValueError as e:
+            report['invalid'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line, 'error': str(e)})
+            continue
+
+        if update_fields is None:
+            update_fields = [field for field in CATALOGUE_FIELDS if field != 'name' and field in cleaned]
+        chunk[cleaned['name']] = cleaned
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - start
+    report['seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['rows'] / elapsed, 1) if elapsed else None
+    if report['imported'] and not dry_run:
+        # bulk_create skips the post_save handlers that maintain these
+        reset_medicine_indexes()
+    return report
+
+
+def import_medicines_file(fileobj, file_format='csv', chunk_size=1000, dry_run=False):
+    """
+    Import a CSV or Parquet catalogue from an open binary file.
+
+    Raises:
+        CatalogueImportError: If the format is unknown or the file unreadable
+    """
+    if file_format == 'csv':
+        rows = iter_csv_rows(fileobj)
+    elif file_format == 'parquet':
+        rows = iter_parquet_rows(fileobj, batch_size=max(chunk_size, 1000))
+    else:
+        raise CatalogueImportError(f"Unsupported format '{file_format}'")
+    try:
+        return import_medicines(rows, chunk_size=chunk_size, dry_run=dry_run)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise CatalogueImportError(f"Could not read the file: {e}")
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def iter_catalogue(chunk_size=2000):
+    """Yield catalogue rows as dicts, in name order, in keyset chunks."""
+    queryset = Medicine.objects.values('id', *CATALOGUE_FIELDS)
+    for row in iter_keyset(queryset, ('name', 'id'), chunk_size=chunk_size):
+        yield {field: row[field] for field in CATALOGUE_FIELDS}
+
+
+def iter_csv_export(chunk_size=2000):
+    """Yield the catalogue as CSV text, one line at a time, header first."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CATALOGUE_FIELDS)
+    for row in iter_catalogue(chunk_size):
+        yield writer.writerow([row[field] if row[field] is not None else '' for field in CATALOGUE_FIELDS])
+
+
+def write_parquet_export(path, chunk_size=50000):
+    """
+    Write the catalogue to a Parquet file, one row group per chunk.
+
+    Returns:
+        int: Number of rows written
+    """
+    pyarrow = _import_pyarrow()
+    schema = pyarrow.schema([
+        ('name', pyarrow.string()),
+        ('composition', pyarrow.string()),
+        ('stock_quantity', pyarrow.int64()),
+        ('reorder_point', pyarrow.int64()),
+        ('manufacturer', pyarrow.string()),
+    ])
+    count = 0
+    batch = []
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for row in iter_catalogue():
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
@@ -39,7 +39,7 @@ class MedicineForm(forms.ModelForm):
     
     class Meta:
         model = Medicine
-        fields = ['name', 'composition', 'stock_quantity', 'manufacturer']
+        fields = ['name', 'composition', 'stock_quantity', 'reorder_point', 'manufacturer']
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': 'form-control',
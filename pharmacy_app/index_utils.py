@@ -0,0 +1,312 @@
+"""
+In-memory medicine name index for fast, OCR-tolerant name lookups.
+Uses normalized tokens, trigram postings and a strength/dose parser.
+"""
+import re
+import threading
+from collections import namedtuple
+from .profiling import upkeep
+
+
+# Common OCR confusions inside alphabetic tokens (e.g. "Paracetam0l")
+OCR_CONFUSIONS = str.maketrans({'0': 'o', '1': 'l', '|': 'l'})
+
+STRENGTH_PATTERN = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(mcg|µg|ug|mg|g|ml|iu|%)(?![a-z])',
+    re.IGNORECASE
+)
+
+# Conversion of strength units to a common base unit
+UNIT_SCALE = {
+    'mcg': ('mg', 0.001),
+    'µg': ('mg', 0.001),
+    'ug': ('mg', 0.001),
+    'mg': ('mg', 1.0),
+    'g': ('mg', 1000.0),
+    'ml': ('ml', 1.0),
+    'iu': ('iu', 1.0),
+    '%': ('%', 1.0),
+}
+
+MIN_SCORE = 0.5
+STRENGTH_BONUS = 0.15
+SEARCH_TIERS = (0.9, 0.8, 0.7)
+# Name similarity (strength aside) at which a non-exact name is taken
+# as the medicine without asking; below it candidates are suggestions
+CONFIDENT_SCORE = 0.9
+
+Candidate = namedtuple('Candidate', ['id', 'name', 'score'])
+
+
+def parse_strength(text):
+    """
+    Split a medicine name into its base name and strength.
+
+    Args:
+        text: Medicine name, e.g. "Paracetamol 500mg"
+
+    Returns:
+        tuple: (base name, (value, unit) or None), with the strength
+               converted to a base unit (mg for mass units)
+    """
+    match = STRENGTH_PATTERN.search(text)
+    if not match:
+        return text, None
+
+    unit, scale = UNIT_SCALE[match.group(2).lower()]
+    strength = (round(float(match.group(1)) * scale, 6), unit)
+    base = (text[:match.start()] + ' ' + text[match.end():]).strip()
+    return base, strength
+
+
+def normalize_tokens(text):
+    """
+    Normalize a medicine name into lowercase alphanumeric tokens.
+
+    Digits inside alphabetic tokens are mapped to the letters OCR
+    commonly confuses them with.
+
+    Args:
+        text: Raw medicine name (without strength)
+
+    Returns:
+        list: Normalized tokens
+    """
+    tokens = []
+    for token in re.findall(r'[a-z0-9|]+', text.lower()):
+        if any(ch.isalpha() for ch in token):
+            token = token.translate(OCR_CONFUSIONS)
+        tokens.append(token)
+    return tokens
+
+
+def trigrams(tokens):
+    """Return the set of padded character trigrams for a list of tokens."""
+    grams = set()
+    for token in tokens:
+        padded = f' {token} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class MedicineNameIndex:
+    """
+    In-memory trigram index over medicine names.
+
+    Candidates are scored by trigram containment and Dice similarity,
+    adjusted by whether the parsed strengths agree.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._postings = {}
+        self._exact = {}
+        self.is_built = False
+
+    def build(self, rows):
+        """
+        Replace the index contents.
+
+        Args:
+            rows: Iterable of (id, name) pairs
+        """
+        with self._lock:
+            self._entries = {}
+            self._postings = {}
+            self._exact = {}
+            for medicine_id, name in rows:
+                self._add(medicine_id, name)
+            self.is_built = True
+
+    def build_from_db(self):
+        """Build the index from all Medicine rows."""
+        from .models import Medicine
+        self.build(Medicine.objects.values_list('id', 'name').iterator())
+
+    def add(self, medicine_id, name):
+        """Add or replace a single medicine."""
+        with self._lock:
+            self._remove(medicine_id)
+            self._add(medicine_id, name)
+
+    def remove(self, medicine_id):
+        """Remove a single medicine, if present."""
+        with self._lock:
+            self._remove(medicine_id)
+
+    def _add(self, medicine_id, name):
+        base, strength = parse_strength(name)
+        tokens = normalize_tokens(base)
+        grams = trigrams(tokens)
+        self._entries[medicine_id] = (name, strength, grams)
+        self._exact.setdefault(' '.join(tokens), set()).add(medicine_id)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(medicine_id)
+
+    def _remove(self, medicine_id):
+        entry = self._entries.pop(medicine_id, None)
+        if entry is None:
+            return
+        name, _, grams = entry
+        key = ' '.join(normalize_tokens(parse_strength(name)[0]))
+        self._exact[key].discard(medicine_id)
+        if not self._exact[key]:
+            del self._exact[key]
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(medicine_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, query, limit=5, min_score=MIN_SCORE):
+        """
+        Find the medicines whose names best match a query.
+
+        Names whose normalized base equals the query are found with a
+        dictionary lookup. Otherwise candidates are collected at falling
+        score thresholds, scanning only the rarest trigram postings that
+        a candidate above the threshold must appear in.
+
+        Args:
+            query: Medicine name as written on the prescription
+            limit: Maximum number of candidates to return
+            min_score: Minimum score (0-1) for a candidate to be returned
+
+        Returns:
+            list: Candidate(id, name, score) tuples, best match first
+        """
+        base, strength = parse_strength(query)
+        tokens = normalize_tokens(base)
+        query_grams = trigrams(tokens)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            candidates = self._rank(
+                self._exact.get(' '.join(tokens), ()), query_grams, strength, min_score
+            )
+            # Perfect exact matches cannot be outranked by fuzzy ones
+            if sum(1 for c in candidates if c.score >= 1.0) < limit:
+                # Strict thresholds probe far fewer postings; every candidate
+                # scoring above a threshold is found, so stop once enough are
+                thresholds = [t for t in SEARCH_TIERS if t > min_score] + [min_score]
+                for threshold in thresholds:
+                    candidate_ids = self._candidate_ids(query_grams, strength, threshold)
+                    candidates = self._rank(candidate_ids, query_grams, strength, threshold)
+                    if len(candidates) >= limit:
+                        break
+
+        candidates.sort(key=lambda c: (-c.score, c.name))
+        return candidates[:limit]
+
+    def match(self, query, limit=3):
+        """
+        Find the one medicine a name unambiguously refers to.
+
+        A candidate is confident when its strength does not contradict
+        the query's and its normalized base name equals the query's, or
+        is at least CONFIDENT_SCORE similar (OCR noise, small typos). A
+        different drug or dose is never returned as the match, and
+        neither is a name that fits several medicines equally (e.g. no
+        strength, and several strengths in stock).
+
+        Args:
+            query: Medicine name as written on the prescription
+            limit: Maximum number of suggestions
+
+        Returns:
+            tuple: (Candidate or None, list of other Candidates to offer
+                    as "did you mean" suggestions, best first)
+        """
+        candidates = self.search(query, limit=limit)
+        base, strength = parse_strength(query)
+        tokens = normalize_tokens(base)
+        query_grams = trigrams(tokens)
+
+        confident = []
+        with self._lock:
+            exact = self._exact.get(' '.join(tokens), set())
+            for candidate in candidates:
+                entry = self._entries.get(candidate.id)
+                if entry is None:
+                    continue
+                _, med_strength, grams = entry
+                if strength and med_strength and strength != med_strength:
+                    continue
+                if candidate.id in exact or self._score(query_grams, None, grams, None) >= CONFIDENT_SCORE:
+                    confident.append((candidate, bool(strength) and strength == med_strength, candidate.id in exact))
+
+        # Several fit: prefer the same strength, then the exact name
+        for preferred in (lambda c: c[1], lambda c: c[2]):
+            if len(confident) > 1 and any(preferred(c) for c in confident):
+                confident = [c for c in confident if preferred(c)]
+        if len(confident) != 1:
+            return None, candidates
+        best = confident[0][0]
+        return best, [c for c in candidates if c.id != best.id]
+
+    def _rank(self, candidate_ids, query_grams, strength, min_score):
+        """Score candidate ids and keep those reaching min_score."""
+        candidates = []
+        for medicine_id in candidate_ids:
+            name, med_strength, grams = self._entries[medicine_id]
+            score = self._score(query_grams, strength, grams, med_strength)
+            if score >= min_score:
+                candidates.append(Candidate(medicine_id, name, round(score, 4)))
+        return candidates
+
+    def _candidate_ids(self, query_grams, strength, min_score):
+        """
+        Collect ids that could reach min_score (prefix filtering).
+
+        A candidate sharing at least min_shared of the query's trigrams
+        must appear in one of the (len - min_shared + 1) rarest postings.
+        """
+        size = len(query_grams)
+        bonus = STRENGTH_BONUS if strength else 0.0
+        min_shared = next(
+            (shared for shared in range(1, size + 1)
+             if (shared / size + 2.0 * shared / (size + shared)) / 2 + bonus >= min_score),
+            size + 1
+        )
+        postings = sorted(
+            (self._postings.get(gram, ()) for gram in query_grams), key=len
+        )
+        candidate_ids = set()
+        for ids in postings[:size - min_shared + 1]:
+            candidate_ids.update(ids)
+        return candidate_ids
+
+    @staticmethod
+    def _score(query_grams, strength, grams, med_strength):
+        """Score a candidate by trigram containment, Dice and strength."""
+        shared = len(query_grams & grams)
+        containment = shared / len(query_grams)
+        dice = 2.0 * shared / (len(query_grams) + len(grams))
+        score = (containment + dice) / 2
+        if strength and med_strength:
+            score += STRENGTH_BONUS if strength == med_strength else -STRENGTH_BONUS
+        return max(0.0, min(1.0, score))
+
+
+# Process-wide index, kept in sync by the Medicine signal handlers
+# and, for writes made elsewhere, by sync_utils
+medicine_index = MedicineNameIndex()
+
+
+def get_medicine_index():
+    """Return the process-wide medicine name index, building it on first use."""
+    from .sync_utils import sync_indexes
+    with upkeep():
+        sync_indexes()
+        if not medicine_index.is_built:
+            with medicine_index._lock:
+                if not medicine_index.is_built:
+                    medicine_index.build_from_db()
+    return medicine_index
@@ -0,0 +1,178 @@
+"""
+Ingredient index over Medicine.composition.
+Parses compositions into (ingredient, strength) pairs and finds medicines
+with the same active ingredients by walking an inverted index.
+"""
+import re
+import threading
+from .index_utils import parse_strength, normalize_tokens
+
+
+# Separators between the ingredients of a combination ("A 500mg + B 65mg").
+# "/" is not one: it joins concentrations such as "125mg/5ml".
+INGREDIENT_SEPARATOR = re.compile(r'\s*(?:\+|,|;|&|\band\b|\bwith\b)\s*', re.IGNORECASE)
+
+# The "per volume" part of a concentration, e.g. the "/5ml" in "125mg/5ml"
+PER_VOLUME_PATTERN = re.compile(r'\s*/\s*(\d+(?:\.\d+)?)?\s*(ml|l|g)\b', re.IGNORECASE)
+
+# Salt and ester forms that do not change the active ingredient
+# ("Metformin Hydrochloride" and "Metformin HCl" are both "metformin")
+SALT_WORDS = {
+    'hydrochloride', 'hcl', 'hydrobromide', 'sodium', 'potassium', 'calcium',
+    'maleate', 'besylate', 'besilate', 'mesylate', 'succinate', 'fumarate',
+    'tartrate', 'citrate', 'acetate', 'phosphate', 'sulphate', 'sulfate',
+    'trihydrate', 'dihydrate', 'monohydrate', 'anhydrous',
+}
+
+
+def normalize_ingredient(text):
+    """
+    Normalize an ingredient name, dropping salt forms.
+
+    Args:
+        text: Ingredient name without strength, e.g. "Metformin Hydrochloride"
+
+    Returns:
+        str: Normalized name, e.g. "metformin" ('' if nothing is left)
+    """
+    tokens = normalize_tokens(text)
+    active = [token for token in tokens if token not in SALT_WORDS]
+    return ' '.join(active or tokens)
+
+
+def parse_composition(composition, name=None):
+    """
+    Parse a composition into its ingredients and their strengths.
+
+    Concentrations keep their volume ("125mg/5ml" is (125.0, 'mg/5ml')).
+    A single ingredient without a strength takes the strength from the
+    medicine name, since catalogues often write composition "Paracetamol"
+    for "Paracetamol 500mg".
+
+    Args:
+        composition: Medicine.composition, e.g. "Paracetamol 500mg + Caffeine 65mg"
+        name: Optional medicine name to take a missing strength from
+
+    Returns:
+        frozenset: (ingredient, (value, unit) or None) pairs
+    """
+    ingredients = []
+    for part in INGREDIENT_SEPARATOR.split(composition or ''):
+        per_volume = PER_VOLUME_PATTERN.search(part)
+        if per_volume:
+            part = part[:per_volume.start()] + ' ' + part[per_volume.end():]
+        base, strength = parse_strength(part)
+        if strength and per_volume:
+            amount = per_volume.group(1) or '1'
+            strength = (strength[0], f'{strength[1]}/{float(amount):g}{per_volume.group(2).lower()}')
+        ingredient = normalize_ingredient(base)
+        if ingredient:
+            ingredients.append((ingredient, strength))
+
+    if len(ingredients) == 1 and ingredients[0][1] is None and name:
+        ingredients[0] = (ingredients[0][0], parse_strength(name)[1])
+    return frozenset(ingredients)
+
+
+class IngredientIndex:
+    """
+    Inverted index from normalized ingredient to medicine ids.
+
+    Each medicine keeps its parsed composition. Substitutes are found by
+    scanning only the postings of the source's rarest ingredient, so a
+    lookup costs O(postings) rather than a pass over the catalogue.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._compositions = {}
+        self._stock = {}
+
+    def build(self, rows):
+        """
+        Replace the index contents.
+
+        Args:
+            rows: Iterable of (id, name, composition, stock_quantity)
+        """
+        with self._lock:
+            self._postings = {}
+            self._compositions = {}
+            self._stock = {}
+            for medicine_id, name, composition, stock in rows:
+                self._add(medicine_id, name, composition, stock)
+
+    def add(self, medicine_id, name, composition, stock):
+        """Add or replace a single medicine."""
+        with self._lock:
+            self._remove(medicine_id)
+            self._add(medicine_id, name, composition, stock)
+
+    def remove(self, medicine_id):
+        """Remove a single medicine, if present."""
+        with self._lock:
+            self._remove(medicine_id)
+
+    def _add(self, medicine_id, name, composition, stock):
+        parsed = parse_composition(composition, name)
+        if not parsed:
+            return
+        self._compositions[medicine_id] = parsed
+        self._stock[medicine_id] = stock
+        for ingredient, _ in parsed:
+            self._postings.setdefault(ingredient, set()).add(medicine_id)
+
+    def _remove(self, medicine_id):
+        parsed = self._compositions.pop(medicine_id, None)
+        self._stock.pop(medicine_id, None)
+        for ingredient, _ in parsed or ():
+            ids = self._postings[ingredient]
+            ids.discard(medicine_id)
+            if not ids:
+                del self._postings[ingredient]
+
+    def __len__(self):
+        return len(self._compositions)
+
+    def ids(self, out_of_stock=False):
+        """Return the ids of the indexed medicines (only those without stock if out_of_stock)."""
+        with self._lock:
+            if out_of_stock:
+                return [medicine_id for medicine_id, stock in self._stock.items() if stock <= 0]
+            return list(self._compositions)
+
+    def substitutes(self, medicine_id, limit=None, same_strength=True, in_stock=False):
+        """
+        Find medicines with the same active ingredients as a medicine.
+
+        Args:
+            medicine_id: Medicine to replace
+            limit: Maximum number of substitutes (None for all)
+            same_strength: Also require every strength to match
+            in_stock: Only return medicines with stock
+
+        Returns:
+            list: Medicine ids, most stock first
+        """
+        with self._lock:
+            parsed = self._compositions.get(medicine_id)
+            if not parsed:
+                return []
+            ingredients = {ingredient for ingredient, _ in parsed}
+            rarest = min(ingredients, key=lambda ingredient: len(self._postings[ingredient]))
+
+            matches = []
+            for candidate in self._postings[rarest]:
+                if candidate == medicine_id or (in_stock and self._stock[candidate] <= 0):
+                    continue
+                candidate_parsed = self._compositions[candidate]
+                if same_strength:
+                    if candidate_parsed != parsed:
+                        continue
+                elif {ingredient for ingredient, _ in candidate_parsed} != ingredients:
+                    continue
+                matches.append(candidate)
+
+            matches.sort(key=lambda candidate: (-self._stock[candidate], candidate))
+        return matches if limit is None else matches[:limit]
@@ -0,0 +1,277 @@
+"""
+Inventory utility functions for resolving extracted medicine names.
+Matches every name against the inventory in a fixed number of queries,
+and takes dispensed medicines out of stock without lost updates.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Medicine, Prescription
+from .index_utils import get_medicine_index
+from .search_utils import medicine_autocomplete_index
+from .alternatives_utils import alternatives_graph, suggest_alternatives
+from .stats_utils import dashboard_stats
+
+
+class InsufficientStock(Exception):
+    """Raised when a medicine has less stock than requested; nothing is dispensed."""
+
+    def __init__(self, shortages):
+        # {medicine id: (requested, available)}
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for {len(shortages)} medicine(s)")
+
+
+class AlreadyDispensed(Exception):
+    """Raised when a prescription has been dispensed before."""
+
+
+def resolve_medicines(medicine_names):
+    """
+    Resolve extracted medicine names against the inventory.
+
+    Every name is matched against the in-memory name index, which
+    tolerates OCR noise. A name is only resolved to a medicine when the
+    match is unambiguous and the strengths agree (see
+    MedicineNameIndex.match); otherwise it comes back as 'Needs
+    Confirmation' with the close candidates as suggestions, so a
+    different drug or dose is never dispensed in its place. Matched
+    medicines are then loaded in a single query, which also looks up
+    names the index missed by exact name, in case they were written by
+    another process since the index last synced (see sync_utils).
+    Alternatives come from the in-memory alternatives graph, followed by
+    a single query for the suggested medicines, regardless of how many
+    names are passed in.
+
+    Args:
+        medicine_names: List of medicine names from extract_medicine_names
+
+    Returns:
+        list: One result dict per name with medicine_name, status, stock,
+              alternative (the best suggestion, or None), alternatives
+              (all suggestions, best first) and suggestions ("did you
+              mean" candidates for 'Needs Confirmation' names)
+    """
+    names = [name for name in medicine_names if name and name.strip()]
+    if not names:
+        return []
+
+    # Match names in memory, then load all matched and suggested rows by primary key
+    index = get_medicine_index()
+    matched_ids = {}
+    candidates = {}
+    for name in names:
+        match, others = index.match(name)
+        if match is not None:
+            matched_ids[name] = match.id
+        candidates[name] = others
+
+    unmatched = [name for name in names if name not in matched_ids]
+    suggested_ids = {c.id for name in unmatched for c in candidates[name]}
+    medicines = {
+        medicine.id: medicine
+        for medicine in Medicine.objects.filter(
+            Q(id__in=set(matched_ids.values()) | suggested_ids) | Q(name__in=unmatched)
+        )
+    }
+    by_name = {medicine.name.lower(): medicine for medicine in medicines.values()}
+    matches = {
+        name: medicines.get(matched_ids[name]) if name in matched_ids else by_name.get(name.lower())
+        for name in names
+    }
+
+    alternatives = suggest_alternatives(m.id for m in matches.values() if m)
+
+    results = []
+    for name in names:
+        medicine = matches[name]
+        if medicine is None:
+            suggestions = [
+                {'name': medicines[c.id].name, 'stock': medicines[c.id].stock_quantity, 'score': c.score}
+                for c in candidates[name] if c.id in medicines
+            ]
+            results.append({
+                'medicine_name': name,
+                'status': 'Needs Confirmation' if suggestions else 'Not Found',
+                'stock': None,
+                'alternative': None,
+                'alternatives': [],
+                'suggestions': suggestions
+            })
+            continue
+
+        suggestions = alternatives.get(medicine.id, [])
+        alternative = suggestions[0] if suggestions else None
+
+        if medicine.stock_quantity > 0:
+            results.append({
+                'medicine_name': medicine.name,
+                'status': 'Available',
+                'stock': medicine.stock_quantity,
+                'alternative': alternative,
+                'alternatives': suggestions
+            })
+        else:
+            results.append({
+                'medicine_name': medicine.name,
+                'status': 'Out of Stock',
+                'stock': 0,
+                'alternative': alternative,
+                'alternatives': suggestions
+            })
+
+    return results
+
+
+def sync_stock(stocks, newly_low=0):
+    """
+    Push new stock levels into the in-memory indexes once the transaction commits.
+
+    Conditional UPDATEs bypass the post_save handlers, so dispensing
+    calls this instead. newly_low counts medicines that have just
+    dropped below their reorder point.
+    """
+    def apply():
+        for medicine_id, stock in stocks.items():
+            medicine_autocomplete_index.set_stock(medicine_id, stock)
+            alternatives_graph.set_stock(medicine_id, stock)
+        dashboard_stats.add('low_stock_medicines', newly_low)
+
+    transaction.on_commit(apply)
+
+
+def _take_stock(quantities):
+    """
+    Decrement stock with one conditional UPDATE per medicine.
+
+    Each UPDATE only matches while stock_quantity >= the quantity, so
+    stock never goes negative and concurrent dispenses cannot overwrite
+    each other. Must run inside a transaction; rows are updated in id
+    order so concurrent batches lock them in the same order.
+
+    Returns:
+        tuple: (new stock per medicine id, number of medicines that have
+                just dropped below their reorder point)
+
+    Raises:
+        InsufficientStock: If any medicine is short (the caller's
+            transaction must then roll back)
+    """
+    now = timezone.now()
+    short = []
+    for medicine_id in sorted(quantities):
+        updated = Medicine.objects.filter(
+            id=medicine_id, stock_quantity__gte=quantities[medicine_id]
+        ).update(stock_quantity=F('stock_quantity') - quantities[medicine_id], updated_at=now)
+        if not updated:
+            short.append(medicine_id)
+    # Stock only went down, so flags can only turn on
+    newly_low = Medicine.objects.filter(
+        id__in=quantities, needs_reorder=False, stock_quantity__lt=F('reorder_point')
+    ).update(needs_reorder=True)
+
+    stocks = dict(
+        Medicine.objects.filter(id__in=quantities).values_list('id', 'stock_quantity')
+    )
+    missing = set(quantities) - set(stocks)
+    if missing:
+        raise Medicine.DoesNotExist(f"Medicine(s) not found: {sorted(missing)}")
+    if short:
+        raise InsufficientStock({
+            medicine_id: (quantities[medicine_id], stocks[medicine_id]) for medicine_id in short
+        })
+    return stocks, newly_low
+
+
+def dispense_medicines(quantities):
+    """
+    Take several medicines out of stock, all or nothing.
+
+    Args:
+        quantities: Mapping of medicine id to a positive quantity
+
+    Returns:
+        dict: New stock per medicine id
+
+    Raises:
+        InsufficientStock: If any medicine is short; no stock changes
+        Medicine.DoesNotExist: If a medicine does not exist
+    """
+    with transaction.atomic():
+        stocks, newly_low = _take_stock(quantities)
+        sync_stock(stocks, newly_low)
+    return stocks
+
+
+def dispense_medicine(medicine_id, quantity=1):
+    """Take one medicine out of stock; returns its new stock (see dispense_medicines)."""
+    return dispense_medicines({medicine_id: quantity})[medicine_id]
+
+
+def prescription_quantities(prescription, quantities=None):
+    """
+    Work out what dispensing a prescription takes out of stock.
+
+    Every medicine that was 'Available' when the prescription was
+    processed is dispensed once, unless quantities says otherwise.
+    'Out of Stock' medicines are skipped (the pharmacist substitutes an
+    alternative) unless quantities names them, e.g. after a restock.
+
+    Args:
+        prescription: Completed Prescription
+        quantities: Optional mapping of medicine name to quantity (0 skips it)
+
+    Returns:
+        dict: Mapping of medicine id to quantity
+    """
+    quantities = quantities or {}
+    names = {}
+    for result in prescription.results_json or []:
+        name = result.get('medicine_name')
+        if result.get('status') == 'Available' or (
+            result.get('status') == 'Out of Stock' and name in quantities
+        ):
+            names[name] = names.get(name, 0) + 1
+    for name, quantity in quantities.items():
+        if name in names:
+            names[name] = quantity
+
+    ids = dict(Medicine.objects.filter(name__in=names).values_list('name', 'id'))
+    needed = {}
+    for name, quantity in names.items():
+        if quantity > 0 and name in ids:
+            needed[ids[name]] = needed.get(ids[name], 0) + quantity
+    return needed
+
+
+def dispense_prescription(prescription, quantities=None):
+    """
+    Dispense every medicine on a prescription in one transaction.
+
+    The prescription is marked dispensed with a conditional UPDATE in
+    the same transaction, so it cannot be dispensed twice even by
+    concurrent requests.
+
+    Args:
+        prescription: Completed Prescription
+        quantities: Optional mapping of medicine name to quantity
+
+    Returns:
+        dict: New stock per dispensed medicine id
+
+    Raises:
+        AlreadyDispensed: If the prescription was dispensed before
+        InsufficientStock: If any medicine is short; nothing is dispensed
+    """
+    needed = prescription_quantities(prescription, quantities)
+    with transaction.atomic():
+        now = timezone.now()
+        marked = Prescription.objects.filter(
+            id=prescription.id, dispensed_at__isnull=True
+        ).update(dispensed_at=now)
+        if not marked:
+            raise AlreadyDispensed(f"Prescription {prescription.id} was already dispensed")
+        stocks, newly_low = _take_stock(needed) if needed else ({}, 0)
+        sync_stock(stocks, newly_low)
+    prescription.dispensed_at = now
+    return stocks
@@ -0,0 +1,58 @@
+"""
+Management command to fill prescription_lines from existing results_json.
+Usage: python manage.py backfill_prescription_lines [--chunk-size 500] [--rebuild]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from pharmacy_app.models import Prescription, PrescriptionLine
+from pharmacy_app.analytics_utils import build_prescription_lines
+from pharmacy_app.pagination import iter_keyset
+
+
+class Command(BaseCommand):
+    help = 'Write a PrescriptionLine for every row of completed prescriptions\' results_json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.BATCH_INSERT_SIZE,
+                            help='Prescriptions per read and bulk insert')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Delete all existing lines first')
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        if options['rebuild']:
+            deleted, _ = PrescriptionLine.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} existing line(s)")
+
+        # Stream in keyset chunks so memory stays bounded on MySQL
+        rows = iter_keyset(
+            Prescription.objects.filter(status=Prescription.STATUS_COMPLETED)
+            .values('id', 'created_at', 'results_json'),
+            ('id',),
+            chunk_size=chunk_size
+        )
+        prescriptions = written = 0
+        chunk = []
+        for row in rows:
+            chunk.append((row['id'], row['created_at'], row['results_json']))
+            if len(chunk) >= chunk_size:
+                written += self._flush(chunk)
+                prescriptions += len(chunk)
+                chunk = []
+        written += self._flush(chunk)
+        prescriptions += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {prescriptions} prescription(s), {written} line(s) written or already present"
+        ))
+        self.stdout.write("Run rebuild_rollups to bring the daily rollups up to date")
+
+    def _flush(self, chunk):
+        if not chunk:
+            return 0
+        lines = build_prescription_lines(chunk)
+        # Lines already written (by the pipeline or an earlier run) are skipped
+        with transaction.atomic():
+            PrescriptionLine.objects.bulk_create(lines, ignore_conflicts=True)
+        return len(lines)
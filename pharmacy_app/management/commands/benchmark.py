@@ -0,0 +1,106 @@
+"""
+Management command to run benchmark suites.
+Usage: python manage.py benchmark index --size 50000
+       python manage.py benchmark api --option concurrency=16 --output api.json
+       python manage.py benchmark api --compare api.json
+
+Suites live in the top-level benchmarks package and each runs in a
+scratch database, never the configured one. --output saves the results
+with the git commit, database and Python version they were measured
+on; --compare prints the change of every number against such a file,
+so runs on two commits can be diffed.
+"""
+import inspect
+import json
+import platform
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from benchmarks import SUITES, compare_results, run_suite
+
+
+def parse_option(text):
+    """Parse KEY=VALUE, converting the value to int or float where possible."""
+    key, sep, value = text.partition('=')
+    if not sep or not key:
+        raise CommandError(f"Options must look like KEY=VALUE, got '{text}'")
+    for convert in (int, float):
+        try:
+            return key, convert(value)
+        except ValueError:
+            pass
+    return key, value
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark suite and print its results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument('--size', type=int, help='Synthetic dataset size')
+        parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                            help='Other suite parameter, e.g. concurrency=16 (repeatable)')
+        parser.add_argument('--output', help='Save the results and run details to this JSON file')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Print the change of every number against a saved --output file')
+
+    def handle(self, *args, **options):
+        kwargs = dict(parse_option(option) for option in options['option'])
+        if options['size']:
+            kwargs['size'] = options['size']
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+            if baseline.get('suite') != options['suite']:
+                raise CommandError(f"{options['compare']} holds '{baseline.get('suite')}' results")
+
+        suite = SUITES[options['suite']]
+        unknown = set(kwargs) - set(inspect.signature(suite).parameters)
+        if unknown:
+            raise CommandError(
+                f"'{options['suite']}' has no option(s) {', '.join(sorted(unknown))}; "
+                f"it takes {', '.join(inspect.signature(suite).parameters)}"
+            )
+
+        results = run_suite(options['suite'], **kwargs)
+        self.stdout.write(json.dumps(results, indent=2))
+
+        run = {
+            'suite': options['suite'],
+            'options': kwargs,
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'finished_at': timezone.now().isoformat(),
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(run, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+        if baseline is not None:
+            self.stdout.write(
+                f"\nAgainst {options['compare']} (commit {baseline.get('commit')}, "
+                f"{baseline.get('database')}); latencies: lower is better, rates: higher"
+            )
+            for path, old, new, change in compare_results(baseline['results'], results):
+                change = 'n/a' if change is None else f'{change:+.1f}%'
+                self.stdout.write(f'{path:60} {old:>12} {new:>12} {change:>9}')
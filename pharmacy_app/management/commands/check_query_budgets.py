@@ -0,0 +1,253 @@
+"""
+Management command to check every route against its query budget.
+Usage: python manage.py check_query_budgets [--rows 25]
+
+Seeds --rows medicines, alternatives and prescriptions, requests every
+named route in pharmacy_app/urls.py three times and fails if any request
+goes over settings.QUERY_BUDGETS: with the process-wide indexes cold,
+warm, and built but due for a sync and a dashboard recount. Queries that
+grow with --rows (N+1 patterns) push a view over its budget. Requests
+that ran upkeep (see profiling.upkeep) are checked against the route's
+'cold_queries' budget, the others against 'queries'. Everything is rolled
+back and uploaded files go to a temporary directory.
+"""
+import io
+import shutil
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import resolve, reverse
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from pharmacy_app import urls
+from pharmacy_app.alternatives_utils import get_alternatives_graph
+from pharmacy_app.index_utils import get_medicine_index
+from pharmacy_app.middleware import get_budget
+from pharmacy_app.models import Alternative, Medicine, Prescription, PrescriptionBatch, User
+from pharmacy_app.rollup_utils import record_prescription
+from pharmacy_app.search_utils import get_autocomplete_index, get_text_index
+from pharmacy_app.signals import reset_medicine_indexes
+from pharmacy_app.stats_utils import dashboard_stats
+from pharmacy_app.sync_utils import catalogue_sync
+
+
+PASSWORD = 'budget-check-password'
+
+
+def png_file(name='prescription.png'):
+    """A small valid PNG upload."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'white').save(buffer, 'PNG')
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+def csv_file(rows):
+    buffer = io.BytesIO(
+        ('name,composition,stock_quantity\n' + ''.join(
+            f'Budget Import {i},Import {i},{i}\n' for i in range(rows)
+        )).encode()
+    )
+    buffer.name = 'catalogue.csv'
+    return buffer
+
+
+def make_upkeep_due():
+    """Build every index, then make their sync and the dashboard recount due."""
+    get_medicine_index()
+    get_text_index()
+    get_autocomplete_index()
+    get_alternatives_graph()
+    catalogue_sync.synced_at = catalogue_sync.counted_at = None
+    dashboard_stats.invalidate()
+
+
+def route_path(url_name, args):
+    """
+    reverse() a route, avoiding paths that resolve to another view:
+    pharmacy_app.urls is mounted at both / and /api/, so e.g. /api/register/
+    is served by register_page.
+    """
+    path = reverse(url_name, args=args)
+    if resolve(path).url_name != url_name:
+        path = '/api' + path
+    return path
+
+
+class Command(BaseCommand):
+    help = 'Request every route with seeded data and fail if any goes over its query budget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=25,
+                            help='Medicines, alternatives and prescriptions to seed')
+
+    def handle(self, *args, **options):
+        rows = max(7, options['rows'])
+        media_root = tempfile.mkdtemp(prefix='query-budgets-')
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                QUERY_PROFILING=True,
+                QUERY_BUDGET_STRICT=False,
+                PRESCRIPTION_PIPELINE_EAGER=False,
+                ALLOWED_HOSTS=['localhost'],
+            ):
+                results = self._measure(rows)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        over = []
+        self.stdout.write(
+            f"{'route':32} {'method':7} {'cold':>5} {'due':>5} {'budget':>7} "
+            f"{'warm':>5} {'budget':>7} {'sql ms':>9}"
+        )
+        for url_name, method, profiles in results:
+            max_cold, max_sql_ms = get_budget(url_name, cold=True)
+            max_warm, _ = get_budget(url_name)
+            cold, warm, due = profiles
+            # Like the middleware: any request that ran upkeep gets the cold budget
+            failed = any(
+                profile['queries'] > (max_cold if profile['upkeep_queries'] else max_warm)
+                or profile['sql_ms'] > max_sql_ms
+                for profile in profiles
+            )
+            sql_ms = max(profile['sql_ms'] for profile in profiles)
+            line = (f"{url_name:32} {method:7} {cold['queries']:>5} {due['queries']:>5} {max_cold:>7} "
+                    f"{warm['queries']:>5} {max_warm:>7} {sql_ms:>9.1f}")
+            self.stdout.write(self.style.ERROR(line) if failed else line)
+            if failed:
+                over.append(url_name)
+
+        if over:
+            raise CommandError(f"Over budget: {', '.join(sorted(set(over)))}")
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} request(s) within budget'))
+
+    def _measure(self, rows):
+        results = []
+        with transaction.atomic():
+            requests = self._seed(rows)
+            routes = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+            missing = routes - {request[0] for request in requests}
+            if missing:
+                raise CommandError(f"No request defined for: {', '.join(sorted(missing))}")
+
+            for url_name, method, client, args, data in requests:
+                reset_medicine_indexes()
+                profiles = []
+                for attempt in ('cold', 'warm', 'due'):
+                    if attempt == 'due':
+                        make_upkeep_due()
+                    # Each request runs in a savepoint that is rolled back, so
+                    # every attempt sees the same rows
+                    with transaction.atomic():
+                        response = self._request(client, method, route_path(url_name, args), data)
+                        transaction.set_rollback(True)
+                    if response.status_code >= 400:
+                        raise CommandError(f'{method} {url_name} returned {response.status_code}: {response.content[:300]!r}')
+                    profiles.append(response.query_profile)
+                results.append((url_name, method, profiles))
+            transaction.set_rollback(True)
+        return results
+
+    def _request(self, client, method, path, data):
+        # Clients that change the session (logout) are made per request
+        client = client if isinstance(client, Client) else client()
+        data = data() if callable(data) else data
+        if method == 'GET':
+            return client.get(path, data or {})
+        if isinstance(client, APIClient):
+            files = data and any(hasattr(value, 'read') or isinstance(value, list) for value in data.values())
+            return getattr(client, method.lower())(path, data or {}, format='multipart' if files else 'json')
+        return getattr(client, method.lower())(path, data or {})
+
+    def _seed(self, rows):
+        """Create the test data and return (url name, method, client, args, data) per request."""
+        admin = User.objects.create_user('budget-admin', password=PASSWORD, role='admin')
+        Medicine.objects.bulk_create([
+            Medicine(name=f'Budget Medicine {i}', composition=f'Budgetol {i % 5}',
+                     stock_quantity=i % 7, reorder_point=5)
+            for i in range(rows)
+        ])
+        medicines = list(Medicine.objects.filter(name__startswith='Budget Medicine ').order_by('id'))
+        Alternative.objects.bulk_create([
+            Alternative(medicine=medicine, alternative_medicine=medicines[(i + 1) % rows])
+            for i, medicine in enumerate(medicines)
+        ])
+        alternative = Alternative.objects.filter(medicine=medicines[0]).first()
+
+        results = [
+            {'medicine_name': medicine.name,
+             'status': 'Available', 'stock': medicine.stock_quantity, 'alternative': None, 'alternatives': []}
+            # Stock 1 to 5, so the prescriptions can be dispensed
+            for medicine in medicines[1:6]
+        ]
+        batch = PrescriptionBatch.objects.create(uploaded_by=admin, total_files=rows)
+        Prescription.objects.bulk_create([
+            Prescription(file=f'prescriptions/budget/{i}.png', status=Prescription.STATUS_COMPLETED,
+                         results_json=results, uploaded_by=admin, batch=batch)
+            for i in range(rows)
+        ])
+        prescriptions = list(Prescription.objects.filter(uploaded_by=admin).order_by('id'))
+        for prescription in prescriptions:
+            record_prescription(prescription)
+        prescription = prescriptions[0]
+
+        anonymous = Client(SERVER_NAME='localhost')
+        def logged_in():
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(admin)
+            return client
+
+        session = logged_in()
+        api = APIClient(SERVER_NAME='localhost')
+        api.force_authenticate(admin)
+        refresh = str(RefreshToken.for_user(admin))
+        medicine = medicines[1]
+
+        return [
+            ('login', 'GET', anonymous, [], None),
+            ('login', 'POST', Client(SERVER_NAME='localhost'), [],
+             {'username': 'budget-admin', 'password': PASSWORD}),
+            ('register_page', 'GET', anonymous, [], None),
+            ('logout', 'POST', logged_in, [], None),
+            ('dashboard', 'GET', session, [], None),
+            ('upload_prescription', 'GET', session, [], None),
+            ('upload_prescription', 'POST', session, [], lambda: {'file': png_file()}),
+            ('results', 'GET', session, [prescription.id], None),
+            ('inventory', 'GET', session, [], None),
+            ('inventory', 'GET', session, [], {'search': 'Budget'}),
+            ('admin_dashboard', 'GET', session, [], None),
+            ('manage_alternatives', 'GET', session, [], None),
+            ('manage_alternatives', 'POST', session, [],
+             {'medicine': medicines[0].id, 'alternative_medicine': medicines[-1].id}),
+            ('delete_alternative', 'POST', session, [alternative.id], None),
+            ('token_obtain_pair', 'POST', APIClient(SERVER_NAME='localhost'), [],
+             {'username': 'budget-admin', 'password': PASSWORD}),
+            ('token_refresh', 'POST', APIClient(SERVER_NAME='localhost'), [], {'refresh': refresh}),
+            ('register', 'POST', APIClient(SERVER_NAME='localhost'), [],
+             {'username': 'budget-new-user', 'password': PASSWORD}),
+            ('api_upload_prescription', 'POST', api, [], lambda: {'file': png_file()}),
+            ('api_prescription_history', 'GET', api, [], None),
+            ('api_prescription_status', 'GET', api, [prescription.id], None),
+            ('api_upload_prescription_batch', 'POST', api, [],
+             lambda: {'files': [png_file(f'{i}.png') for i in range(5)]}),
+            ('api_prescription_batch_status', 'GET', api, [batch.id], None),
+            ('api_dispense_prescription', 'POST', api, [prescriptions[1].id], None),
+            ('api_medicines', 'GET', api, [], None),
+            ('api_medicines', 'POST', api, [], {'name': 'Budget New Medicine', 'stock_quantity': 5}),
+            ('api_medicine_detail', 'GET', api, [medicine.id], None),
+            ('api_medicine_detail', 'PUT', api, [medicine.id], {'stock_quantity': 50}),
+            ('api_medicine_detail', 'DELETE', api, [medicines[-1].id], None),
+            ('api_dispense_medicine', 'POST', api, [medicines[6 % rows].id], {'quantity': 1}),
+            ('api_import_medicines', 'POST', api, [], lambda: {'file': csv_file(rows)}),
+            ('api_export_medicines', 'GET', api, [], None),
+            ('api_reorder_queue', 'GET', api, [], None),
+            ('api_search_medicine', 'GET', api, [], {'q': 'budget medicine'}),
+            ('api_autocomplete_medicine', 'GET', api, [], {'q': 'Budget Med'}),
+            ('api_demand_analytics', 'GET', api, [], None),
+            ('api_demand_analytics', 'GET', api, [], {'group_by': 'day'}),
+            ('metrics', 'GET', session, [], None),
+        ]
@@ -0,0 +1,72 @@
+"""
+Management command to suggest alternatives from medicine compositions.
+Usage: python manage.py discover_alternatives [--max-per-medicine 5] [--any-strength] [--dry-run]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from pharmacy_app.models import Medicine, Alternative
+from pharmacy_app.ingredient_utils import IngredientIndex
+from pharmacy_app.pagination import iter_keyset
+
+
+class Command(BaseCommand):
+    help = 'Create Alternative rows between medicines with the same composition.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-per-medicine', type=int, default=5,
+                            help='Most alternatives to add per medicine (best stocked first)')
+        parser.add_argument('--any-strength', action='store_true',
+                            help='Match ingredients only, ignoring strengths')
+        parser.add_argument('--out-of-stock', action='store_true',
+                            help='Only add alternatives for medicines that are out of stock')
+        parser.add_argument('--chunk-size', type=int, default=settings.BATCH_INSERT_SIZE,
+                            help='Rows per bulk insert')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the suggestions without saving them')
+
+    def handle(self, *args, **options):
+        # Stream the catalogue in keyset chunks so memory stays bounded on MySQL
+        rows = iter_keyset(
+            Medicine.objects.values('id', 'name', 'composition', 'stock_quantity'), ('id',)
+        )
+        index = IngredientIndex()
+        index.build(
+            (row['id'], row['name'], row['composition'], row['stock_quantity']) for row in rows
+        )
+        self.stdout.write(f"Indexed {len(index)} medicine(s) with a composition")
+
+        sources = index.ids(out_of_stock=options['out_of_stock'])
+
+        chunk_size = max(1, options['chunk_size'])
+        before = Alternative.objects.count()
+        proposed = 0
+        chunk = []
+        for medicine_id in sorted(sources):
+            for alternative_id in index.substitutes(
+                medicine_id,
+                limit=options['max_per_medicine'],
+                same_strength=not options['any_strength']
+            ):
+                chunk.append(Alternative(medicine_id=medicine_id, alternative_medicine_id=alternative_id))
+            if len(chunk) >= chunk_size:
+                proposed += self._flush(chunk, options['dry_run'])
+                chunk = []
+        proposed += self._flush(chunk, options['dry_run'])
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Would propose {proposed} alternative(s)"))
+            return
+
+        created = Alternative.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f"Proposed {proposed} alternative(s); {created} new, "
+            f"{proposed - created} already existed"
+        ))
+
+    def _flush(self, chunk, dry_run):
+        if chunk and not dry_run:
+            # Existing pairs are left as they are (unique on medicine, alternative_medicine)
+            with transaction.atomic():
+                Alternative.objects.bulk_create(chunk, ignore_conflicts=True)
+        return len(chunk)
@@ -0,0 +1,46 @@
+"""
+Management command to export the medicine catalogue.
+Usage: python manage.py export_medicines [catalogue.csv | catalogue.parquet | -] [--format csv]
+"""
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy_app.catalogue_utils import (
+    CATALOGUE_FORMATS,
+    CatalogueImportError,
+    detect_format,
+    iter_csv_export,
+    write_parquet_export,
+)
+
+
+class Command(BaseCommand):
+    help = 'Stream the medicine catalogue to a CSV or Parquet file (CSV to stdout with -).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, or - for stdout')
+        parser.add_argument('--format', choices=CATALOGUE_FORMATS,
+                            help='File format (default: from the file extension)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+
+        if file_format == 'parquet':
+            if path == '-':
+                raise CommandError("Parquet export needs an output file")
+            try:
+                count = write_parquet_export(path)
+            except CatalogueImportError as e:
+                raise CommandError(str(e))
+            self.stderr.write(f"Exported {count} medicine(s) to {path}")
+            return
+
+        if path == '-':
+            sys.stdout.writelines(iter_csv_export())
+            return
+        count = -1
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for line in iter_csv_export():
+                f.write(line)
+                count += 1
+        self.stderr.write(f"Exported {count} medicine(s) to {path}")
@@ -0,0 +1,50 @@
+"""
+Management command to import a medicine catalogue file.
+Usage: python manage.py import_medicines catalogue.csv [--format parquet] [--chunk-size 1000] [--dry-run]
+"""
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy_app.catalogue_utils import (
+    CATALOGUE_FORMATS,
+    CatalogueImportError,
+    detect_format,
+    import_medicines_file,
+)
+
+
+class Command(BaseCommand):
+    help = 'Upsert medicines from a CSV or Parquet file, matching existing ones by name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or Parquet file with a name column')
+        parser.add_argument('--format', choices=CATALOGUE_FORMATS,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=settings.CATALOGUE_IMPORT_CHUNK_SIZE,
+                            help='Rows per bulk upsert')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the file without saving anything')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as f:
+                report = import_medicines_file(
+                    f,
+                    file_format=file_format,
+                    chunk_size=max(1, options['chunk_size']),
+                    dry_run=options['dry_run']
+                )
+        except (OSError, CatalogueImportError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['imported']} of {report['rows']} row(s) "
+            f"({report['invalid']} invalid) in {report['seconds']}s, "
+            f"{report['rows_per_second']} rows/s"
+        ))
+        if options['verbosity'] > 1:
+            self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,38 @@
+"""
+Management command to drain the prescription processing queue.
+Usage: python manage.py process_prescriptions [--workers 4] [--stale-after 30]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from pharmacy_app.ocr_utils import shutdown_ocr_pool
+from pharmacy_app.pipeline import (
+    pending_prescription_ids,
+    requeue_stale,
+    run_prescription_job,
+)
+
+
+class Command(BaseCommand):
+    help = 'Process pending prescriptions, e.g. after a restart or from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker threads')
+        parser.add_argument('--stale-after', type=int, default=30,
+                            help='Requeue prescriptions processing for longer than this many minutes')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale prescription(s)")
+
+        prescription_ids = pending_prescription_ids()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+                list(executor.map(run_prescription_job, prescription_ids))
+        finally:
+            shutdown_ocr_pool()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(prescription_ids)} pending prescription(s)"
+        ))
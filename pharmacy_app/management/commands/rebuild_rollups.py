@@ -0,0 +1,31 @@
+"""
+Management command to recompute the daily prescription rollups.
+Usage: python manage.py rebuild_rollups [--since 2026-01-31] [--chunk-size 500]
+"""
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy_app.rollup_utils import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily rollups from prescriptions\' results_json (idempotent).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild, YYYY-MM-DD (default: all days)')
+        parser.add_argument('--chunk-size', type=int, default=settings.BATCH_INSERT_SIZE,
+                            help='Prescriptions per read and rows per bulk insert')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date (YYYY-MM-DD)")
+
+        report = rebuild_rollups(since=since, chunk_size=max(1, options['chunk_size']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {report['prescriptions']} prescription(s), wrote {report['days']} day(s) "
+            f"and {report['medicine_days']} medicine-day row(s)"
+        ))
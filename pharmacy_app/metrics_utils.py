@@ -0,0 +1,261 @@
+"""
+Per-stage latency tracing for the prescription pipeline.
+Stages are timed with Trace.span(); each duration is stored on the
+prescription (Prescription.timings) and added to process-wide
+histograms, which /metrics exports in the Prometheus text format.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_local = threading.local()
+
+
+class Histogram:
+    """Latency histogram with fixed cumulative buckets (seconds), as Prometheus defines them."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # One count per bucket plus the +Inf bucket
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def snapshot(self):
+        """Return (per-bucket counts, total count, sum) consistently."""
+        with self._lock:
+            counts = list(self._counts)
+            return counts, sum(counts), self._sum
+
+    def quantile(self, q, snapshot=None):
+        """
+        Estimate a quantile by interpolating inside its bucket, as
+        Prometheus' histogram_quantile() does.
+
+        Returns:
+            float: Seconds, or None with no observations
+        """
+        counts, count, _ = snapshot or self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    # Beyond the last bound: report the largest finite one
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class PipelineMetrics:
+    """
+    Process-wide stage histograms and tag counters.
+
+    Each process (web worker, management command) keeps its own; they
+    are not shared or persisted.
+    """
+
+    def __init__(self, buckets=None):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._tags = {}
+
+    def observe(self, stage, seconds):
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.get(stage)
+                if histogram is None:
+                    histogram = self._stages[stage] = Histogram(
+                        self._buckets or settings.METRICS_LATENCY_BUCKETS
+                    )
+        histogram.observe(seconds)
+
+    def increment(self, name, value):
+        with self._lock:
+            key = (name, value)
+            self._tags[key] = self._tags.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._tags = {}
+
+    def stage_summary(self):
+        """Return {stage: {'count', 'sum', 'p50', 'p95', 'p99'}} (seconds)."""
+        with self._lock:
+            stages = sorted(self._stages.items())
+        summary = {}
+        for stage, histogram in stages:
+            snapshot = histogram.snapshot()
+            summary[stage] = {'count': snapshot[1], 'sum': round(snapshot[2], 6)}
+            for q in QUANTILES:
+                value = histogram.quantile(q, snapshot)
+                summary[stage][f'p{int(q * 100)}'] = round(value, 6) if value is not None else None
+        return summary
+
+    def render(self):
+        """Render every metric, plus the application caches' counters, as Prometheus text."""
+        lines = [
+            '# HELP pharmacy_pipeline_stage_seconds Time spent in each prescription pipeline stage.',
+            '# TYPE pharmacy_pipeline_stage_seconds histogram',
+        ]
+        quantiles = []
+        with self._lock:
+            stages = sorted(self._stages.items())
+        for stage, histogram in stages:
+            counts, count, total = snapshot = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (None,), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound is None else format_value(bound)
+                lines.append(f'pharmacy_pipeline_stage_seconds_bucket{labels(stage=stage, le=le)} {cumulative}')
+            lines.append(f'pharmacy_pipeline_stage_seconds_sum{labels(stage=stage)} {format_value(total)}')
+            lines.append(f'pharmacy_pipeline_stage_seconds_count{labels(stage=stage)} {count}')
+            for q in QUANTILES:
+                value = histogram.quantile(q, snapshot)
+                if value is not None:
+                    quantiles.append(
+                        f'pharmacy_pipeline_stage_quantile_seconds{labels(stage=stage, quantile=format_value(q))} '
+                        f'{format_value(value)}'
+                    )
+
+        lines += [
+            '# HELP pharmacy_pipeline_stage_quantile_seconds Estimated p50/p95/p99 per stage, from the histogram buckets.',
+            '# TYPE pharmacy_pipeline_stage_quantile_seconds gauge',
+        ] + quantiles
+
+        with self._lock:
+            tags = sorted(self._tags.items())
+        for name in sorted({name for (name, _), _ in tags}):
+            metric = f'pharmacy_pipeline_{name}_total'
+            lines += [
+                f'# HELP {metric} Prescriptions processed, by {name.replace("_", " ")}.',
+                f'# TYPE {metric} counter',
+            ]
+            lines += [
+                f'{metric}{labels(**{name: value})} {count}'
+                for (tag, value), count in tags if tag == name
+            ]
+
+        lines += render_cache_metrics()
+        return '\n'.join(lines) + '\n'
+
+
+def render_cache_metrics():
+    """Hit and miss counters of every configured application cache."""
+    from .cache_utils import get_cache
+
+    hits, misses, ratios = [], [], []
+    for name in sorted(settings.PHARMACY_CACHES):
+        cache_hits, cache_misses = get_cache(name).counters()
+        lookups = cache_hits + cache_misses
+        hits.append(f'pharmacy_cache_hits_total{labels(cache=name)} {cache_hits}')
+        misses.append(f'pharmacy_cache_misses_total{labels(cache=name)} {cache_misses}')
+        ratios.append(
+            f'pharmacy_cache_hit_ratio{labels(cache=name)} '
+            f'{format_value(cache_hits / lookups if lookups else 0.0)}'
+        )
+    return [
+        '# HELP pharmacy_cache_hits_total Application cache lookups that found an entry.',
+        '# TYPE pharmacy_cache_hits_total counter',
+        *hits,
+        '# HELP pharmacy_cache_misses_total Application cache lookups that found nothing.',
+        '# TYPE pharmacy_cache_misses_total counter',
+        *misses,
+        '# HELP pharmacy_cache_hit_ratio Hits over lookups since the process started.',
+        '# TYPE pharmacy_cache_hit_ratio gauge',
+        *ratios,
+    ]
+
+
+def labels(**values):
+    """Format Prometheus labels, escaping values."""
+    pairs = []
+    for name, value in values.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value))
+
+
+pipeline_metrics = PipelineMetrics()
+
+
+class Trace:
+    """
+    Stage timings and tags for one prescription.
+
+    Use as a context manager to make it the current trace of the thread,
+    so code deeper in the pipeline can tag() it without being passed it.
+    Timings are kept in milliseconds; histograms get seconds.
+    """
+
+    def __init__(self, timings=None, metrics=None):
+        timings = timings if isinstance(timings, dict) else {}
+        self.stages = dict(timings.get('stages', {}))
+        self.tags = dict(timings.get('tags', {}))
+        self.metrics = metrics or pipeline_metrics
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'trace', None)
+        _local.trace = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.trace = self._previous
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as stage (recorded even if it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        """Record a duration measured elsewhere (e.g. time spent queued)."""
+        self.stages[stage] = round(seconds * 1000, 3)
+        self.metrics.observe(stage, seconds)
+
+    def tag(self, name, value):
+        """Record which path a stage took (e.g. ocr_engine='tesserocr')."""
+        self.tags[name] = value
+        self.metrics.increment(name, value)
+
+    def as_json(self):
+        """The value stored in Prescription.timings."""
+        return {'stages': dict(self.stages), 'tags': dict(self.tags)}
+
+
+def current_trace():
+    """Return the thread's current Trace, or None outside one."""
+    return getattr(_local, 'trace', None)
+
+
+def tag(name, value):
+    """Tag the current trace, if any; code outside the pipeline is not counted."""
+    trace = current_trace()
+    if trace is not None:
+        trace.tag(name, value)
@@ -0,0 +1,134 @@
+"""
+Per-request SQL profiling.
+Counts the queries each request runs and the time spent in them, reports
+both in a Server-Timing header and logs views that go over their budget
+in settings.QUERY_BUDGETS (keyed by URL name).
+"""
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from .profiling import in_upkeep
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised with QUERY_BUDGET_STRICT when a view goes over its budget."""
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts queries and adds up their time.
+
+    queries and seconds cover every query; the upkeep_ totals are the
+    part of them run inside profiling.upkeep().
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.upkeep_queries = 0
+        self.upkeep_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.seconds += elapsed
+            if in_upkeep():
+                self.upkeep_queries += 1
+                self.upkeep_seconds += elapsed
+
+
+def get_budget(url_name, cold=False):
+    """
+    Return the budget of a URL name, falling back to the defaults.
+
+    Args:
+        url_name: URL name the request resolved to
+        cold: True for a request that ran upkeep queries (index builds or
+              syncs, dashboard recounts), which gets the 'cold_queries'
+              budget instead of 'queries' (the same when it has none)
+
+    Returns:
+        tuple: (max queries, max SQL milliseconds)
+    """
+    budget = settings.QUERY_BUDGETS.get(url_name, {})
+    max_queries = budget.get('queries', settings.QUERY_BUDGET_DEFAULT_QUERIES)
+    if cold:
+        max_queries = budget.get('cold_queries', max_queries)
+    return (
+        max_queries,
+        budget.get('sql_ms', settings.QUERY_BUDGET_DEFAULT_SQL_MS),
+    )
+
+
+def budget_overruns(url_name, queries, sql_ms, cold=False):
+    """Return a description of each budget the request went over (empty if none)."""
+    max_queries, max_sql_ms = get_budget(url_name, cold)
+    overruns = []
+    if queries > max_queries:
+        overruns.append(f"{queries} queries > {max_queries}{' (cold)' if cold else ''}")
+    if sql_ms > max_sql_ms:
+        overruns.append(f'{sql_ms:.1f} ms SQL > {max_sql_ms} ms')
+    return overruns
+
+
+class QueryBudgetMiddleware:
+    """
+    Profile the SQL of every request.
+
+    Place it before the session and authentication middleware so their
+    queries are counted too. Queries run while a streaming response is
+    consumed happen after the view returns and are not counted. Upkeep
+    queries are counted and also reported on their own.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_PROFILING:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        sql_ms = recorder.seconds * 1000
+
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        # Read by check_query_budgets
+        response.query_profile = {
+            'url_name': url_name,
+            'queries': recorder.queries,
+            'sql_ms': round(sql_ms, 3),
+            'upkeep_queries': recorder.upkeep_queries,
+            'upkeep_sql_ms': round(recorder.upkeep_seconds * 1000, 3),
+            'total_ms': round(total_ms, 3),
+        }
+        if settings.QUERY_PROFILING_HEADERS:
+            upkeep_ms = recorder.upkeep_seconds * 1000
+            response['Server-Timing'] = (
+                f'db;dur={sql_ms:.1f};desc="{recorder.queries} queries", '
+                f'upkeep;dur={upkeep_ms:.1f};desc="{recorder.upkeep_queries} of them upkeep", '
+                f'app;dur={total_ms - sql_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+
+        overruns = budget_overruns(url_name, recorder.queries, sql_ms, cold=recorder.upkeep_queries > 0)
+        if overruns:
+            message = f"{request.method} {request.path} ({url_name}) over budget: {'; '.join(overruns)}"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
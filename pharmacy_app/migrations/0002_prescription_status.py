@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:32
+
+from django.db import migrations, models
+
+
+def mark_existing_completed(apps, schema_editor):
+    """Prescriptions uploaded before the pipeline were processed inline."""
+    Prescription = apps.get_model('pharmacy_app', 'Prescription')
+    Prescription.objects.update(status='completed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='error_message',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0002_prescription_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
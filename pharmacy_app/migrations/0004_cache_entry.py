@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0003_prescription_file_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_name', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=64)),
+                ('value', models.JSONField()),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Cache Entry',
+                'verbose_name_plural': 'Cache Entries',
+                'db_table': 'cache_entries',
+                'indexes': [models.Index(fields=['cache_name', 'last_used_at'], name='cache_entri_cache_n_3df994_idx')],
+                'unique_together': {('cache_name', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:48
+
+from django.db import migrations, models
+
+
+def backfill_results_count(apps, schema_editor):
+    """Count the stored results of existing prescriptions, in id-ordered chunks."""
+    Prescription = apps.get_model('pharmacy_app', 'Prescription')
+    last_id = 0
+    while True:
+        chunk = list(
+            Prescription.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'results_json')[:1000]
+        )
+        if not chunk:
+            break
+        for prescription in chunk:
+            results = prescription.results_json
+            prescription.results_count = len(results) if isinstance(results, list) else 0
+        Prescription.objects.bulk_update(chunk, ['results_count'])
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0005_prescription_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='results_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_results_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['uploaded_by', 'created_at'], name='prescriptio_uploade_ea40c9_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+SQLITE_FORWARD = [
+    # External-content FTS5 table over the medicines table
+    """CREATE VIRTUAL TABLE medicines_fts USING fts5(
+        name, composition, manufacturer,
+        content='medicines', content_rowid='id',
+        prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER medicines_fts_ai AFTER INSERT ON medicines BEGIN
+        INSERT INTO medicines_fts(rowid, name, composition, manufacturer)
+        VALUES (new.id, new.name, new.composition, new.manufacturer);
+    END""",
+    """CREATE TRIGGER medicines_fts_ad AFTER DELETE ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, name, composition, manufacturer)
+        VALUES ('delete', old.id, old.name, old.composition, old.manufacturer);
+    END""",
+    # Only text changes reindex; stock updates leave the FTS table alone
+    """CREATE TRIGGER medicines_fts_au AFTER UPDATE OF name, composition, manufacturer ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, name, composition, manufacturer)
+        VALUES ('delete', old.id, old.name, old.composition, old.manufacturer);
+        INSERT INTO medicines_fts(rowid, name, composition, manufacturer)
+        VALUES (new.id, new.name, new.composition, new.manufacturer);
+    END""",
+    "INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS medicines_fts_ai",
+    "DROP TRIGGER IF EXISTS medicines_fts_ad",
+    "DROP TRIGGER IF EXISTS medicines_fts_au",
+    "DROP TABLE IF EXISTS medicines_fts",
+]
+
+MYSQL_FORWARD = [
+    "CREATE FULLTEXT INDEX medicines_name_ft ON medicines (name)",
+    "CREATE FULLTEXT INDEX medicines_search_ft ON medicines (name, composition, manufacturer)",
+]
+
+MYSQL_REVERSE = [
+    "DROP INDEX medicines_search_ft ON medicines",
+    "DROP INDEX medicines_name_ft ON medicines",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Create the full-text index for the current backend, if it has one."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        for sql in MYSQL_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        try:
+            for sql in SQLITE_FORWARD:
+                schema_editor.execute(sql)
+        except OperationalError:
+            # SQLite built without FTS5; search falls back to the Python index
+            for sql in SQLITE_REVERSE:
+                schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        for sql in MYSQL_REVERSE:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_REVERSE:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0006_prescription_results_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
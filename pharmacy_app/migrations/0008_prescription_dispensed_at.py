@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0007_medicine_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='dispensed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
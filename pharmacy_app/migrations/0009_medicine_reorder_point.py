@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:35
+
+import django.core.validators
+from django.db import migrations, models
+import pharmacy_app.models
+
+
+def flag_medicines_to_reorder(apps, schema_editor):
+    """Set needs_reorder on existing medicines in one UPDATE."""
+    Medicine = apps.get_model('pharmacy_app', 'Medicine')
+    Medicine.objects.filter(stock_quantity__lt=models.F('reorder_point')).update(needs_reorder=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0008_prescription_dispensed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='needs_reorder',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='reorder_point',
+            field=models.IntegerField(default=pharmacy_app.models.default_reorder_point, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RunPython(flag_medicines_to_reorder, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0009_medicine_reorder_point'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrescriptionLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('medicine_name', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('out_of_stock', 'Out of Stock'), ('not_found', 'Not Found')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('alternative', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pharmacy_app.medicine')),
+                ('medicine', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prescription_lines', to='pharmacy_app.medicine')),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='pharmacy_app.prescription')),
+            ],
+            options={
+                'verbose_name': 'Prescription Line',
+                'verbose_name_plural': 'Prescription Lines',
+                'db_table': 'prescription_lines',
+                'ordering': ['prescription', 'position'],
+                'indexes': [models.Index(fields=['created_at', 'status'], name='prescriptio_created_44710b_idx'), models.Index(fields=['medicine', 'created_at'], name='prescriptio_medicin_e8020f_idx')],
+                'unique_together': {('prescription', 'position')},
+            },
+        ),
+    ]
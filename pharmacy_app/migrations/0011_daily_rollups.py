@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0010_prescription_line'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPrescriptionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('prescriptions', models.PositiveIntegerField(default=0)),
+                ('lines', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('out_of_stock', models.IntegerField(default=0)),
+                ('not_found', models.IntegerField(default=0)),
+                ('substituted', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Daily Prescription Stats',
+                'verbose_name_plural': 'Daily Prescription Stats',
+                'db_table': 'daily_prescription_stats',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyMedicineStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('prescribed', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('out_of_stock', models.IntegerField(default=0)),
+                ('substituted', models.IntegerField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='pharmacy_app.medicine')),
+            ],
+            options={
+                'verbose_name': 'Daily Medicine Stats',
+                'verbose_name_plural': 'Daily Medicine Stats',
+                'db_table': 'daily_medicine_stats',
+                'ordering': ['date', 'medicine'],
+                'indexes': [models.Index(fields=['medicine', 'date'], name='daily_medic_medicin_e25bdd_idx')],
+                'unique_together': {('date', 'medicine')},
+            },
+        ),
+    ]
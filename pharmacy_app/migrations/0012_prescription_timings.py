@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0011_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0012_prescription_timings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alternative',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
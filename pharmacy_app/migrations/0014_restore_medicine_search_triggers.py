@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+# On SQLite, altering a column of medicines (0009, 0013) rebuilds the table
+# and drops the FTS5 triggers created in 0007, so the full-text index stopped
+# following writes. Recreate them and reindex. Any later migration that
+# alters medicines needs the same step.
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS medicines_fts_ai",
+    "DROP TRIGGER IF EXISTS medicines_fts_ad",
+    "DROP TRIGGER IF EXISTS medicines_fts_au",
+    """CREATE TRIGGER medicines_fts_ai AFTER INSERT ON medicines BEGIN
+        INSERT INTO medicines_fts(rowid, name, composition, manufacturer)
+        VALUES (new.id, new.name, new.composition, new.manufacturer);
+    END""",
+    """CREATE TRIGGER medicines_fts_ad AFTER DELETE ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, name, composition, manufacturer)
+        VALUES ('delete', old.id, old.name, old.composition, old.manufacturer);
+    END""",
+    """CREATE TRIGGER medicines_fts_au AFTER UPDATE OF name, composition, manufacturer ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, name, composition, manufacturer)
+        VALUES ('delete', old.id, old.name, old.composition, old.manufacturer);
+        INSERT INTO medicines_fts(rowid, name, composition, manufacturer)
+        VALUES (new.id, new.name, new.composition, new.manufacturer);
+    END""",
+    "INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')",
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Recreate the FTS5 triggers, if 0007 created the FTS5 table."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medicines_fts'")
+        if cursor.fetchone() is None:
+            return
+    for sql in SQLITE_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0013_index_sync_timestamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
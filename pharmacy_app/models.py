@@ -1,6 +1,7 @@
 """
 Database models for Pharmacy AI application.
 """
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
@@ -33,14 +34,22 @@ class User(AbstractUser):
         return self.role == 'staff'
 
 
+def default_reorder_point():
+    return settings.DEFAULT_REORDER_POINT
+
+
 class Medicine(models.Model):
     """Medicine inventory model."""
     name = models.CharField(max_length=200, unique=True, db_index=True)
     composition = models.TextField(blank=True, null=True)
     stock_quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    reorder_point = models.IntegerField(default=default_reorder_point, validators=[MinValueValidator(0)])
+    # stock_quantity < reorder_point, kept by save() and reorder_utils.refresh_reorder_flags()
+    needs_reorder = models.BooleanField(default=False, db_index=True, editable=False)
     manufacturer = models.CharField(max_length=200, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed for pharmacy_app/sync_utils.py
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         db_table = 'medicines'
@@ -51,6 +60,21 @@ class Medicine(models.Model):
     def __str__(self):
         return f"{self.name} (Stock: {self.stock_quantity})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Flag as loaded, so a save can tell whether it crossed the reorder point
+        instance._loaded_needs_reorder = instance.__dict__.get('needs_reorder')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # API callers may pass form strings; the columns are integers either way
+        self.needs_reorder = int(self.stock_quantity) < int(self.reorder_point)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'stock_quantity', 'reorder_point'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'needs_reorder'}
+        super().save(*args, **kwargs)
+    
     def is_available(self):
         return self.stock_quantity > 0
 
@@ -69,7 +93,7 @@ class Alternative(models.Model):
         related_name='alternative_for',
         db_index=True
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
     class Meta:
         db_table = 'alternatives'
@@ -81,11 +105,54 @@ class Alternative(models.Model):
         return f"{self.medicine.name} -> {self.alternative_medicine.name}"
 
 
+class PrescriptionBatch(models.Model):
+    """A group of prescriptions uploaded together (many files or a ZIP)."""
+    uploaded_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='prescription_batches'
+    )
+    total_files = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'prescription_batches'
+        verbose_name = 'Prescription Batch'
+        verbose_name_plural = 'Prescription Batches'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Batch {self.id} ({self.total_files} files)"
+
+
 class Prescription(models.Model):
     """Prescription upload and processing model."""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
     file = models.FileField(upload_to='prescriptions/%Y/%m/%d/')
+    file_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     extracted_text = models.TextField(blank=True, null=True)
     results_json = models.JSONField(default=dict, blank=True)
+    # Denormalized len(results_json), so listings can skip the JSON column
+    results_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True
+    )
+    error_message = models.TextField(blank=True, null=True)
     uploaded_by = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -93,6 +160,18 @@ class Prescription(models.Model):
         blank=True,
         related_name='prescriptions'
     )
+    batch = models.ForeignKey(
+        PrescriptionBatch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='prescriptions'
+    )
+    source_name = models.CharField(max_length=255, blank=True, null=True)
+    # Set once, when the prescription's medicines are taken out of stock
+    dispensed_at = models.DateTimeField(blank=True, null=True)
+    # Per-stage durations (ms) and the paths taken; see metrics_utils.Trace
+    timings = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -101,6 +180,145 @@ class Prescription(models.Model):
         verbose_name = 'Prescription'
         verbose_name_plural = 'Prescriptions'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['uploaded_by', 'created_at']),
+        ]
     
     def __str__(self):
         return f"Prescription {self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+    
+    def save(self, *args, **kwargs):
+        # Skip when results_json was deferred with .only(); it cannot have changed
+        if 'results_json' not in self.get_deferred_fields():
+            self.results_count = len(self.results_json) if isinstance(self.results_json, list) else 0
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'results_json' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'results_count'}
+        super().save(*args, **kwargs)
+    
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+
+
+class PrescriptionLine(models.Model):
+    """One resolved medicine of a processed prescription (a row of results_json)."""
+    STATUS_AVAILABLE = 'available'
+    STATUS_OUT_OF_STOCK = 'out_of_stock'
+    STATUS_NOT_FOUND = 'not_found'
+    STATUS_CHOICES = [
+        (STATUS_AVAILABLE, 'Available'),
+        (STATUS_OUT_OF_STOCK, 'Out of Stock'),
+        (STATUS_NOT_FOUND, 'Not Found'),
+    ]
+    
+    prescription = models.ForeignKey(
+        Prescription,
+        on_delete=models.CASCADE,
+        related_name='lines'
+    )
+    # Position in results_json
+    position = models.PositiveSmallIntegerField()
+    medicine = models.ForeignKey(
+        Medicine,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='prescription_lines'
+    )
+    medicine_name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    alternative = models.ForeignKey(
+        Medicine,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    # Copied from the prescription, so analytics by day need no join
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'prescription_lines'
+        verbose_name = 'Prescription Line'
+        verbose_name_plural = 'Prescription Lines'
+        ordering = ['prescription', 'position']
+        unique_together = ['prescription', 'position']
+        indexes = [
+            models.Index(fields=['created_at', 'status']),
+            models.Index(fields=['medicine', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.medicine_name} ({self.get_status_display()}) on prescription {self.prescription_id}"
+
+
+
+class CacheEntry(models.Model):
+    """Persistent entry for the database-backed application caches."""
+    cache_name = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    value = models.JSONField()
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    last_used_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'cache_entries'
+        verbose_name = 'Cache Entry'
+        verbose_name_plural = 'Cache Entries'
+        unique_together = ['cache_name', 'key']
+        indexes = [
+            models.Index(fields=['cache_name', 'last_used_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.cache_name}:{self.key}"
+
+
+class DailyPrescriptionStats(models.Model):
+    """Prescription line totals for one day (see rollup_utils)."""
+    date = models.DateField(unique=True)
+    # Completed prescriptions with at least one line
+    prescriptions = models.PositiveIntegerField(default=0)
+    lines = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+    out_of_stock = models.IntegerField(default=0)
+    not_found = models.IntegerField(default=0)
+    # Out-of-stock lines that came with an alternative
+    substituted = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'daily_prescription_stats'
+        verbose_name = 'Daily Prescription Stats'
+        verbose_name_plural = 'Daily Prescription Stats'
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"{self.date}: {self.prescriptions} prescriptions"
+
+
+class DailyMedicineStats(models.Model):
+    """Prescription line counts for one medicine on one day (see rollup_utils)."""
+    date = models.DateField()
+    medicine = models.ForeignKey(
+        Medicine,
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    # available + out_of_stock
+    prescribed = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+    out_of_stock = models.IntegerField(default=0)
+    substituted = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'daily_medicine_stats'
+        verbose_name = 'Daily Medicine Stats'
+        verbose_name_plural = 'Daily Medicine Stats'
+        ordering = ['date', 'medicine']
+        unique_together = ['date', 'medicine']
+        indexes = [
+            models.Index(fields=['medicine', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.date}: {self.medicine_id} prescribed {self.prescribed}"
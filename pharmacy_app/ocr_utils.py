@@ -4,32 +4,378 @@ Supports Tesseract OCR and Google Vision API.
 """
 import os
 import io
+import atexit
+import hashlib
+import importlib.util
+import logging
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image
 from django.conf import settings
+from .image_utils import preprocess_image
+from .metrics_utils import tag
 
 
-def extract_text_with_tesseract(image_path):
+logger = logging.getLogger(__name__)
+
+
+class OCRUnavailableError(Exception):
+    """Raised when OCR work is refused locally (pool saturated or shut down)."""
+
+
+class OCRIncompleteError(Exception):
     """
-    Extract text from image using Tesseract OCR.
+    Raised when some scanned PDF pages could not be OCRed.
+
+    Those pages kept their (usually empty) text layer; text holds the
+    whole document as extracted, and failures one reason per page.
+    """
+
+    def __init__(self, text, failures):
+        self.text = text
+        self.failures = failures
+        super().__init__(f"OCR failed for {len(failures)} scanned page(s): {failures[0]}")
+
+
+class OCREngine:
+    """
+    Base class for OCR engines.
+
+    An engine instance may keep expensive state (loaded language data)
+    between calls, so one is created per worker thread and reused.
+    """
+
+    name = 'base'
+
+    def recognize(self, image):
+        """Return the text of a preprocessed PIL image."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the engine."""
+
+
+class PytesseractEngine(OCREngine):
+    """Runs the tesseract binary once per image through pytesseract."""
+
+    name = 'pytesseract'
+
+    def __init__(self):
+        import pytesseract
+        
+        # Set Tesseract command path if configured
+        if hasattr(settings, 'TESSERACT_CMD') and settings.TESSERACT_CMD:
+            pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+        self._pytesseract = pytesseract
+
+    def recognize(self, image):
+        return self._pytesseract.image_to_string(image, lang='eng').strip()
+
+
+class TesserocrEngine(OCREngine):
+    """
+    Keeps a Tesseract API handle (and its language data) loaded in-process.
+
+    Avoids starting a tesseract process and reloading eng.traineddata
+    for every image. Handles are not thread-safe; use one per thread.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self):
+        import tesserocr
+        
+        kwargs = {'lang': 'eng'}
+        if settings.OCR_TESSDATA_PATH:
+            kwargs['path'] = settings.OCR_TESSDATA_PATH
+        self._api = tesserocr.PyTessBaseAPI(**kwargs)
+
+    def recognize(self, image):
+        self._api.SetImage(image)
+        return self._api.GetUTF8Text().strip()
+
+    def close(self):
+        self._api.End()
+
+
+OCR_ENGINES = {
+    'tesserocr': TesserocrEngine,
+    'pytesseract': PytesseractEngine,
+}
+
+
+def create_ocr_engine(name=None):
+    """
+    Create an OCR engine by name.
     
     Args:
-        image_path: Path to the image file
+        name: Key in OCR_ENGINES, or 'auto' (default: settings.OCR_ENGINE)
+              to prefer tesserocr when it is installed
+        
+    Returns:
+        OCREngine: New engine instance
+    """
+    name = name or settings.OCR_ENGINE
+    if name != 'auto':
+        return OCR_ENGINES[name]()
+    try:
+        return TesserocrEngine()
+    except ImportError:
+        return PytesseractEngine()
+
+
+_local = threading.local()
+
+
+def ocr_engine_name():
+    """Name of the engine create_ocr_engine() uses, with 'auto' resolved."""
+    if settings.OCR_ENGINE != 'auto':
+        return settings.OCR_ENGINE
+    return 'tesserocr' if importlib.util.find_spec('tesserocr') else 'pytesseract'
+
+
+def get_local_engine():
+    """Return this thread's OCR engine, creating it on first use."""
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        engine = _local.engine = create_ocr_engine()
+    return engine
+
+
+def ocr_image(image):
+    """
+    Extract text from an in-memory PIL image using Tesseract OCR.
+    
+    Args:
+        image: PIL Image
         
     Returns:
         str: Extracted text
     """
+    # Rotate, downscale, binarize, deskew and crop before OCR
+    image, _ = preprocess_image(image)
+    
+    return get_local_engine().recognize(image)
+
+
+def ocr_file(image_path):
+    """Open an image file and OCR it (runs inside OCR pool workers)."""
+    with Image.open(image_path) as image:
+        return ocr_image(image)
+
+
+def ocr_bytes(data):
+    """OCR an encoded image held in memory (runs inside OCR pool workers)."""
+    with Image.open(io.BytesIO(data)) as image:
+        return ocr_image(image)
+
+
+def _init_ocr_worker():
+    """Load the OCR engine when a pool worker starts, not on its first image."""
     try:
-        import pytesseract
+        get_local_engine()
+    except Exception:
+        # Raising here would break the whole pool; report it per image instead
+        pass
+
+
+class OCRWorkerPool:
+    """
+    Long-lived OCR worker processes with bounded concurrency.
+
+    Each worker keeps its own warm engine. At most max_pending images are
+    accepted at once (running or queued); further callers wait up to
+    queue_timeout seconds for a slot and then get OCRUnavailableError.
+    A caller that gives up after timeout seconds gets TimeoutError, but
+    the image keeps its slot until its worker finishes. With workers=0, OCR runs inline in the calling thread.
+    """
+
+    def __init__(self, workers, max_pending, queue_timeout=30.0, timeout=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._closed = False
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawn rather than fork: the pipeline calls this from threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_ocr_worker
+                )
+            return self._executor
+
+    def ocr_file(self, image_path):
+        """
+        OCR an image file on a pool worker.
         
-        # Set Tesseract command path if configured
-        if hasattr(settings, 'TESSERACT_CMD') and settings.TESSERACT_CMD:
-            pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+        Args:
+            image_path: Path to the image file
+            
+        Returns:
+            str: Extracted text
+            
+        Raises:
+            OCRUnavailableError: If the pool is shut down or stays saturated
+        """
+        return self._run(ocr_file, image_path)
+
+    def ocr_bytes(self, data):
+        """
+        OCR an encoded image (e.g. one embedded in a PDF) on a pool worker.
         
-        # Open and process image
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image, lang='eng')
+        Args:
+            data: Image file content
+            
+        Returns:
+            str: Extracted text
+            
+        Raises:
+            OCRUnavailableError: If the pool is shut down or stays saturated
+        """
+        return self._run(ocr_bytes, data)
+
+    def _run(self, func, arg):
+        if self._closed:
+            raise OCRUnavailableError("OCR pool is shut down.")
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise OCRUnavailableError("Too many OCR requests in progress.")
+
+        with self._lock:
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        if self.workers <= 0:
+            try:
+                text = func(arg)
+            except Exception:
+                self._release(ok=False)
+                raise
+            self._release(ok=True)
+            return text
+
+        executor = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(func, arg)
+        except Exception as e:
+            self._release(ok=False)
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            raise
+        # The slot is held until the worker is done, not until the caller
+        # stops waiting: a timed-out image still occupies its worker
+        future.add_done_callback(lambda done: self._finished(done, executor))
+        return future.result(timeout=self.timeout)
+
+    def _finished(self, future, executor):
+        error = None if future.cancelled() else future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._discard(executor)
+        self._release(ok=not future.cancelled() and error is None)
+
+    def _release(self, ok):
+        with self._lock:
+            self.pending -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+
+    def _discard(self, executor):
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _queue_depth(self):
+        return max(0, self.pending - max(self.workers, 1))
+
+    def queue_depth(self):
+        """Number of accepted images waiting for a free worker."""
+        with self._lock:
+            return self._queue_depth()
+
+    def stats(self):
+        """Return worker, queue and completion counters."""
+        with self._lock:
+            return {
+                'engine': settings.OCR_ENGINE,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self.pending,
+                'queue_depth': self._queue_depth(),
+                'max_in_flight_seen': self.max_pending_seen,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and let the workers finish what they hold."""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """Return the process-wide OCR worker pool, creating it on first use."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        with _ocr_pool_lock:
+            if _ocr_pool is None:
+                _ocr_pool = OCRWorkerPool(
+                    workers=settings.OCR_WORKERS,
+                    max_pending=settings.OCR_MAX_PENDING,
+                    queue_timeout=settings.OCR_QUEUE_TIMEOUT,
+                    timeout=settings.OCR_TIMEOUT
+                )
+                atexit.register(_ocr_pool.shutdown)
+    return _ocr_pool
+
+
+def shutdown_ocr_pool(wait=True):
+    """Shut the OCR worker pool down; a later get_ocr_pool() starts a new one."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        pool, _ocr_pool = _ocr_pool, None
+    if pool is not None:
+        atexit.unregister(pool.shutdown)
+        pool.shutdown(wait=wait)
+
+
+def extract_text_with_tesseract(image_path):
+    """
+    Extract text from image using Tesseract OCR.
+    
+    The image is preprocessed and read on the OCR worker pool.
+    
+    Args:
+        image_path: Path to the image file
         
-        return text.strip()
+    Returns:
+        str: Extracted text
+    """
+    try:
+        return get_ocr_pool().ocr_file(image_path)
     except ImportError:
         raise Exception("pytesseract is not installed. Install it using: pip install pytesseract")
     except Exception as e:
@@ -75,6 +421,144 @@ def extract_text_with_google_vision(image_path):
         raise Exception(f"Google Vision API error: {str(e)}")
 
 
+def ocr_pdf_page_images(images):
+    """
+    OCR the embedded images of a scanned PDF page on the OCR worker pool.
+    
+    Args:
+        images: Encoded image data, as returned by iter_pdf_pages
+        
+    Returns:
+        str: Extracted text
+    """
+    pool = get_ocr_pool()
+    texts = [pool.ocr_bytes(data) for data in images]
+    return "\n".join(text for text in texts if text)
+
+
+def iter_pdf_pages(pdf_path, start, stop):
+    """
+    Yield the text layer of pages [start, stop) of a PDF, one page at a time.
+    
+    Pages without a usable text layer (scanned pages) also carry their
+    embedded images, for the caller to OCR on the bounded OCR pool.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        start: Index of the first page
+        stop: Index after the last page
+        
+    Yields:
+        tuple: (text, images) of each page, in order; images is a list of
+               encoded image data, empty for pages with a text layer
+    """
+    import PyPDF2
+    
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in pdf_reader.pages[start:stop]:
+            text = page.extract_text() or ""
+            images = []
+            if len(text.strip()) < settings.PDF_SCANNED_PAGE_MIN_CHARS:
+                try:
+                    images = [image_file.data for image_file in page.images]
+                except Exception:
+                    # No readable images; keep the text layer
+                    pass
+            yield text, images
+
+
+def ocr_pdf_pages(pages, failures):
+    """
+    Turn (text, images) pages into text, OCRing scanned pages.
+
+    A page whose OCR fails keeps its text layer, and the reason is
+    appended to failures so the caller knows the text is incomplete.
+    """
+    for text, images in pages:
+        if images:
+            try:
+                text = ocr_pdf_page_images(images) or text
+            except (OCRUnavailableError, TimeoutError) as e:
+                failures.append(str(e) or 'OCR timed out')
+            except Exception as e:
+                logger.exception("OCR of a scanned PDF page failed")
+                failures.append(f"OCR error: {e}")
+        yield text
+
+
+def extract_pdf_pages(pdf_path, start, stop):
+    """
+    Extract the (text, images) of pages [start, stop) of a PDF as a list.
+    
+    Runs in pool worker processes, so it opens the file itself. OCR of
+    scanned pages is left to the caller, so these workers never run
+    Tesseract outside the OCR pool's limits.
+    """
+    return list(iter_pdf_pages(pdf_path, start, stop))
+
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    """Return the process pool used for PDF page extraction."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                # Spawn rather than fork: the pipeline calls this from threads
+                _pdf_pool = ProcessPoolExecutor(
+                    max_workers=settings.PDF_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _pdf_pool
+
+
+def iter_pdf_text(pdf_path, failures=None):
+    """
+    Stream the text of a PDF page by page, in page order.
+    
+    Large documents are split into page ranges extracted in parallel on
+    a process pool; each page is yielded as soon as it and every page
+    before it are ready. Scanned pages are OCRed on the OCR worker pool.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        failures: Optional list that receives the reason of every page
+                  that could not be OCRed (see ocr_pdf_pages)
+        
+    Yields:
+        str: Text of each page
+    """
+    if failures is None:
+        failures = []
+    import PyPDF2
+    
+    with open(pdf_path, 'rb') as file:
+        page_count = len(PyPDF2.PdfReader(file).pages)
+    
+    if page_count < settings.PDF_PARALLEL_MIN_PAGES or settings.PDF_WORKERS <= 1:
+        yield from ocr_pdf_pages(iter_pdf_pages(pdf_path, 0, page_count), failures)
+        return
+    
+    # Two ranges per worker: each range re-parses the document, so fewer,
+    # larger ranges amortize that cost while still streaming early pages
+    chunk_size = max(1, math.ceil(page_count / (settings.PDF_WORKERS * 2)))
+    pool = get_pdf_pool()
+    futures = [
+        pool.submit(extract_pdf_pages, pdf_path, start, min(start + chunk_size, page_count))
+        for start in range(0, page_count, chunk_size)
+    ]
+    try:
+        for future in futures:
+            yield from ocr_pdf_pages(future.result(), failures)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
 def extract_text_from_pdf(pdf_path):
     """
     Extract text from PDF file.
@@ -84,21 +568,43 @@ def extract_text_from_pdf(pdf_path):
         
     Returns:
         str: Extracted text
+        
+    Raises:
+        OCRIncompleteError: If some scanned pages could not be OCRed
     """
     try:
-        import PyPDF2
+        import PyPDF2  # noqa: F401
         
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        
-        return text.strip()
+        failures = []
+        text = "\n".join(iter_pdf_text(pdf_path, failures)).strip()
     except ImportError:
         raise Exception("PyPDF2 is not installed. Install it using: pip install PyPDF2")
     except Exception as e:
         raise Exception(f"PDF extraction error: {str(e)}")
+    if failures:
+        raise OCRIncompleteError(text, failures)
+    return text
+
+
+def compute_file_hash(file_obj):
+    """
+    Compute the SHA-256 digest of a file's content.
+    
+    Args:
+        file_obj: Django File/UploadedFile or binary file object
+        
+    Returns:
+        str: Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    if hasattr(file_obj, 'chunks'):
+        for chunk in file_obj.chunks():
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: file_obj.read(64 * 1024), b''):
+            digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
 
 
 def perform_ocr(file_path):
@@ -111,11 +617,15 @@ def perform_ocr(file_path):
         
     Returns:
         str: Extracted text
+        
+    Raises:
+        OCRIncompleteError: If some pages of a scanned PDF could not be OCRed
     """
     file_ext = os.path.splitext(file_path)[1].lower()
     
     # Handle PDF files
     if file_ext == '.pdf':
+        tag('ocr_engine', 'pdf')
         return extract_text_from_pdf(file_path)
     
     # Handle image files - try Google Vision first, fallback to Tesseract
@@ -123,12 +633,15 @@ def perform_ocr(file_path):
         # Try Google Vision if API key is configured
         if settings.GOOGLE_VISION_API_KEY:
             try:
-                return extract_text_with_google_vision(file_path)
+                text = extract_text_with_google_vision(file_path)
+                tag('ocr_engine', 'google_vision')
+                return text
             except Exception:
                 # Fallback to Tesseract
                 pass
         
         # Use Tesseract OCR
+        tag('ocr_engine', ocr_engine_name())
         return extract_text_with_tesseract(file_path)
     
     raise Exception(f"Unsupported file type: {file_ext}")
@@ -0,0 +1,176 @@
+"""
+Keyset (seek) pagination helpers.
+Pages are fetched with a WHERE on the last row's sort key instead of an
+OFFSET, so every page costs the same however deep the client goes.
+"""
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _split(field):
+    return (field[1:], True) if field.startswith('-') else (field, False)
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the Q selecting rows strictly after a position.
+
+    For ordering ('name', 'id') and values (n, i) this is
+    name > n OR (name = n AND id > i); descending fields use lt.
+
+    Args:
+        ordering: Sequence of field names, '-' prefixed for descending
+        values: Values of those fields on the last row already returned
+
+    Returns:
+        Q: Filter for the rows that follow
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name, descending = _split(field)
+        lookup = f'{name}__lt' if descending else f'{name}__gt'
+        condition |= equal & Q(**{lookup: value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def row_key(row, ordering):
+    """Return the sort key of a row (model instance or values() dict)."""
+    names = [_split(field)[0] for field in ordering]
+    if isinstance(row, dict):
+        return [row[name] for name in names]
+    return [getattr(row, name) for name in names]
+
+
+def encode_cursor(values):
+    """Encode a sort key as an opaque URL-safe cursor."""
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, ordering, model=None):
+    """
+    Decode a cursor from encode_cursor, or raise ValueError.
+
+    With a model, every value is converted by its ordering field (so
+    datetimes come back as datetimes), and values that field cannot
+    hold, including None, are rejected.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Invalid cursor.')
+    if model is None:
+        return values
+
+    converted = []
+    for field, value in zip(ordering, values):
+        if value is None or isinstance(value, (list, dict)):
+            raise ValueError('Invalid cursor.')
+        try:
+            converted.append(model._meta.get_field(_split(field)[0]).to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Invalid cursor.')
+    return converted
+
+
+def iter_keyset(queryset, ordering, chunk_size=2000):
+    """
+    Iterate over a queryset in keyset-ordered chunks.
+
+    Memory stays bounded by chunk_size on every database backend (MySQL's
+    client buffers whole result sets, so iterator() alone is not enough).
+    Works with model and values() querysets; values() querysets must
+    include the ordering fields.
+
+    Yields:
+        Rows of the queryset, in ordering order
+    """
+    queryset = queryset.order_by(*ordering)
+    after = None
+    while True:
+        page = queryset if after is None else queryset.filter(keyset_filter(ordering, after))
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        after = row_key(rows[-1], ordering)
+
+
+class InvalidCursor(APIException):
+    """Rendered as a 400 {'error': ...} response, like the views' own errors."""
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = {'error': 'Invalid cursor.'}
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination for DRF views.
+
+    The ordering must end in a unique field (e.g. ('name', 'id')) so the
+    position of every row is unambiguous. Clients follow `next` (or pass
+    `cursor`) and may set `page_size` up to max_page_size.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def __init__(self, ordering, page_size=None):
+        self.ordering = tuple(ordering)
+        self.page_size = page_size or settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+        self.next_cursor = None
+        self.request = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                after = decode_cursor(cursor, self.ordering, queryset.model)
+            except ValueError:
+                raise InvalidCursor()
+            queryset = queryset.filter(keyset_filter(self.ordering, after))
+
+        # One extra row tells us whether another page exists
+        rows = list(queryset[:page_size + 1])
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = encode_cursor(row_key(rows[-1], self.ordering))
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
@@ -0,0 +1,271 @@
+"""
+Prescription processing pipeline.
+Runs the OCR -> extract -> resolve stages on a pool of local worker
+threads, using the prescriptions table itself as the job queue.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Prescription
+from .ocr_utils import perform_ocr, compute_file_hash
+from .cache_utils import get_cache
+from .ai_utils import extract_medicine_names
+from .inventory_utils import resolve_medicines
+from .rollup_utils import record_prescription
+from .metrics_utils import Trace, tag
+
+
+logger = logging.getLogger(__name__)
+
+# Columns process_prescription writes (results_count is added by Prescription.save)
+RESULT_FIELDS = [
+    'file_hash', 'extracted_text', 'results_json', 'status', 'error_message', 'timings', 'updated_at',
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide worker pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PRESCRIPTION_WORKERS,
+                    thread_name_prefix='prescription-worker'
+                )
+    return _executor
+
+
+def claim_prescription(prescription_id):
+    """
+    Atomically move a pending prescription to processing.
+
+    The conditional UPDATE guarantees only one worker (thread, process
+    or management command) ever processes a given prescription.
+
+    Returns:
+        bool: True if this caller claimed the prescription
+    """
+    claimed = Prescription.objects.filter(
+        id=prescription_id,
+        status=Prescription.STATUS_PENDING
+    ).update(status=Prescription.STATUS_PROCESSING, updated_at=timezone.now())
+    return claimed == 1
+
+
+def extract_prescription_text(prescription):
+    """
+    OCR a prescription, reusing the text of identical earlier uploads.
+
+    Looks up the file's content digest in the 'ocr' cache, then in earlier
+    completed prescriptions, and only runs OCR when both miss. Empty text
+    is never reused or cached, so a file that yielded nothing is OCRed
+    again on its next upload.
+
+    Args:
+        prescription: Prescription whose file should be read
+
+    Returns:
+        str: Extracted text
+
+    Raises:
+        OCRIncompleteError: If some scanned pages could not be OCRed; the
+                            partial text is not cached
+    """
+    if not prescription.file_hash:
+        with prescription.file.open('rb') as file:
+            prescription.file_hash = compute_file_hash(file)
+
+    cache = get_cache('ocr')
+    extracted_text = cache.get(prescription.file_hash)
+    if extracted_text:
+        tag('ocr_engine', 'cache')
+        return extracted_text
+
+    extracted_text = Prescription.objects.filter(
+        file_hash=prescription.file_hash,
+        status=Prescription.STATUS_COMPLETED,
+        extracted_text__gt=''
+    ).exclude(id=prescription.id).values_list('extracted_text', flat=True).first()
+
+    if extracted_text is None:
+        extracted_text = perform_ocr(prescription.file.path)
+    else:
+        tag('ocr_engine', 'reuse')
+
+    if extracted_text:
+        cache.set(prescription.file_hash, extracted_text)
+    return extracted_text
+
+
+def process_prescription(prescription_id):
+    """
+    Run OCR, medicine extraction and inventory resolution for a prescription.
+
+    Each stage is timed; the timings are saved with the prescription and
+    added to the /metrics histograms.
+
+    Args:
+        prescription_id: ID of a pending Prescription
+
+    Returns:
+        Prescription: The processed prescription, or None if it was not
+                      pending (already claimed by another worker)
+    """
+    if not claim_prescription(prescription_id):
+        return None
+
+    claimed_at = timezone.now()
+    start = time.perf_counter()
+    prescription = Prescription.objects.get(id=prescription_id)
+    # Keeps file_save from the upload
+    trace = Trace(prescription.timings)
+    trace.add('queue', (claimed_at - prescription.created_at).total_seconds())
+    with trace:
+        try:
+            # Perform OCR (or reuse text from an identical upload)
+            with trace.span('ocr'):
+                extracted_text = extract_prescription_text(prescription)
+            prescription.extracted_text = extracted_text
+
+            # Extract medicine names using AI
+            with trace.span('extract'):
+                medicine_names = extract_medicine_names(extracted_text)
+
+            # Check inventory and prepare results
+            with trace.span('resolve'):
+                prescription.results_json = resolve_medicines(medicine_names)
+            prescription.status = Prescription.STATUS_COMPLETED
+        except Exception as e:
+            prescription.status = Prescription.STATUS_FAILED
+            prescription.error_message = f'Error processing prescription: {str(e)}'
+        trace.tag('status', prescription.status)
+
+        # The save itself is only in the histograms; it cannot time itself
+        trace.add('processing', time.perf_counter() - start)
+        prescription.timings = trace.as_json()
+        try:
+            with trace.span('save'), transaction.atomic():
+                prescription.save(update_fields=RESULT_FIELDS)
+                if prescription.status == Prescription.STATUS_COMPLETED:
+                    record_prescription(prescription)
+        except Exception as e:
+            logger.exception("Could not save the results of prescription %s", prescription_id)
+            prescription.status = Prescription.STATUS_FAILED
+            prescription.error_message = f'Error saving results: {str(e)}'
+            mark_failed(prescription_id, prescription.error_message)
+    return prescription
+
+
+def mark_failed(prescription_id, error_message):
+    """
+    Move a prescription stuck in processing to failed.
+
+    For errors outside the stages (e.g. the results could not be saved),
+    so the row does not wait for requeue_stale.
+    """
+    try:
+        Prescription.objects.filter(
+            id=prescription_id,
+            status=Prescription.STATUS_PROCESSING
+        ).update(status=Prescription.STATUS_FAILED, error_message=error_message, updated_at=timezone.now())
+    except Exception:
+        logger.exception("Could not mark prescription %s as failed", prescription_id)
+
+
+def run_prescription_job(prescription_id):
+    """Worker entry point; worker threads manage their own DB connections."""
+    close_old_connections()
+    try:
+        process_prescription(prescription_id)
+    except Exception as e:
+        # The executor would otherwise keep the error in a future nobody reads
+        logger.exception("Prescription %s failed outside its stages", prescription_id)
+        mark_failed(prescription_id, f'Error processing prescription: {str(e)}')
+    finally:
+        close_old_connections()
+
+
+def submit_prescription(prescription):
+    """
+    Queue a saved, pending prescription for processing.
+
+    The job is handed to the worker pool once the surrounding transaction
+    commits. With PRESCRIPTION_PIPELINE_EAGER the job runs inline instead.
+    """
+    if settings.PRESCRIPTION_PIPELINE_EAGER:
+        process_prescription(prescription.id)
+        prescription.refresh_from_db()
+        return
+
+    prescription_id = prescription.id
+    transaction.on_commit(lambda: get_executor().submit(run_prescription_job, prescription_id))
+
+
+def submit_prescriptions(prescription_ids):
+    """
+    Queue many saved, pending prescriptions for processing.
+
+    Like submit_prescription, but takes ids (e.g. from a bulk insert) and
+    registers a single on-commit hook for all of them.
+    """
+    prescription_ids = list(prescription_ids)
+    if settings.PRESCRIPTION_PIPELINE_EAGER:
+        for prescription_id in prescription_ids:
+            process_prescription(prescription_id)
+        return
+
+    def enqueue():
+        executor = get_executor()
+        for prescription_id in prescription_ids:
+            executor.submit(run_prescription_job, prescription_id)
+
+    transaction.on_commit(enqueue)
+
+
+def requeue_stale(stale_after_minutes=30):
+    """
+    Return prescriptions stuck in processing (e.g. after a crash) to pending.
+
+    Returns:
+        int: Number of prescriptions requeued
+    """
+    cutoff = timezone.now() - timedelta(minutes=stale_after_minutes)
+    return Prescription.objects.filter(
+        status=Prescription.STATUS_PROCESSING,
+        updated_at__lt=cutoff
+    ).update(status=Prescription.STATUS_PENDING, updated_at=timezone.now())
+
+
+def pending_prescription_ids():
+    """Return ids of all pending prescriptions, oldest first."""
+    return list(
+        Prescription.objects.filter(status=Prescription.STATUS_PENDING)
+        .order_by('created_at')
+        .values_list('id', flat=True)
+    )
+
+
+def prescription_status_data(prescription):
+    """Build the status payload returned by the upload and status APIs."""
+    data = {
+        'prescription_id': prescription.id,
+        'status': prescription.status,
+        'created_at': prescription.created_at.isoformat(),
+        'updated_at': prescription.updated_at.isoformat(),
+        'timings': prescription.timings or {},
+    }
+    if prescription.status == Prescription.STATUS_COMPLETED:
+        data['extracted_text'] = prescription.extracted_text
+        data['results'] = prescription.results_json or []
+    elif prescription.status == Prescription.STATUS_FAILED:
+        data['error'] = prescription.error_message
+    return data
@@ -0,0 +1,33 @@
+"""
+Markers for request profiling.
+Domain modules mark their cache upkeep here; the query budget middleware
+reads the marker, so the domain code does not depend on the middleware.
+"""
+import threading
+from contextlib import contextmanager
+
+
+_upkeep = threading.local()
+
+
+@contextmanager
+def upkeep():
+    """
+    Mark the queries run inside as cache upkeep.
+
+    For per-process caches (index builds and syncs, dashboard recounts):
+    their queries run once per process or per interval, on whichever
+    request happens to find the cache cold or due. They still count
+    towards the request's total; a request that ran any is checked
+    against its route's cold budget instead of the warm one.
+    """
+    _upkeep.depth = getattr(_upkeep, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _upkeep.depth -= 1
+
+
+def in_upkeep():
+    """Return True inside an upkeep() block on this thread."""
+    return getattr(_upkeep, 'depth', 0) > 0
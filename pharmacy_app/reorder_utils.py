@@ -0,0 +1,94 @@
+"""
+Reorder queue for medicines below their reorder point.
+Medicines carry a materialized, indexed needs_reorder flag; the queue
+ranks the flagged ones by days of cover at recent prescription demand.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .analytics_utils import demand_per_medicine
+from .cache_utils import get_cache, SingleFlight
+from .models import Medicine
+
+_demand_flight = SingleFlight()
+
+
+def refresh_reorder_flags(queryset=None):
+    """
+    Recompute needs_reorder with one UPDATE, for writes that bypass Medicine.save().
+
+    Args:
+        queryset: Medicines to refresh (default: all)
+
+    Returns:
+        int: Number of rows updated
+    """
+    if queryset is None:
+        queryset = Medicine.objects.all()
+    return queryset.update(needs_reorder=Case(
+        When(stock_quantity__lt=F('reorder_point'), then=Value(True)),
+        default=Value(False),
+    ))
+
+
+def count_demand(days):
+    """
+    Count how often each medicine was prescribed in the last days days.
+
+    Returns:
+        dict: Medicine id to number of prescription lines
+    """
+    return demand_per_medicine(timezone.now() - timedelta(days=days))
+
+
+def get_demand(days=None):
+    """Return count_demand(days), cached for the 'demand' cache's timeout."""
+    days = days or settings.REORDER_DEMAND_DAYS
+    cache = get_cache('demand')
+    key = f'demand:{days}'
+    demand = cache.get(key)
+    if demand is None:
+        demand = _demand_flight.do(key, count_demand, days)
+        cache.set(key, demand)
+    return demand
+
+
+def days_of_cover(stock, daily_demand):
+    """Days the stock lasts at daily_demand, or None if nothing is being prescribed."""
+    if not daily_demand:
+        return None
+    return round(stock / daily_demand, 1)
+
+
+def reorder_queue(days=None):
+    """
+    List every medicine below its reorder point, most urgent first.
+
+    Only flagged rows are read (an index lookup on needs_reorder). They
+    are ordered by days of cover; medicines with no recent demand come
+    last, by how far they are below their reorder point.
+
+    Returns:
+        list: Dicts with id, name, stock_quantity, reorder_point,
+              daily_demand and days_of_cover
+    """
+    days = days or settings.REORDER_DEMAND_DAYS
+    demand = get_demand(days)
+    queue = []
+    # No ORDER BY (the rows are sorted below), so the needs_reorder index is used
+    for row in Medicine.objects.filter(needs_reorder=True).order_by().values(
+        'id', 'name', 'stock_quantity', 'reorder_point'
+    ).iterator(chunk_size=2000):
+        daily_demand = demand.get(row['id'], 0) / days
+        row['daily_demand'] = round(daily_demand, 3)
+        row['days_of_cover'] = days_of_cover(row['stock_quantity'], daily_demand)
+        queue.append(row)
+
+    queue.sort(key=lambda row: (
+        row['days_of_cover'] is None,
+        row['days_of_cover'] if row['days_of_cover'] is not None else 0,
+        row['stock_quantity'] - row['reorder_point'],
+        row['id'],
+    ))
+    return queue
@@ -0,0 +1,268 @@
+"""
+Daily rollups of prescription lines.
+Per-day and per-day-per-medicine counters are adjusted as each
+prescription finishes processing, so reports read O(days) rows instead
+of scanning lines. rebuild_rollups() recomputes them from results_json.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .analytics_utils import build_prescription_lines, save_prescription_lines, with_rates
+from .models import DailyMedicineStats, DailyPrescriptionStats, Prescription, PrescriptionLine
+from .pagination import iter_keyset
+
+
+DAY_FIELDS = ('prescriptions', 'lines', 'available', 'out_of_stock', 'not_found', 'substituted')
+MEDICINE_FIELDS = ('prescribed', 'available', 'out_of_stock', 'substituted')
+
+
+def line_date(line):
+    """The reporting day of a line (its prescription's creation date, local time)."""
+    return timezone.localtime(line.created_at).date()
+
+
+def count_lines(lines, sign=1):
+    """
+    Tally lines into rollup deltas.
+
+    Returns:
+        tuple: ({date: Counter}, {(date, medicine id): Counter})
+    """
+    days = defaultdict(Counter)
+    medicines = defaultdict(Counter)
+    for line in lines:
+        day = line_date(line)
+        substituted = line.status == PrescriptionLine.STATUS_OUT_OF_STOCK and line.alternative_id
+        days[day]['lines'] += sign
+        days[day][line.status] += sign
+        days[day]['substituted'] += sign if substituted else 0
+        if line.medicine_id is None:
+            continue
+        counts = medicines[(day, line.medicine_id)]
+        counts['prescribed'] += sign
+        counts[line.status] += sign
+        counts['substituted'] += sign if substituted else 0
+    return days, medicines
+
+
+def _increment(model, lookup, deltas):
+    """Add deltas to the row matching lookup, creating it if needed."""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another worker created the row first
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _prune(model, lookup, fields):
+    """Delete the row matching lookup if every counter is back to zero, as rebuild_rollups() writes none."""
+    model.objects.filter(**lookup, **{field: 0 for field in fields}).delete()
+
+
+def apply_deltas(days, medicines):
+    """Write rollup deltas, in key order so concurrent writers lock rows in the same order."""
+    with transaction.atomic():
+        for day in sorted(days):
+            deltas = {field: days[day][field] for field in DAY_FIELDS}
+            _increment(DailyPrescriptionStats, {'date': day}, deltas)
+            if any(value < 0 for value in deltas.values()):
+                _prune(DailyPrescriptionStats, {'date': day}, DAY_FIELDS)
+        for day, medicine_id in sorted(medicines):
+            counts = medicines[(day, medicine_id)]
+            deltas = {field: counts[field] for field in MEDICINE_FIELDS}
+            lookup = {'date': day, 'medicine_id': medicine_id}
+            _increment(DailyMedicineStats, lookup, deltas)
+            if any(value < 0 for value in deltas.values()):
+                _prune(DailyMedicineStats, lookup, MEDICINE_FIELDS)
+
+
+def record_prescription(prescription):
+    """
+    Store a completed prescription's lines and add them to the rollups.
+
+    Lines from an earlier run of the same prescription are replaced and
+    taken back out of the rollups, so reprocessing does not double count.
+    """
+    with transaction.atomic():
+        removed, added = save_prescription_lines(prescription)
+        days, medicines = count_lines(added)
+        old_days, old_medicines = count_lines(removed, sign=-1)
+        for day, counts in old_days.items():
+            days[day].update(counts)
+        for key, counts in old_medicines.items():
+            medicines[key].update(counts)
+        day = timezone.localtime(prescription.created_at).date()
+        days[day]['prescriptions'] += bool(added) - bool(removed)
+        apply_deltas(days, medicines)
+    return added
+
+
+def unrecord_prescription(prescription):
+    """
+    Take a prescription's stored lines back out of the rollups.
+
+    For a prescription about to be deleted (its lines go with it), so
+    the rollups keep matching what rebuild_rollups() would count.
+    """
+    with transaction.atomic():
+        removed = list(PrescriptionLine.objects.filter(prescription_id=prescription.id))
+        if not removed:
+            return
+        days, medicines = count_lines(removed, sign=-1)
+        days[timezone.localtime(prescription.created_at).date()]['prescriptions'] -= 1
+        apply_deltas(days, medicines)
+
+
+def rebuild_rollups(since=None, chunk_size=500):
+    """
+    Recompute the rollups from results_json, replacing what is stored.
+
+    Idempotent: rows from since onwards are deleted and rebuilt in one
+    transaction. Counts are kept in memory per day and medicine, so
+    memory grows with days x medicines, not with prescriptions.
+
+    Args:
+        since: First date to rebuild (None: everything)
+        chunk_size: Prescriptions read per query
+
+    Returns:
+        dict: prescriptions read, day rows and medicine rows written
+    """
+    prescriptions = Prescription.objects.filter(status=Prescription.STATUS_COMPLETED)
+    day_rows = DailyPrescriptionStats.objects.all()
+    medicine_rows = DailyMedicineStats.objects.all()
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, datetime.min.time()))
+        prescriptions = prescriptions.filter(created_at__gte=start)
+        day_rows = day_rows.filter(date__gte=since)
+        medicine_rows = medicine_rows.filter(date__gte=since)
+
+    days, medicines = defaultdict(Counter), defaultdict(Counter)
+    read = 0
+    chunk = []
+
+    def flush():
+        lines = build_prescription_lines(chunk)
+        chunk_days, chunk_medicines = count_lines(lines)
+        for day, counts in chunk_days.items():
+            days[day].update(counts)
+        for key, counts in chunk_medicines.items():
+            medicines[key].update(counts)
+        with_lines = {line.prescription_id for line in lines}
+        for prescription_id, created_at, _ in chunk:
+            if prescription_id in with_lines:
+                days[timezone.localtime(created_at).date()]['prescriptions'] += 1
+        chunk.clear()
+
+    rows = iter_keyset(prescriptions.values('id', 'created_at', 'results_json'), ('id',), chunk_size)
+    for row in rows:
+        chunk.append((row['id'], row['created_at'], row['results_json']))
+        read += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    with transaction.atomic():
+        day_rows.delete()
+        medicine_rows.delete()
+        DailyPrescriptionStats.objects.bulk_create(
+            [DailyPrescriptionStats(date=day, **{field: days[day][field] for field in DAY_FIELDS})
+             for day in sorted(days)],
+            batch_size=chunk_size
+        )
+        DailyMedicineStats.objects.bulk_create(
+            [DailyMedicineStats(date=day, medicine_id=medicine_id,
+                                **{field: counts[field] for field in MEDICINE_FIELDS})
+             for (day, medicine_id), counts in sorted(medicines.items())],
+            batch_size=chunk_size
+        )
+    return {'prescriptions': read, 'days': len(days), 'medicine_days': len(medicines)}
+
+
+def daily_totals(start, end):
+    """
+    Per-day totals from start to end (dates, inclusive), oldest first.
+
+    Days without prescriptions are included with zero counts.
+
+    Returns:
+        list: Dicts with date (ISO), prescriptions, demand, out_of_stock,
+              substituted, not_found, stock_out_rate and substitution_rate
+    """
+    stored = {
+        row.date: row
+        for row in DailyPrescriptionStats.objects.filter(date__gte=start, date__lte=end)
+    }
+    results = []
+    day = start
+    while day <= end:
+        row = stored.get(day)
+        results.append(with_rates({
+            'date': day.isoformat(),
+            'prescriptions': row.prescriptions if row else 0,
+            'demand': row.available + row.out_of_stock if row else 0,
+            'out_of_stock': row.out_of_stock if row else 0,
+            'substituted': row.substituted if row else 0,
+            'not_found': row.not_found if row else 0,
+        }))
+        day += timedelta(days=1)
+    return results
+
+
+def medicine_daily_totals(medicine_id, start, end):
+    """Like daily_totals, for one medicine (without prescriptions and not_found)."""
+    stored = {
+        row.date: row
+        for row in DailyMedicineStats.objects.filter(
+            medicine_id=medicine_id, date__gte=start, date__lte=end
+        )
+    }
+    results = []
+    day = start
+    while day <= end:
+        row = stored.get(day)
+        results.append(with_rates({
+            'date': day.isoformat(),
+            'demand': row.prescribed if row else 0,
+            'out_of_stock': row.out_of_stock if row else 0,
+            'substituted': row.substituted if row else 0,
+        }))
+        day += timedelta(days=1)
+    return results
+
+
+def medicine_totals(start, end, medicine_id=None, limit=100):
+    """
+    Totals per medicine from start to end (dates, inclusive), most prescribed first.
+
+    Returns:
+        list: Dicts with medicine_id, name, demand, out_of_stock,
+              substituted, stock_out_rate and substitution_rate
+    """
+    rows = DailyMedicineStats.objects.filter(date__gte=start, date__lte=end)
+    if medicine_id is not None:
+        rows = rows.filter(medicine_id=medicine_id)
+    rows = (
+        rows.values('medicine_id', 'medicine__name')
+        .annotate(demand=Sum('prescribed'), out_of_stock=Sum('out_of_stock'), substituted=Sum('substituted'))
+        .order_by('-demand', 'medicine_id')[:limit]
+    )
+    return [
+        with_rates({
+            'medicine_id': row['medicine_id'],
+            'name': row['medicine__name'],
+            'demand': row['demand'],
+            'out_of_stock': row['out_of_stock'],
+            'substituted': row['substituted'],
+        })
+        for row in rows
+    ]
@@ -0,0 +1,559 @@
+"""
+Full-text medicine search over name, composition and manufacturer.
+Uses MySQL FULLTEXT or SQLite FTS5 indexes when the database has them,
+and an in-memory inverted index otherwise.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+from django.conf import settings
+from django.db import connection
+from .models import Medicine
+from .index_utils import get_medicine_index
+from .profiling import upkeep
+
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Relative weight of a match in each field (a name match counts most)
+FIELD_WEIGHTS = {'name': 3.0, 'composition': 2.0, 'manufacturer': 1.0}
+
+FTS_TABLE = 'medicines_fts'
+MYSQL_NAME_INDEX = 'medicines_name_ft'
+MYSQL_SEARCH_INDEX = 'medicines_search_ft'
+
+# InnoDB ignores shorter words (innodb_ft_min_token_size)
+MYSQL_MIN_TOKEN_SIZE = 3
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens."""
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class MySQLFullTextBackend:
+    """
+    FULLTEXT search in boolean mode; every query term is a required prefix.
+
+    Relevance is the match score over all three fields plus a weighted
+    score over the name alone.
+    """
+
+    name = 'mysql'
+
+    def search(self, query, limit):
+        terms = [t for t in tokenize(query) if len(t) >= MYSQL_MIN_TOKEN_SIZE]
+        if not terms:
+            # Too short for the FULLTEXT index; the name index serves prefixes
+            return list(
+                Medicine.objects.filter(name__istartswith=query.strip())
+                .order_by('name').values_list('id', flat=True)[:limit]
+            )
+
+        against = ' '.join(f'+{term}*' for term in terms)
+        table = Medicine._meta.db_table
+        sql = (
+            f"SELECT id FROM {table} "
+            f"WHERE MATCH(name, composition, manufacturer) AGAINST (%s IN BOOLEAN MODE) "
+            f"ORDER BY {FIELD_WEIGHTS['name']} * MATCH(name) AGAINST (%s IN BOOLEAN MODE) "
+            f"+ MATCH(name, composition, manufacturer) AGAINST (%s IN BOOLEAN MODE) DESC, name "
+            f"LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [against, against, against, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def count_needs_reorder(self, query):
+        """Count every match (not just the first limit) that needs reordering."""
+        terms = [t for t in tokenize(query) if len(t) >= MYSQL_MIN_TOKEN_SIZE]
+        if not terms:
+            return Medicine.objects.filter(name__istartswith=query.strip(), needs_reorder=True).count()
+
+        against = ' '.join(f'+{term}*' for term in terms)
+        sql = (
+            f"SELECT COUNT(*) FROM {Medicine._meta.db_table} "
+            f"WHERE MATCH(name, composition, manufacturer) AGAINST (%s IN BOOLEAN MODE) "
+            f"AND needs_reorder"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [against])
+            return cursor.fetchone()[0]
+
+
+class SQLiteFTS5Backend:
+    """FTS5 search ranked by bm25 with per-field weights; terms are prefixes."""
+
+    name = 'sqlite'
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def count_needs_reorder(self, query):
+        """Count every match (not just the first limit) that needs reordering."""
+        terms = tokenize(query)
+        if not terms:
+            return 0
+
+        match = ' '.join(f'"{term}"*' for term in terms)
+        table = Medicine._meta.db_table
+        sql = (
+            f"SELECT COUNT(*) FROM {FTS_TABLE} JOIN {table} ON {table}.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND {table}.needs_reorder"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match])
+            return cursor.fetchone()[0]
+
+
+class MedicineTextIndex:
+    """
+    In-memory inverted index for databases without full-text search.
+
+    Postings map each token to the summed field weight per medicine.
+    A sorted token list makes prefix lookups a bisect. Every query term
+    must match as a prefix; results are ranked by weight times idf.
+    """
+
+    name = 'python'
+
+    # Tokens with more postings than this keep a pre-sorted copy, so a
+    # broad one-word query (e.g. a strength like "500") reads only the top
+    RANKED_MIN_POSTINGS = 256
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._postings = {}
+        self._ranked = {}
+        self._tokens = []
+        self.is_built = False
+
+    def build(self, rows):
+        """
+        Replace the index contents.
+
+        Args:
+            rows: Iterable of (id, name, composition, manufacturer)
+        """
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._ranked = {}
+            for row in rows:
+                self._add(*row)
+            self._tokens = sorted(self._postings)
+            self.is_built = True
+
+    def build_from_db(self):
+        """Build the index from all Medicine rows."""
+        self.build(
+            Medicine.objects.values_list('id', 'name', 'composition', 'manufacturer').iterator()
+        )
+
+    def add(self, medicine_id, name, composition, manufacturer):
+        """Add or replace a single medicine."""
+        with self._lock:
+            self._remove(medicine_id)
+            for token in self._add(medicine_id, name, composition, manufacturer):
+                index = bisect.bisect_left(self._tokens, token)
+                if index == len(self._tokens) or self._tokens[index] != token:
+                    self._tokens.insert(index, token)
+
+    def remove(self, medicine_id):
+        """Remove a single medicine, if present."""
+        with self._lock:
+            self._remove(medicine_id)
+
+    def _add(self, medicine_id, name, composition, manufacturer):
+        weights = {}
+        fields = {'name': name, 'composition': composition, 'manufacturer': manufacturer}
+        for field, text in fields.items():
+            for token in set(tokenize(text)):
+                weights[token] = weights.get(token, 0.0) + FIELD_WEIGHTS[field]
+
+        new_tokens = []
+        for token, weight in weights.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                new_tokens.append(token)
+            self._postings[token][medicine_id] = weight
+            self._ranked.pop(token, None)
+        self._docs[medicine_id] = (name, tuple(weights))
+        return new_tokens
+
+    def _remove(self, medicine_id):
+        doc = self._docs.pop(medicine_id, None)
+        if doc is None:
+            return
+        for token in doc[1]:
+            postings = self._postings[token]
+            postings.pop(medicine_id, None)
+            self._ranked.pop(token, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect.bisect_left(self._tokens, token)
+                del self._tokens[index]
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self._tokens, prefix)
+        stop = bisect.bisect_left(self._tokens, prefix + '\uffff')
+        return self._tokens[start:stop]
+
+    def _idf(self, token):
+        return math.log(1 + max(1, len(self._docs)) / len(self._postings[token]))
+
+    def _ranked_postings(self, token):
+        """Postings of a token as (-score, name, id), best first."""
+        ranked = self._ranked.get(token)
+        if ranked is None:
+            idf = self._idf(token)
+            ranked = sorted(
+                (-weight * idf, self._docs[medicine_id][0], medicine_id)
+                for medicine_id, weight in self._postings[token].items()
+            )
+            if len(ranked) >= self.RANKED_MIN_POSTINGS:
+                self._ranked[token] = ranked
+        return ranked
+
+    def _search_one(self, tokens, limit):
+        # Merge the per-token rankings; the first time an id appears is its best score
+        results, seen = [], set()
+        merged = heapq.merge(*(self._ranked_postings(token) for token in tokens))
+        for _, _, medicine_id in merged:
+            if medicine_id not in seen:
+                seen.add(medicine_id)
+                results.append(medicine_id)
+                if len(results) == limit:
+                    break
+        return results
+
+    def _matching(self, term_tokens):
+        """
+        Return the ids of medicines matching every term, using set
+        operations starting from the most selective term.
+        """
+        order = sorted(
+            range(len(term_tokens)),
+            key=lambda i: sum(len(self._postings[t]) for t in term_tokens[i])
+        )
+        candidates = None
+        for position in order:
+            matching = set()
+            for token in term_tokens[position]:
+                keys = self._postings[token].keys()
+                matching |= keys if candidates is None else keys & candidates
+            candidates = matching
+            if not candidates:
+                break
+        return candidates
+
+    def count_needs_reorder(self, query):
+        """Count every match (not just the first limit) that needs reordering."""
+        terms = tokenize(query)
+        if not terms:
+            return 0
+
+        with self._lock:
+            term_tokens = [self._prefix_tokens(term) for term in terms]
+            if not all(term_tokens):
+                return 0
+            ids = self._matching(term_tokens)
+        # The flag is not indexed in memory; one query over the matches
+        return Medicine.objects.filter(id__in=ids, needs_reorder=True).count() if ids else 0
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            term_tokens = [self._prefix_tokens(term) for term in terms]
+            if not all(term_tokens):
+                return []
+            if len(term_tokens) == 1:
+                return self._search_one(term_tokens[0], limit)
+
+            # Narrow to medicines matching every term, then score the survivors
+            candidates = self._matching(term_tokens)
+            if not candidates:
+                return []
+
+            totals = dict.fromkeys(candidates, 0.0)
+            for tokens in term_tokens:
+                best = {}
+                for token in tokens:
+                    idf = self._idf(token)
+                    postings = self._postings[token]
+                    for medicine_id in candidates & postings.keys():
+                        score = postings[medicine_id] * idf
+                        if score > best.get(medicine_id, 0.0):
+                            best[medicine_id] = score
+                for medicine_id, score in best.items():
+                    totals[medicine_id] += score
+            return heapq.nsmallest(
+                limit, totals, key=lambda i: (-totals[i], self._docs[i][0])
+            )
+
+
+# Process-wide fallback index, kept in sync by the Medicine signal handlers
+# and, for writes made elsewhere, by sync_utils
+medicine_text_index = MedicineTextIndex()
+
+
+def get_text_index():
+    """Return the process-wide fallback text index, building it on first use."""
+    from .sync_utils import sync_indexes
+    with upkeep():
+        sync_indexes()
+        if not medicine_text_index.is_built:
+            with medicine_text_index._lock:
+                if not medicine_text_index.is_built:
+                    medicine_text_index.build_from_db()
+    return medicine_text_index
+
+
+def normalize_name(text):
+    """Normalize a name for prefix matching ("Para-cetamol 500MG" -> "para cetamol 500mg")."""
+    return ' '.join(tokenize(text))
+
+
+class MedicineAutocompleteIndex:
+    """
+    In-memory typeahead index over medicine names.
+
+    Each name is stored once per word start (so "500" finds
+    "Paracetamol 500mg") in a sorted list of (key, id); a prefix is a
+    bisect range. Results are the matches with the most stock.
+
+    Narrow prefixes rank their range directly. Broad ones (a single
+    letter may match most of the catalogue) walk a list of all
+    medicines kept in stock order instead and stop after limit matches,
+    so neither case touches more than a few thousand entries.
+    """
+
+    # Ranges larger than this are answered from the stock-ordered list
+    MAX_RANGE_SCAN = 2000
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._medicines = {}
+        self._keys = []
+        self._by_stock = []
+        self.is_built = False
+
+    def build(self, rows):
+        """
+        Replace the index contents.
+
+        Args:
+            rows: Iterable of (id, name, stock_quantity)
+        """
+        with self._lock:
+            self._medicines = {}
+            keys, by_stock = [], []
+            for medicine_id, name, stock in rows:
+                entry_keys = self._entry_keys(name)
+                self._medicines[medicine_id] = (name, stock, entry_keys)
+                keys.extend((key, medicine_id) for key in entry_keys)
+                by_stock.append((-stock, name, medicine_id))
+            keys.sort()
+            by_stock.sort()
+            self._keys = keys
+            self._by_stock = by_stock
+            self.is_built = True
+
+    def build_from_db(self):
+        """Build the index from all Medicine rows."""
+        self.build(Medicine.objects.values_list('id', 'name', 'stock_quantity').iterator())
+
+    @staticmethod
+    def _entry_keys(name):
+        tokens = tokenize(name)
+        return tuple(sorted({' '.join(tokens[i:]) for i in range(len(tokens))}))
+
+    def add(self, medicine_id, name, stock):
+        """Add or replace a single medicine."""
+        with self._lock:
+            self._remove(medicine_id)
+            entry_keys = self._entry_keys(name)
+            self._medicines[medicine_id] = (name, stock, entry_keys)
+            for key in entry_keys:
+                bisect.insort(self._keys, (key, medicine_id))
+            bisect.insort(self._by_stock, (-stock, name, medicine_id))
+
+    def remove(self, medicine_id):
+        """Remove a single medicine, if present."""
+        with self._lock:
+            self._remove(medicine_id)
+
+    def set_stock(self, medicine_id, stock):
+        """Update the stock of an indexed medicine (e.g. after a dispense)."""
+        with self._lock:
+            entry = self._medicines.get(medicine_id)
+            if entry is None or entry[1] == stock:
+                return
+            name, old_stock, entry_keys = entry
+            index = bisect.bisect_left(self._by_stock, (-old_stock, name, medicine_id))
+            del self._by_stock[index]
+            bisect.insort(self._by_stock, (-stock, name, medicine_id))
+            self._medicines[medicine_id] = (name, stock, entry_keys)
+
+    def _remove(self, medicine_id):
+        entry = self._medicines.pop(medicine_id, None)
+        if entry is None:
+            return
+        name, stock, entry_keys = entry
+        for key in entry_keys:
+            index = bisect.bisect_left(self._keys, (key, medicine_id))
+            del self._keys[index]
+        index = bisect.bisect_left(self._by_stock, (-stock, name, medicine_id))
+        del self._by_stock[index]
+
+    def __len__(self):
+        return len(self._medicines)
+
+    def complete(self, query, limit=10):
+        """
+        Return the best-stocked medicines whose name has a word starting with query.
+
+        Args:
+            query: What the user has typed so far
+            limit: Maximum number of results
+
+        Returns:
+            list: (id, name, stock_quantity) tuples, most stock first
+        """
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (prefix,))
+            stop = bisect.bisect_left(self._keys, (prefix + '\uffff',))
+            if stop - start > self.MAX_RANGE_SCAN:
+                results = []
+                for negative_stock, name, medicine_id in self._by_stock:
+                    if any(key.startswith(prefix) for key in self._medicines[medicine_id][2]):
+                        results.append((medicine_id, name, -negative_stock))
+                        if len(results) == limit:
+                            break
+                return results
+
+            ids = {medicine_id for _, medicine_id in self._keys[start:stop]}
+            best = heapq.nsmallest(
+                limit, ids, key=lambda i: (-self._medicines[i][1], self._medicines[i][0])
+            )
+            return [(i, self._medicines[i][0], self._medicines[i][1]) for i in best]
+
+
+# Process-wide typeahead index, kept in sync by the Medicine signal handlers
+# and, for writes made elsewhere, by sync_utils
+medicine_autocomplete_index = MedicineAutocompleteIndex()
+
+
+def get_autocomplete_index():
+    """Return the process-wide typeahead index, building it on first use."""
+    from .sync_utils import sync_indexes
+    with upkeep():
+        sync_indexes()
+        if not medicine_autocomplete_index.is_built:
+            with medicine_autocomplete_index._lock:
+                if not medicine_autocomplete_index.is_built:
+                    medicine_autocomplete_index.build_from_db()
+    return medicine_autocomplete_index
+
+
+def fts5_table_exists():
+    """Return True if the medicines FTS5 table was created by the migration."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+_backends = {}
+
+
+def get_search_backend():
+    """
+    Return the search backend for the default database.
+
+    settings.MEDICINE_SEARCH_BACKEND selects 'mysql', 'sqlite' or
+    'python'; 'auto' picks the database's full-text index when present.
+    """
+    choice = settings.MEDICINE_SEARCH_BACKEND
+    if choice == 'auto':
+        if connection.vendor == 'mysql':
+            choice = 'mysql'
+        elif connection.vendor == 'sqlite' and fts5_table_exists():
+            choice = 'sqlite'
+        else:
+            choice = 'python'
+
+    if choice == 'python':
+        return get_text_index()
+    if choice not in _backends:
+        _backends[choice] = {'mysql': MySQLFullTextBackend, 'sqlite': SQLiteFTS5Backend}[choice]()
+    return _backends[choice]
+
+
+def count_needs_reorder(query):
+    """
+    Count the medicines matching a search that need reordering.
+
+    Counted over every full-text match, not the limited, fuzzy-padded
+    list search_medicines returns.
+    """
+    if not query or not query.strip():
+        return 0
+    return get_search_backend().count_needs_reorder(query)
+
+
+def search_medicines(query, limit=20, fuzzy=True):
+    """
+    Search medicines by name, composition and manufacturer.
+
+    Full-text matches come first, by relevance. If there are fewer than
+    limit, close name matches from the OCR-tolerant name index fill the
+    rest, so typos like "Paracetamal" still find something.
+
+    Args:
+        query: Search text; every word is matched as a prefix
+        limit: Maximum number of results
+        fuzzy: Whether to top up with fuzzy name matches
+
+    Returns:
+        list: Medicine instances, best match first
+    """
+    if not query or not query.strip():
+        return []
+
+    ids = get_search_backend().search(query, limit)
+    if fuzzy and len(ids) < limit:
+        seen = set(ids)
+        for candidate in get_medicine_index().search(query, limit=limit):
+            if candidate.id not in seen:
+                ids.append(candidate.id)
+                seen.add(candidate.id)
+        ids = ids[:limit]
+
+    medicines = Medicine.objects.in_bulk(ids)
+    return [medicines[medicine_id] for medicine_id in ids if medicine_id in medicines]
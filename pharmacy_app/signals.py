@@ -0,0 +1,108 @@
+"""
+Signal handlers for Pharmacy AI application.
+Keep in-memory indexes, dashboard counters and daily rollups in sync
+with the database.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Medicine, Alternative, Prescription
+from .index_utils import medicine_index
+from .search_utils import medicine_text_index, medicine_autocomplete_index
+from .alternatives_utils import alternatives_graph
+from .stats_utils import dashboard_stats
+from .rollup_utils import unrecord_prescription
+
+
+def reset_medicine_indexes():
+    """
+    Rebuild the in-memory medicine indexes and recount the dashboard on next use.
+
+    For bulk writes (bulk_create, update) that do not send post_save.
+    Only this process is reset; others pick the writes up when their
+    indexes next sync (see sync_utils).
+    """
+    for index in (medicine_index, medicine_text_index, medicine_autocomplete_index, alternatives_graph):
+        with index._lock:
+            index.is_built = False
+    dashboard_stats.invalidate()
+
+
+@receiver(post_save, sender=Medicine)
+def index_medicine(sender, instance, created, **kwargs):
+    """Add or refresh a medicine in the in-memory indexes once the save commits."""
+    medicine_id, name = instance.id, instance.name
+    composition, manufacturer = instance.composition, instance.manufacturer
+    # API callers may assign form strings; the indexes compare stock as an int
+    stock = int(instance.stock_quantity)
+    needs_reorder = instance.needs_reorder
+    was_low = None if created else getattr(instance, '_loaded_needs_reorder', None)
+    instance._loaded_needs_reorder = needs_reorder
+    
+    def apply():
+        medicine_index.add(medicine_id, name)
+        medicine_text_index.add(medicine_id, name, composition, manufacturer)
+        medicine_autocomplete_index.add(medicine_id, name, stock)
+        alternatives_graph.set_medicine(medicine_id, stock, composition)
+        if created:
+            dashboard_stats.add('total_medicines', 1)
+            dashboard_stats.add('low_stock_medicines', int(needs_reorder))
+        elif was_low is None:
+            # Saved without its loaded flag (e.g. deferred), so the change is unknown
+            dashboard_stats.invalidate()
+        else:
+            dashboard_stats.add('low_stock_medicines', needs_reorder - was_low)
+    
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=Medicine)
+def unindex_medicine(sender, instance, **kwargs):
+    """Drop a deleted medicine from the in-memory indexes once the delete commits."""
+    medicine_id = instance.id
+    needs_reorder = getattr(instance, '_loaded_needs_reorder', None)
+    if needs_reorder is None:
+        needs_reorder = instance.needs_reorder
+    
+    def apply():
+        medicine_index.remove(medicine_id)
+        medicine_text_index.remove(medicine_id)
+        medicine_autocomplete_index.remove(medicine_id)
+        alternatives_graph.remove_medicine(medicine_id)
+        dashboard_stats.add('total_medicines', -1)
+        dashboard_stats.add('low_stock_medicines', -int(needs_reorder))
+    
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Alternative)
+def link_alternative(sender, instance, **kwargs):
+    """Add an edge to the alternatives graph once the save commits."""
+    medicine_id, alternative_id = instance.medicine_id, instance.alternative_medicine_id
+    transaction.on_commit(lambda: alternatives_graph.add_edge(medicine_id, alternative_id))
+
+
+@receiver(post_delete, sender=Alternative)
+def unlink_alternative(sender, instance, **kwargs):
+    """Drop an edge from the alternatives graph once the delete commits."""
+    medicine_id, alternative_id = instance.medicine_id, instance.alternative_medicine_id
+    transaction.on_commit(lambda: alternatives_graph.remove_edge(medicine_id, alternative_id))
+
+
+@receiver(post_save, sender=Prescription)
+def count_prescription(sender, instance, created, **kwargs):
+    """Count a new prescription on the dashboard once the save commits."""
+    if created:
+        transaction.on_commit(lambda: dashboard_stats.add('total_prescriptions', 1))
+
+
+@receiver(post_delete, sender=Prescription)
+def uncount_prescription(sender, instance, **kwargs):
+    """Uncount a deleted prescription once the delete commits."""
+    transaction.on_commit(lambda: dashboard_stats.add('total_prescriptions', -1))
+
+
+@receiver(pre_delete, sender=Prescription)
+def unrecord_prescription_lines(sender, instance, **kwargs):
+    """Take a prescription's lines out of the daily rollups before they are deleted with it."""
+    unrecord_prescription(instance)
@@ -0,0 +1,90 @@
+"""
+Cached counters for the admin dashboard.
+Totals are counted once with conditional aggregates, then kept current
+by the signal handlers and recounted every DASHBOARD_STATS_RECONCILE_SECONDS.
+"""
+import threading
+import time
+from django.conf import settings
+from django.db.models import Count, Q
+from .models import Medicine, Prescription
+from .profiling import upkeep
+
+
+def count_dashboard_stats():
+    """
+    Count the dashboard totals with one aggregate query per table.
+
+    Returns:
+        dict: total_medicines, low_stock_medicines, total_prescriptions
+    """
+    stats = Medicine.objects.aggregate(
+        total_medicines=Count('id'),
+        low_stock_medicines=Count('id', filter=Q(needs_reorder=True)),
+    )
+    stats.update(Prescription.objects.aggregate(total_prescriptions=Count('id')))
+    return stats
+
+
+class DashboardStats:
+    """
+    In-process dashboard counters.
+
+    Saves and deletes in this process adjust the counters as they
+    commit; writes from other processes (or bulk writes that send no
+    signals) are picked up when the counters are next recounted.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._counts = {}
+        self.counted_at = None
+        self.is_built = False
+
+    def build(self, counts):
+        """Replace all counters (a dict as returned by count_dashboard_stats)."""
+        with self._lock:
+            self._counts = dict(counts)
+            self.counted_at = time.monotonic()
+            self.is_built = True
+
+    def build_from_db(self):
+        """Recount every counter from the database."""
+        self.build(count_dashboard_stats())
+
+    def invalidate(self):
+        """Recount on next use (e.g. after a write whose effect is unknown)."""
+        with self._lock:
+            self.is_built = False
+
+    def add(self, name, delta):
+        """Adjust one counter, if the counters have been built."""
+        if not delta:
+            return
+        with self._lock:
+            if self.is_built:
+                self._counts[name] += delta
+
+    def is_stale(self, max_age):
+        """Return True if the counters are unbuilt or were recounted over max_age seconds ago."""
+        with self._lock:
+            return not self.is_built or time.monotonic() - self.counted_at > max_age
+
+    def snapshot(self):
+        """Return a copy of the counters."""
+        with self._lock:
+            return dict(self._counts)
+
+
+# Process-wide counters, kept current by the Medicine and Prescription signal handlers
+dashboard_stats = DashboardStats()
+
+
+def get_dashboard_stats():
+    """Return the dashboard counters, recounting them first if they are stale."""
+    max_age = settings.DASHBOARD_STATS_RECONCILE_SECONDS
+    if dashboard_stats.is_stale(max_age):
+        with dashboard_stats._lock, upkeep():
+            if dashboard_stats.is_stale(max_age):
+                dashboard_stats.build_from_db()
+    return dashboard_stats.snapshot()
@@ -0,0 +1,116 @@
+"""
+Reconciliation of the in-memory medicine indexes with the database.
+Signal handlers only see writes made by this process through save() and
+delete(); rows written by other processes (web workers, management
+commands) or by bulk_create/update are pulled in here.
+"""
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import Medicine, Alternative
+from .index_utils import medicine_index
+from .search_utils import medicine_text_index, medicine_autocomplete_index
+from .alternatives_utils import alternatives_graph
+
+
+# Every index holding one entry per medicine
+INDEXES = (medicine_index, medicine_text_index, medicine_autocomplete_index, alternatives_graph)
+
+
+class CatalogueSync:
+    """
+    Pulls recent Medicine and Alternative writes into the process-wide indexes.
+
+    Every INDEX_SYNC_SECONDS the next index lookup re-reads medicines
+    updated (and alternatives created) since the previous check, minus
+    INDEX_SYNC_OVERLAP_SECONDS for clock skew between hosts and slow
+    commits; applying a row twice is harmless. Deletes leave no row to
+    read, so every INDEX_RECONCILE_SECONDS the row counts are compared
+    with the indexes and any index that disagrees is rebuilt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.synced_at = None
+        self.counted_at = None
+        # Indexes are built after the process starts, so anything older is in them
+        self.medicines_since = self.alternatives_since = timezone.now()
+
+    def is_due(self):
+        return self.synced_at is None or time.monotonic() - self.synced_at >= settings.INDEX_SYNC_SECONDS
+
+    def maybe_sync(self):
+        """Sync if due; a thread finding another one syncing carries on without waiting."""
+        if not self.is_due() or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.is_due():
+                self.sync()
+        finally:
+            self._lock.release()
+
+    def sync(self):
+        """Apply recent writes, and recount if a reconcile is due."""
+        overlap = timedelta(seconds=settings.INDEX_SYNC_OVERLAP_SECONDS)
+
+        if any(index.is_built for index in INDEXES):
+            medicines = Medicine.objects.filter(
+                updated_at__gte=self.medicines_since - overlap
+            ).values_list('id', 'name', 'composition', 'manufacturer', 'stock_quantity', 'updated_at')
+        else:
+            # Nothing to update (a cold process); the builds read every row
+            medicines = []
+            self.medicines_since = timezone.now()
+        for medicine_id, name, composition, manufacturer, stock, updated_at in medicines:
+            if medicine_index.is_built:
+                medicine_index.add(medicine_id, name)
+            if medicine_text_index.is_built:
+                medicine_text_index.add(medicine_id, name, composition, manufacturer)
+            if medicine_autocomplete_index.is_built:
+                medicine_autocomplete_index.add(medicine_id, name, stock)
+            if alternatives_graph.is_built:
+                alternatives_graph.set_medicine(medicine_id, stock, composition)
+            self.medicines_since = max(self.medicines_since, updated_at)
+
+        if alternatives_graph.is_built:
+            edges = Alternative.objects.filter(
+                created_at__gte=self.alternatives_since - overlap
+            ).values_list('medicine_id', 'alternative_medicine_id', 'created_at')
+            for medicine_id, alternative_id, created_at in edges:
+                alternatives_graph.add_edge(medicine_id, alternative_id)
+                self.alternatives_since = max(self.alternatives_since, created_at)
+        else:
+            # Its next build reads every edge
+            self.alternatives_since = timezone.now()
+
+        now = time.monotonic()
+        if self.counted_at is None or now - self.counted_at >= settings.INDEX_RECONCILE_SECONDS:
+            self.reconcile()
+            self.counted_at = now
+        self.synced_at = now
+
+    def reconcile(self):
+        """Rebuild (on next use) every built index whose size disagrees with its table."""
+        if any(index.is_built for index in INDEXES):
+            medicine_count = Medicine.objects.count()
+            for index in INDEXES:
+                with index._lock:
+                    if index.is_built and len(index) != medicine_count:
+                        index.is_built = False
+        if not alternatives_graph.is_built:
+            return
+        edge_count = Alternative.objects.count()
+        with alternatives_graph._lock:
+            if alternatives_graph.is_built and alternatives_graph.edge_count() != edge_count:
+                alternatives_graph.is_built = False
+
+
+# Process-wide; the index getters call maybe_sync()
+catalogue_sync = CatalogueSync()
+
+
+def sync_indexes():
+    """Bring the in-memory indexes up to date with the database, if a sync is due."""
+    catalogue_sync.maybe_sync()
@@ -0,0 +1,1415 @@
+"""
+Tests for Pharmacy AI application.
+Run with: python manage.py test pharmacy_app
+"""
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import (
+    Alternative, DailyMedicineStats, DailyPrescriptionStats, Medicine, Prescription, PrescriptionLine, User,
+)
+from .pipeline import extract_prescription_text, process_prescription, run_prescription_job
+from .cache_utils import DatabaseCache, get_cache
+from . import ai_utils, image_utils, ocr_utils
+from .inventory_utils import (
+    InsufficientStock, dispense_medicine, dispense_medicines, dispense_prescription, prescription_quantities,
+    resolve_medicines,
+)
+from .reorder_utils import refresh_reorder_flags, reorder_queue
+from .rollup_utils import rebuild_rollups
+from .signals import reset_medicine_indexes
+from .stats_utils import count_dashboard_stats, dashboard_stats, get_dashboard_stats
+from .index_utils import get_medicine_index, medicine_index
+from .search_utils import count_needs_reorder, get_autocomplete_index, get_search_backend, search_medicines
+from .alternatives_utils import (
+    AlternativesGraph, alternatives_graph, get_alternatives_graph, suggest_alternatives,
+)
+from .ingredient_utils import IngredientIndex, parse_composition
+from .sync_utils import catalogue_sync
+from .pagination import encode_cursor
+from .catalogue_utils import CatalogueImportError, import_medicines_file, write_parquet_export
+from .middleware import QueryBudgetExceeded
+from .metrics_utils import PipelineMetrics
+
+
+def create_catalogue(count):
+    """Create count medicines, every other one out of stock with an in-stock alternative."""
+    medicines = [
+        Medicine.objects.create(name=f'Testamol {10 * (i + 1)}mg', composition='Testamol',
+                                stock_quantity=0 if i % 2 else 20)
+        for i in range(count)
+    ]
+    for i in range(1, count, 2):
+        Alternative.objects.create(medicine=medicines[i], alternative_medicine=medicines[i - 1])
+    # Signal handlers only update the in-memory indexes on commit, which
+    # TestCase never does; rebuild them from the test's rows instead
+    reset_medicine_indexes()
+    return medicines
+
+
+# Index syncs run only when a test asks for one, so query counts are fixed
+@override_settings(INDEX_SYNC_SECONDS=3600)
+class ResolveMedicinesTests(TestCase):
+    def setUp(self):
+        self.medicines = create_catalogue(20)
+        get_medicine_index()
+        get_alternatives_graph()
+
+    def test_query_count_does_not_grow_with_names(self):
+        # One query for the matched medicines and one for the suggested alternatives
+        for count in (2, 6, 20):
+            names = [medicine.name for medicine in self.medicines[:count]]
+            with self.assertNumQueries(2):
+                results = resolve_medicines(names)
+            self.assertEqual([r['medicine_name'] for r in results], names)
+
+    def test_statuses_and_alternatives(self):
+        results = resolve_medicines(['Testamol 10mg', 'Testamol 20mg', 'Unknownex 5mg'])
+        self.assertEqual([r['status'] for r in results], ['Available', 'Out of Stock', 'Not Found'])
+        self.assertEqual(results[1]['alternative']['name'], 'Testamol 10mg')
+        self.assertIsNone(results[2]['alternative'])
+
+    def test_different_strength_is_only_suggested(self):
+        results = resolve_medicines(['Testamol 15mg', 'Testamol'])
+        self.assertEqual([r['status'] for r in results], ['Needs Confirmation'] * 2)
+        self.assertEqual(results[0]['medicine_name'], 'Testamol 15mg')
+        self.assertIsNone(results[0]['stock'])
+        self.assertIn('Testamol 10mg', [s['name'] for s in results[0]['suggestions']])
+
+    def test_different_drug_is_only_suggested(self):
+        Medicine.objects.create(name='Hydroxyzine 25mg', stock_quantity=10)
+        reset_medicine_indexes()
+        result, = resolve_medicines(['Hydralazine 25mg'])
+        self.assertEqual(result['status'], 'Needs Confirmation')
+        self.assertEqual(result['medicine_name'], 'Hydralazine 25mg')
+        self.assertEqual([s['name'] for s in result['suggestions']], ['Hydroxyzine 25mg'])
+
+        prescription = Prescription.objects.create(
+            file='prescriptions/test.png', status=Prescription.STATUS_COMPLETED, results_json=[result]
+        )
+        self.assertEqual(prescription_quantities(prescription), {})
+
+    def test_ocr_noise_and_spacing_still_resolve(self):
+        results = resolve_medicines(['Testam0l 10 mg', 'TESTAMOL 20MG'])
+        self.assertEqual([r['medicine_name'] for r in results], ['Testamol 10mg', 'Testamol 20mg'])
+
+    def test_empty_names(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_medicines(['', '  ']), [])
+
+    def test_name_missed_by_the_index_is_found_by_exact_name(self):
+        # bulk_create sends no signals, as for a row written by another process
+        Medicine.objects.bulk_create([Medicine(name='Ibuprofen 400mg', stock_quantity=3)])
+        # The same single lookup query; neither medicine has alternatives
+        with self.assertNumQueries(1):
+            results = resolve_medicines(['Ibuprofen 400mg', 'Testamol 10mg'])
+        self.assertEqual([r['status'] for r in results], ['Available', 'Available'])
+
+
+@override_settings(INDEX_SYNC_SECONDS=3600)
+class CatalogueSyncTests(TestCase):
+    def setUp(self):
+        self.medicines = create_catalogue(4)
+        get_medicine_index()
+        get_autocomplete_index()
+        get_alternatives_graph()
+
+    def test_sync_picks_up_rows_written_without_signals(self):
+        Medicine.objects.bulk_create([Medicine(name='Ibuprofen 400mg', stock_quantity=7)])
+        ibuprofen = Medicine.objects.get(name='Ibuprofen 400mg')
+        Alternative.objects.bulk_create([
+            Alternative(medicine=self.medicines[1], alternative_medicine=ibuprofen)
+        ])
+        self.assertEqual(get_medicine_index().search('Ibuprofen 400mg'), [])
+
+        catalogue_sync.sync()
+        self.assertEqual(get_medicine_index().search('Ibuprofen 400mg')[0].id, ibuprofen.id)
+        self.assertIn((ibuprofen.id, 'Ibuprofen 400mg', 7), get_autocomplete_index().complete('ibu'))
+        suggested = [s.id for s in get_alternatives_graph().suggest(self.medicines[1].id, limit=5)]
+        self.assertIn(ibuprofen.id, suggested)
+
+    def test_sync_picks_up_stock_changes(self):
+        Medicine.objects.filter(id=self.medicines[0].id).update(stock_quantity=99)
+        catalogue_sync.sync()
+        self.assertEqual(get_autocomplete_index().complete('testamol 10')[0][2], 99)
+
+    def test_reconcile_rebuilds_an_index_that_missed_a_delete(self):
+        medicine_index.add(10 ** 9, 'Deleted Elsewhere 5mg')
+        catalogue_sync.reconcile()
+        self.assertFalse(medicine_index.is_built)
+        self.assertEqual(get_medicine_index().search('Deleted Elsewhere 5mg'), [])
+
+
+class AlternativesGraphTests(SimpleTestCase):
+    def setUp(self):
+        # 1 -> 2 -> 3 -> 5, 1 -> 4, and 2 -> 1 closes a cycle
+        self.graph = AlternativesGraph()
+        self.graph.build(
+            [(1, 0, 'Paracetamol'), (2, 0, 'Paracetamol'), (3, 50, 'Paracetamol'),
+             (4, 5, 'Ibuprofen'), (5, 100, 'Paracetamol')],
+            [(1, 2), (1, 4), (2, 3), (2, 1), (3, 5)]
+        )
+
+    def test_alternatives_of_alternatives_are_found_and_ranked(self):
+        suggestions = self.graph.suggest(1, limit=5, max_hops=2)
+        # Same composition and plenty of stock outweigh being one hop closer
+        self.assertEqual([(s.id, s.hops) for s in suggestions], [(3, 2), (4, 1)])
+        self.assertGreater(suggestions[0].score, suggestions[1].score)
+
+    def test_search_stops_at_max_hops(self):
+        self.assertEqual([s.id for s in self.graph.suggest(1, limit=5, max_hops=1)], [4])
+        suggestions = self.graph.suggest(1, limit=5, max_hops=3)
+        self.assertEqual([(s.id, s.hops) for s in suggestions], [(5, 3), (3, 2), (4, 1)])
+
+    def test_search_stops_after_max_visited(self):
+        # The source and its first two neighbours; 3 is never reached
+        self.assertEqual([s.id for s in self.graph.suggest(1, limit=5, max_visited=3)], [4])
+
+    def test_out_of_stock_and_unknown_medicines_are_not_suggested(self):
+        self.graph.set_stock(3, 0)
+        self.graph.add_edge(1, 99)
+        self.assertEqual([s.id for s in self.graph.suggest(1, limit=5, max_hops=3)], [5, 4])
+        self.assertEqual(self.graph.suggest(99), [])
+
+    def test_alternatives_are_scored_at_their_shortest_distance(self):
+        self.graph.build(
+            [(1, 0, 'Paracetamol'), (2, 10, 'Paracetamol'), (3, 10, 'Paracetamol')],
+            [(1, 3), (3, 2), (1, 2)]
+        )
+        self.assertEqual([(s.id, s.hops) for s in self.graph.suggest(1)], [(2, 1), (3, 1)])
+
+        # Otherwise equal, the closer one ranks first
+        self.graph.remove_edge(1, 2)
+        self.assertEqual([(s.id, s.hops) for s in self.graph.suggest(1)], [(3, 1), (2, 2)])
+
+
+@override_settings(ALTERNATIVES_MAX_HOPS=2, ALTERNATIVES_MAX_SUGGESTIONS=3, INDEX_SYNC_SECONDS=3600)
+class SuggestAlternativesTests(TestCase):
+    def setUp(self):
+        self.original, self.direct, self.indirect = Medicine.objects.bulk_create([
+            Medicine(name='Testamol 10mg', composition='Testamol', stock_quantity=0),
+            Medicine(name='Testamol 20mg', composition='Testamol', stock_quantity=0),
+            Medicine(name='Testamol 40mg', composition='Testamol', stock_quantity=30),
+        ])
+        Alternative.objects.bulk_create([
+            Alternative(medicine=self.original, alternative_medicine=self.direct),
+            Alternative(medicine=self.direct, alternative_medicine=self.indirect),
+        ])
+        reset_medicine_indexes()
+
+    def test_suggestions_follow_alternatives_of_alternatives(self):
+        results = suggest_alternatives([self.original.id])
+        self.assertEqual(results, {
+            self.original.id: [{'name': 'Testamol 40mg', 'stock': 30, 'hops': 2}],
+        })
+
+    def test_stock_sold_out_since_the_graph_was_built_is_left_out(self):
+        get_alternatives_graph()
+        Medicine.objects.filter(id=self.indirect.id).update(stock_quantity=0)
+        self.assertEqual(suggest_alternatives([self.original.id]), {self.original.id: []})
+
+
+class IngredientIndexTests(SimpleTestCase):
+    def test_parse_composition(self):
+        self.assertEqual(parse_composition('Paracetamol 500mg + Caffeine 65mg'),
+                         {('paracetamol', (500.0, 'mg')), ('caffeine', (65.0, 'mg'))})
+        # Salt forms and spacing do not change the ingredient
+        self.assertEqual(parse_composition('Metformin Hydrochloride 500 mg'),
+                         parse_composition('Metformin HCl 500mg'))
+        self.assertEqual(parse_composition('Amoxicillin 125mg/5ml'), {('amoxicillin', (125.0, 'mg/5ml'))})
+        # A lone ingredient takes its strength from the name
+        self.assertEqual(parse_composition('Paracetamol', 'Paracetamol 500mg Tablet'),
+                         {('paracetamol', (500.0, 'mg'))})
+        self.assertEqual(parse_composition(''), frozenset())
+
+    def test_substitutes_match_ingredients_and_strengths(self):
+        index = IngredientIndex()
+        index.build([
+            (1, 'Testamol 500mg', 'Paracetamol 500mg', 0),
+            (2, 'Fevex 500', 'Paracetamol 500 mg', 10),
+            (3, 'Calpol 500mg', 'Paracetamol', 40),
+            (4, 'Testamol 650mg', 'Paracetamol 650mg', 90),
+            (5, 'Testamol Extra', 'Paracetamol 500mg + Caffeine 65mg', 90),
+            (6, 'Unlabelled', '', 5),
+        ])
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.ids(out_of_stock=True), [1])
+
+        # Most stock first; other strengths and combinations are not substitutes
+        self.assertEqual(index.substitutes(1), [3, 2])
+        self.assertEqual(index.substitutes(1, limit=1), [3])
+        self.assertEqual(index.substitutes(1, same_strength=False), [4, 3, 2])
+        self.assertEqual(index.substitutes(2, in_stock=True), [3])
+        self.assertEqual(index.substitutes(6), [])
+
+        index.remove(3)
+        index.add(2, 'Fevex 650', 'Paracetamol 650mg', 10)
+        self.assertEqual(index.substitutes(1), [])
+        self.assertEqual(index.substitutes(4), [2])
+
+
+class DiscoverAlternativesTests(TestCase):
+    def setUp(self):
+        self.medicines = Medicine.objects.bulk_create([
+            Medicine(name='Testamol 500mg', composition='Paracetamol 500mg', stock_quantity=0),
+            Medicine(name='Fevex 500', composition='Paracetamol 500mg', stock_quantity=10),
+            Medicine(name='Calpol 500mg', composition='Paracetamol', stock_quantity=40),
+            Medicine(name='Testamol 650mg', composition='Paracetamol 650mg', stock_quantity=90),
+        ])
+
+    def pairs(self):
+        return set(Alternative.objects.values_list('medicine__name', 'alternative_medicine__name'))
+
+    def test_dry_run_saves_nothing(self):
+        output = io.StringIO()
+        call_command('discover_alternatives', dry_run=True, stdout=output)
+        self.assertIn('Would propose 6 alternative(s)', output.getvalue())
+        self.assertFalse(Alternative.objects.exists())
+
+    def test_alternatives_are_created_once(self):
+        Alternative.objects.create(medicine=self.medicines[0], alternative_medicine=self.medicines[1])
+
+        output = io.StringIO()
+        call_command('discover_alternatives', out_of_stock=True, max_per_medicine=5, chunk_size=1,
+                     stdout=output)
+        self.assertIn('Proposed 2 alternative(s); 1 new, 1 already existed', output.getvalue())
+        self.assertEqual(self.pairs(), {('Testamol 500mg', 'Fevex 500'), ('Testamol 500mg', 'Calpol 500mg')})
+
+        call_command('discover_alternatives', any_strength=True, max_per_medicine=1, stdout=output)
+        self.assertIn(('Testamol 500mg', 'Testamol 650mg'), self.pairs())
+        self.assertIn(('Testamol 650mg', 'Calpol 500mg'), self.pairs())
+
+
+class ProcessPrescriptionTests(TestCase):
+    def setUp(self):
+        create_catalogue(2)
+        self.prescription = Prescription.objects.create(file='prescriptions/test.png')
+
+    @mock.patch('pharmacy_app.pipeline.extract_prescription_text', return_value='Testamol 10mg')
+    def test_completes(self, _):
+        process_prescription(self.prescription.id)
+        self.prescription.refresh_from_db()
+        self.assertEqual(self.prescription.status, Prescription.STATUS_COMPLETED)
+        self.assertEqual(self.prescription.results_count, len(self.prescription.results_json))
+
+    @mock.patch('pharmacy_app.pipeline.record_prescription', side_effect=RuntimeError('disk full'))
+    @mock.patch('pharmacy_app.pipeline.extract_prescription_text', return_value='Testamol 10mg')
+    def test_failed_save_marks_the_prescription_failed(self, *_):
+        with self.assertLogs('pharmacy_app.pipeline', 'ERROR'):
+            process_prescription(self.prescription.id)
+        self.prescription.refresh_from_db()
+        self.assertEqual(self.prescription.status, Prescription.STATUS_FAILED)
+        self.assertIn('disk full', self.prescription.error_message)
+
+    @mock.patch('pharmacy_app.pipeline.Trace', side_effect=RuntimeError('broken'))
+    def test_job_errors_outside_the_stages_mark_the_prescription_failed(self, _):
+        with self.assertLogs('pharmacy_app.pipeline', 'ERROR'), \
+                mock.patch('pharmacy_app.pipeline.close_old_connections'):
+            run_prescription_job(self.prescription.id)
+        self.prescription.refresh_from_db()
+        self.assertEqual(self.prescription.status, Prescription.STATUS_FAILED)
+
+
+class ExtractPrescriptionTextTests(TestCase):
+    def setUp(self):
+        self.cache = DatabaseCache(name='ocr')
+        patcher = mock.patch('pharmacy_app.pipeline.get_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, **fields):
+        return Prescription.objects.create(file='prescriptions/test.pdf', file_hash='abc', **fields)
+
+    @mock.patch('pharmacy_app.pipeline.perform_ocr')
+    def test_reuses_the_text_of_a_completed_upload_with_the_same_hash(self, perform_ocr):
+        self.upload(status=Prescription.STATUS_COMPLETED, extracted_text='Rx Testamol 10mg')
+        self.assertEqual(extract_prescription_text(self.upload()), 'Rx Testamol 10mg')
+        perform_ocr.assert_not_called()
+        self.assertEqual(self.cache.get('abc'), 'Rx Testamol 10mg')
+
+    @mock.patch('pharmacy_app.pipeline.perform_ocr', return_value='Rx Testamol 10mg')
+    def test_empty_text_is_not_reused(self, perform_ocr):
+        self.upload(status=Prescription.STATUS_COMPLETED, extracted_text='')
+        self.cache.set('abc', '')
+        self.assertEqual(extract_prescription_text(self.upload()), 'Rx Testamol 10mg')
+        perform_ocr.assert_called_once()
+
+    def test_incomplete_ocr_fails_the_upload_and_is_not_cached(self):
+        degraded = ocr_utils.OCRIncompleteError('', ['Too many OCR requests in progress.'])
+        with mock.patch('pharmacy_app.pipeline.perform_ocr', side_effect=degraded):
+            prescription = process_prescription(self.upload().id)
+        self.assertEqual(prescription.status, Prescription.STATUS_FAILED)
+        self.assertIn('Too many OCR requests', prescription.error_message)
+        self.assertIsNone(self.cache.get('abc'))
+
+        with mock.patch('pharmacy_app.pipeline.perform_ocr', return_value='Rx Testamol 10mg') as perform_ocr:
+            prescription = process_prescription(self.upload().id)
+        perform_ocr.assert_called_once()
+        self.assertEqual(prescription.status, Prescription.STATUS_COMPLETED)
+
+
+def rollups():
+    return (
+        list(DailyPrescriptionStats.objects.values_list(
+            'date', 'prescriptions', 'lines', 'available', 'out_of_stock', 'not_found', 'substituted')),
+        list(DailyMedicineStats.objects.values_list(
+            'date', 'medicine_id', 'prescribed', 'available', 'out_of_stock', 'substituted')),
+    )
+
+
+@override_settings(INDEX_SYNC_SECONDS=3600)
+class RollupTests(TestCase):
+    def setUp(self):
+        create_catalogue(4)
+
+    def process(self, *names, days_ago=0, prescription=None):
+        if prescription is None:
+            prescription = Prescription.objects.create(file='prescriptions/test.png')
+        Prescription.objects.filter(id=prescription.id).update(
+            status=Prescription.STATUS_PENDING, created_at=timezone.now() - timedelta(days=days_ago))
+        with mock.patch('pharmacy_app.pipeline.extract_prescription_text', return_value='Rx'), \
+                mock.patch('pharmacy_app.pipeline.extract_medicine_names', return_value=list(names)):
+            return process_prescription(prescription.id)
+
+    def assert_rollups_match_a_rebuild(self):
+        before = rollups()
+        self.assertTrue(before[0])
+        rebuild_rollups(chunk_size=1)
+        self.assertEqual(rollups(), before)
+
+    def test_rollups_follow_processing_and_deletes(self):
+        # Available, out of stock with an alternative, not found
+        first = self.process('Testamol 10mg', 'Testamol 20mg', 'Unknown 5mg')
+        second = self.process('Testamol 10mg', 'Testamol 40mg', days_ago=1)
+        self.assertEqual(DailyPrescriptionStats.objects.get(date=timezone.localdate()).substituted, 1)
+        self.assert_rollups_match_a_rebuild()
+
+        # Reprocessing replaces the earlier lines
+        self.process('Testamol 30mg', prescription=first)
+        self.assert_rollups_match_a_rebuild()
+
+        dispense_prescription(Prescription.objects.get(id=first.id))
+        self.assert_rollups_match_a_rebuild()
+
+        second.delete()
+        self.assertFalse(DailyPrescriptionStats.objects.filter(date=timezone.localdate() - timedelta(days=1)).exists())
+        self.assert_rollups_match_a_rebuild()
+
+    def test_rebuild_command_since_a_day(self):
+        self.process('Testamol 10mg', days_ago=2)
+        self.process('Testamol 10mg', 'Testamol 20mg')
+        expected = rollups()
+        DailyPrescriptionStats.objects.update(lines=99)
+        DailyMedicineStats.objects.all().delete()
+
+        output = io.StringIO()
+        call_command('rebuild_rollups', since=(timezone.localdate() - timedelta(days=1)).isoformat(), stdout=output)
+        self.assertIn('Read 1 prescription(s)', output.getvalue())
+        # Days before --since are left as they were
+        self.assertEqual(
+            DailyPrescriptionStats.objects.get(date=timezone.localdate() - timedelta(days=2)).lines, 99)
+
+        call_command('rebuild_rollups', stdout=output)
+        self.assertEqual(rollups(), expected)
+
+
+@override_settings(INDEX_SYNC_SECONDS=3600)
+class BackfillPrescriptionLinesTests(TestCase):
+    def setUp(self):
+        create_catalogue(4)
+
+    def lines(self):
+        return list(PrescriptionLine.objects.order_by('prescription_id', 'position').values_list(
+            'prescription_id', 'position', 'medicine__name', 'medicine_name', 'status', 'alternative__name'))
+
+    def test_backfill_writes_the_lines_the_pipeline_writes(self):
+        for names in (['Testamol 10mg', 'Testamol 20mg', 'Unknown 5mg'], ['Testamol 40mg']):
+            prescription = Prescription.objects.create(file='prescriptions/test.png')
+            with mock.patch('pharmacy_app.pipeline.extract_prescription_text', return_value='Rx'), \
+                    mock.patch('pharmacy_app.pipeline.extract_medicine_names', return_value=names):
+                process_prescription(prescription.id)
+        expected = self.lines()
+        self.assertEqual(len(expected), 4)
+
+        PrescriptionLine.objects.all().delete()
+        output = io.StringIO()
+        call_command('backfill_prescription_lines', chunk_size=1, stdout=output)
+        self.assertIn('Read 2 prescription(s), 4 line(s)', output.getvalue())
+        self.assertEqual(self.lines(), expected)
+
+        # Running again leaves the lines as they are
+        call_command('backfill_prescription_lines', stdout=output)
+        self.assertEqual(self.lines(), expected)
+
+    def test_backfill_reads_older_results_and_skips_unfinished_prescriptions(self):
+        older = Prescription.objects.create(
+            file='prescriptions/old.png', status=Prescription.STATUS_COMPLETED,
+            results_json=[
+                {'medicine_name': 'Testamol 20mg', 'status': 'Out of Stock', 'alternative': 'Testamol 10mg'},
+                {'medicine_name': 'Testamol 99mg', 'status': 'Needs Confirmation'},
+                {'medicine_name': 'Testamol 10mg', 'status': 'Unknown'},
+            ])
+        Prescription.objects.create(file='prescriptions/pending.png', results_json=[
+            {'medicine_name': 'Testamol 10mg', 'status': 'Available'},
+        ])
+        Prescription.objects.create(file='prescriptions/empty.png', status=Prescription.STATUS_COMPLETED,
+                                    results_json={})
+        PrescriptionLine.objects.create(prescription=older, position=0, medicine_name='Stale',
+                                        status=PrescriptionLine.STATUS_NOT_FOUND, created_at=older.created_at)
+
+        output = io.StringIO()
+        call_command('backfill_prescription_lines', rebuild=True, stdout=output)
+        self.assertIn('Deleted 1 existing line(s)', output.getvalue())
+        self.assertIn('Read 2 prescription(s), 2 line(s)', output.getvalue())
+        self.assertEqual(self.lines(), [
+            (older.id, 0, 'Testamol 20mg', 'Testamol 20mg', PrescriptionLine.STATUS_OUT_OF_STOCK, 'Testamol 10mg'),
+            (older.id, 1, None, 'Testamol 99mg', PrescriptionLine.STATUS_NOT_FOUND, None),
+        ])
+
+
+class DatabaseCacheTests(TestCase):
+    def setUp(self):
+        self.cache = DatabaseCache(name='test', max_entries=3)
+
+    def test_hit_is_one_query(self):
+        self.cache.set('key', ['Testamol'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cache.get('key'), ['Testamol'])
+
+    def test_culls_least_recently_used(self):
+        self.cache.cull_interval = 0
+        for i in range(5):
+            self.cache.set(f'key{i}', i)
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get('key0'))
+
+    def test_errors_are_misses_and_skipped_writes(self):
+        with mock.patch.object(DatabaseCache, '_entries', side_effect=RuntimeError('database is locked')), \
+                self.assertLogs('pharmacy_app.cache_utils', 'WARNING'):
+            self.assertEqual(self.cache.get('key', 'default'), 'default')
+        with mock.patch('pharmacy_app.models.CacheEntry.objects.update_or_create',
+                        side_effect=RuntimeError('database is locked')), \
+                self.assertLogs('pharmacy_app.cache_utils', 'WARNING'):
+            self.cache.set('key', 1)
+        self.assertEqual(self.cache.stats()['errors'], 2)
+
+    @override_settings(OPENAI_API_KEY='test')
+    def test_extraction_keeps_the_llm_result_when_the_cache_fails(self):
+        broken = DatabaseCache(name='llm')
+        with mock.patch.object(broken, '_get', side_effect=RuntimeError('database is locked')), \
+                mock.patch.object(broken, '_set', side_effect=RuntimeError('database is locked')), \
+                mock.patch.object(ai_utils, 'get_cache', return_value=broken), \
+                mock.patch.object(ai_utils, 'extract_medicine_names_with_openai',
+                                  return_value=['Testamol 10mg']) as llm, \
+                self.assertLogs('pharmacy_app.cache_utils', 'WARNING'):
+            self.assertEqual(ai_utils.extract_medicine_names('Rx Testamol 10mg'), ['Testamol 10mg'])
+        llm.assert_called_once()
+
+
+# A sample line: metric name, optional labels, then a float or integer value
+SAMPLE_LINE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)+\})? -?[0-9.e+-]+$')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics = PipelineMetrics(buckets=(0.1, 1.0))
+        patcher = mock.patch('pharmacy_app.views.pipeline_metrics', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_prometheus_text_format(self):
+        for seconds in (0.05, 0.5, 0.5, 3.0):
+            self.metrics.observe('ocr', seconds)
+        self.metrics.increment('ocr_engine', 'tesserocr')
+        self.metrics.increment('ocr_engine', 'say "hi"\\')
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+
+        # Cumulative buckets ending in +Inf, which equals the count
+        self.assertEqual(lines[2:7], [
+            'pharmacy_pipeline_stage_seconds_bucket{stage="ocr",le="0.1"} 1',
+            'pharmacy_pipeline_stage_seconds_bucket{stage="ocr",le="1.0"} 3',
+            'pharmacy_pipeline_stage_seconds_bucket{stage="ocr",le="+Inf"} 4',
+            'pharmacy_pipeline_stage_seconds_sum{stage="ocr"} 4.05',
+            'pharmacy_pipeline_stage_seconds_count{stage="ocr"} 4',
+        ])
+        self.assertIn('pharmacy_pipeline_stage_quantile_seconds{stage="ocr",quantile="0.5"} 0.55', lines)
+        self.assertIn('pharmacy_pipeline_ocr_engine_total{ocr_engine="tesserocr"} 1', lines)
+        self.assertIn('pharmacy_pipeline_ocr_engine_total{ocr_engine="say \\"hi\\"\\\\"} 1', lines)
+
+        # Every metric has HELP and TYPE before its samples, and every other line is a sample
+        declared = set()
+        for line in lines:
+            if line.startswith('# HELP '):
+                continue
+            if line.startswith('# TYPE '):
+                _, _, name, kind = line.split(' ')
+                self.assertIn(kind, ('counter', 'gauge', 'histogram'))
+                declared.add(name)
+                continue
+            self.assertRegex(line, SAMPLE_LINE)
+            name = re.match(r'[a-z_]+', line).group()
+            self.assertTrue(name in declared or re.sub(r'_(bucket|sum|count)$', '', name) in declared, line)
+
+
+class StubOpenAIServer:
+    """
+    Local HTTP server answering /chat/completions like the OpenAI API.
+
+    Each request takes the next (status, body, delay) from responses;
+    the last one repeats. requests counts the calls received.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests += 1
+                status, body, delay = stub.responses[min(stub.requests, len(stub.responses)) - 1]
+                time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    # The client gave up (read timeout)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def completion(content):
+    return {
+        'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'test',
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': content}}],
+    }
+
+
+def api_error(status):
+    return (status, {'error': {'message': f'HTTP {status}', 'type': 'test', 'code': None}}, 0)
+
+
+@override_settings(
+    OPENAI_API_KEY='test', OPENAI_READ_TIMEOUT=0.5, OPENAI_CONNECT_TIMEOUT=0.5,
+    OPENAI_MAX_RETRIES=1, OPENAI_BACKOFF_BASE=0.01, OPENAI_BACKOFF_MAX=0.01,
+    OPENAI_CIRCUIT_FAILURE_THRESHOLD=2, OPENAI_CIRCUIT_RESET_TIMEOUT=60,
+    OPENAI_MAX_CONCURRENCY=1, OPENAI_QUEUE_TIMEOUT=0.05,
+)
+class OpenAIClientManagerTests(SimpleTestCase):
+    def extract(self, server):
+        with override_settings(OPENAI_BASE_URL=server.url):
+            return ai_utils.extract_medicine_names_with_openai('Rx Testamol 10mg')
+
+    def setUp(self):
+        self.manager = ai_utils.OpenAIClientManager()
+        patcher = mock.patch.object(ai_utils, 'get_client_manager', return_value=self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parses_the_response_and_reuses_the_client(self):
+        with StubOpenAIServer((200, completion('["Testamol 10mg"]'), 0)) as server:
+            self.assertEqual(self.extract(server), ['Testamol 10mg'])
+            client = self.manager.get_client()
+            self.assertEqual(self.extract(server), ['Testamol 10mg'])
+            self.assertIs(self.manager.get_client(), client)
+        self.assertEqual(self.manager.breaker.state, 'closed')
+
+    def test_retries_server_errors_then_opens_the_circuit(self):
+        with StubOpenAIServer(api_error(500)) as server:
+            for _ in range(2):
+                with self.assertRaises(Exception):
+                    self.extract(server)
+            # One retry per call
+            self.assertEqual(server.requests, 4)
+            self.assertEqual(self.manager.breaker.state, 'open')
+            with self.assertRaisesMessage(Exception, 'circuit breaker is open'):
+                self.extract(server)
+            self.assertEqual(server.requests, 4)
+
+    def test_read_timeout_counts_as_a_failure(self):
+        with StubOpenAIServer((200, completion('[]'), 2)) as server:
+            start = time.monotonic()
+            with self.assertRaises(Exception):
+                self.extract(server)
+            # Two attempts of 0.5 s each, not the 2 s the server takes
+            self.assertLess(time.monotonic() - start, 1.9)
+        self.assertEqual(self.manager.breaker._failures, 1)
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        with StubOpenAIServer(api_error(400), api_error(401)) as server:
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    self.extract(server)
+            # Not retried either
+            self.assertEqual(server.requests, 3)
+        self.assertEqual(self.manager.breaker.state, 'closed')
+        self.assertEqual(self.manager.breaker._failures, 0)
+
+    def test_half_open_trial_is_released_when_no_slot_frees_up(self):
+        breaker = self.manager.breaker
+        breaker._opened_at = time.monotonic() - 61
+        self.manager._semaphore.acquire()
+        try:
+            with self.assertRaisesMessage(ai_utils.LLMUnavailableError, 'Too many concurrent'):
+                self.manager.call(lambda client: None, client=object())
+        finally:
+            self.manager._semaphore.release()
+        # Another call can still be the trial, and its success closes the circuit
+        self.assertEqual(self.manager.call(lambda client: 'ok', client=object()), 'ok')
+        self.assertEqual(breaker.state, 'closed')
+
+
+@override_settings(PDF_WORKERS=1, PDF_SCANNED_PAGE_MIN_CHARS=10)
+class ScannedPDFTests(SimpleTestCase):
+    def setUp(self):
+        from PIL import Image
+
+        fd, self.path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        pages = [Image.new('RGB', (200, 100), 'white') for _ in range(3)]
+        pages[0].save(self.path, save_all=True, append_images=pages[1:])
+
+        self.pool = ocr_utils.OCRWorkerPool(workers=0, max_pending=1)
+        for target, kwargs in (('get_ocr_pool', {'return_value': self.pool}),
+                               ('ocr_image', {'return_value': 'Testamol 10mg'})):
+            patcher = mock.patch.object(ocr_utils, target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_scanned_pages_are_ocred_on_the_pool(self):
+        text = ocr_utils.extract_text_from_pdf(self.path)
+        self.assertEqual(text.split('\n'), ['Testamol 10mg'] * 3)
+        self.assertEqual(self.pool.stats()['completed'], 3)
+
+    def test_page_workers_leave_ocr_to_the_caller(self):
+        pages = ocr_utils.extract_pdf_pages(self.path, 0, 3)
+        self.assertEqual([len(images) for text, images in pages], [1, 1, 1])
+        ocr_utils.ocr_image.assert_not_called()
+
+    def test_saturated_pool_reports_the_pages_it_could_not_ocr(self):
+        self.pool._slots.acquire()
+        self.pool.queue_timeout = 0
+        with self.assertRaises(ocr_utils.OCRIncompleteError) as raised:
+            ocr_utils.extract_text_from_pdf(self.path)
+        self.assertEqual(raised.exception.text, '')
+        self.assertEqual(raised.exception.failures, ['Too many OCR requests in progress.'] * 3)
+        ocr_utils.ocr_image.assert_not_called()
+
+    def test_unexpected_ocr_errors_are_logged_and_reported(self):
+        ocr_utils.ocr_image.side_effect = ValueError('bad image')
+        with self.assertLogs('pharmacy_app.ocr_utils', 'ERROR') as logs, \
+                self.assertRaises(ocr_utils.OCRIncompleteError) as raised:
+            ocr_utils.extract_text_from_pdf(self.path)
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(raised.exception.failures, ['OCR error: bad image'] * 3)
+
+
+@override_settings(OCR_TARGET_DPI=100, OCR_PAGE_LONG_SIDE_INCHES=4)
+class ImagePreprocessingTests(SimpleTestCase):
+    def page(self, size=(300, 200), lines=((40, 60), (40, 100), (40, 140))):
+        """A white page with a few black text-like bars."""
+        from PIL import Image, ImageDraw
+
+        image = Image.new('L', size, 255)
+        draw = ImageDraw.Draw(image)
+        for x, y in lines:
+            draw.rectangle((x, y, size[0] - x, y + 6), fill=0)
+        return image
+
+    def test_downscale_caps_the_long_side(self):
+        from PIL import Image
+
+        image = image_utils.downscale(Image.new('RGB', (1200, 600), 'white'))
+        self.assertEqual(image.size, (400, 200))
+
+        small = Image.new('RGB', (300, 100), 'white')
+        self.assertIs(image_utils.downscale(small), small)
+
+    def test_downscale_decodes_jpegs_at_reduced_size(self):
+        from PIL import Image
+
+        data = io.BytesIO()
+        Image.new('RGB', (1600, 800), 'white').save(data, format='JPEG')
+        data.seek(0)
+        with Image.open(data) as jpeg:
+            image = image_utils.downscale(jpeg)
+            self.assertEqual(image.size, (400, 200))
+            self.assertEqual(image.mode, 'L')
+
+    def test_exif_rotate_applies_the_orientation_tag(self):
+        from PIL import Image
+
+        data = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        Image.new('RGB', (300, 100), 'white').save(data, format='JPEG', exif=exif)
+        data.seek(0)
+        with Image.open(data) as photo:
+            self.assertEqual(image_utils.exif_rotate(photo).size, (100, 300))
+
+    def test_adaptive_threshold_keeps_faint_text_under_uneven_lighting(self):
+        import numpy as np
+        from PIL import Image
+
+        # Lighting falls from 250 on the left to 90 on the right; the text
+        # is 60 levels darker than the background around it everywhere
+        pixels = np.tile(np.linspace(250, 90, 320), (160, 1))
+        pixels[72:76, 20:300] -= 60
+        image = Image.fromarray(pixels.astype(np.uint8), mode='L')
+
+        binary = np.asarray(image_utils.adaptive_threshold(image))
+        self.assertEqual(set(np.unique(binary)), {0, 255})
+        self.assertTrue((binary[72:76, 30:290] == 0).all())
+        self.assertTrue((binary[:50] == 255).all())
+        self.assertTrue((binary[100:] == 255).all())
+        # A global threshold would have lost one end of the line or the other
+        global_binary = np.asarray(image.point(lambda p: 255 if p > 128 else 0))
+        self.assertFalse((global_binary[72:76, 30:290] == 0).all())
+
+    def test_adaptive_threshold_matches_the_local_mean_definition(self):
+        import numpy as np
+        from PIL import Image
+
+        pixels = np.random.RandomState(7).randint(0, 256, (23, 31))
+        binary = np.asarray(image_utils.adaptive_threshold(
+            Image.fromarray(pixels.astype(np.uint8), mode='L'), window_fraction=1 / 4, sensitivity=0.1
+        ))
+
+        half = max(1, int(31 / 4) // 2)
+        for y in range(23):
+            for x in range(31):
+                window = pixels[max(0, y - half):y + half + 1, max(0, x - half):x + half + 1]
+                expected = 255 if pixels[y, x] * window.size > window.sum() * 0.9 else 0
+                self.assertEqual(binary[y, x], expected, (y, x))
+
+    def test_deskew_levels_rotated_lines(self):
+        import numpy as np
+
+        def row_profile_variance(image):
+            return (255 - np.asarray(image, dtype=np.float32)).sum(axis=1).var()
+
+        page = self.page()
+        self.assertIs(image_utils.deskew(page), page)
+
+        skewed = page.rotate(3, expand=True, fillcolor=255)
+        levelled = image_utils.deskew(skewed)
+        self.assertIsNot(levelled, skewed)
+        self.assertGreater(row_profile_variance(levelled), 2 * row_profile_variance(skewed))
+
+    def test_crop_to_text_crops_blank_borders(self):
+        from PIL import Image
+
+        image = image_utils.crop_to_text(self.page(), margin=10)
+        self.assertEqual(image.size, (300 - 2 * 40 + 1 + 2 * 10, 146 - 60 + 1 + 2 * 10))
+
+        blank = Image.new('L', (300, 200), 255)
+        self.assertIs(image_utils.crop_to_text(blank), blank)
+
+    def test_preprocess_image_runs_the_selected_stages_in_order(self):
+        from PIL import Image
+
+        image, timings = image_utils.preprocess_image(
+            Image.new('RGB', (1200, 800), 'white'), stages=['grayscale', 'downscale']
+        )
+        self.assertEqual(list(timings), ['downscale', 'grayscale'])
+        self.assertEqual((image.size, image.mode), ((400, 267), 'L'))
+
+        original = self.page()
+        image, timings = image_utils.preprocess_image(original, stages=[])
+        self.assertIs(image, original)
+        self.assertEqual(timings, {})
+
+
+class OCRWorkerPoolTests(SimpleTestCase):
+    def test_timed_out_image_keeps_its_slot_until_the_worker_finishes(self):
+        pool = ocr_utils.OCRWorkerPool(workers=1, max_pending=1, queue_timeout=0.1)
+        self.addCleanup(pool.shutdown)
+        # Start the worker process before timing anything
+        pool._run(time.sleep, 0)
+
+        pool.timeout = 0.2
+        with self.assertRaises(TimeoutError):
+            pool._run(time.sleep, 1)
+        with self.assertRaisesMessage(ocr_utils.OCRUnavailableError, 'Too many'):
+            pool._run(time.sleep, 0)
+        self.assertEqual(pool.stats()['in_flight'], 1)
+
+        time.sleep(1)
+        pool._run(time.sleep, 0)
+        self.assertEqual(pool.stats()['in_flight'], 0)
+        self.assertEqual(pool.stats()['completed'], 3)
+
+
+def upload(name, content):
+    file = io.BytesIO(content)
+    file.name = name
+    return file
+
+
+def zip_upload(name, members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for member, content in members.items():
+            archive.writestr(member, content)
+    return upload(name, buffer.getvalue())
+
+
+@override_settings(PRESCRIPTION_PIPELINE_EAGER=False)
+class BatchUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_patch = override_settings(MEDIA_ROOT=self.media_root)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(User.objects.create_user('staff', password='x', role='staff'))
+
+    def post(self, *files):
+        return self.client.post(reverse('api_upload_prescription_batch'), {'files': list(files)},
+                                format='multipart')
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_many_files(self):
+        response = self.post(upload('a.png', b'first'), upload('b.pdf', b'second'), upload('notes.txt', b'x'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total_files'], 2)
+        self.assertEqual(response.data['skipped'], ['notes.txt'])
+        self.assertEqual(
+            sorted(Prescription.objects.values_list('source_name', 'file_hash')),
+            [('a.png', hashlib.sha256(b'first').hexdigest()), ('b.pdf', hashlib.sha256(b'second').hexdigest())]
+        )
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_zip_archive(self):
+        archive = zip_upload('scans.zip', {
+            'scans/a.png': b'first', 'scans/b.jpg': b'second',
+            '__MACOSX/scans/._a.png': b'x', 'scans/readme.md': b'x',
+        })
+        response = self.post(archive, upload('c.png', b'third'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total_files'], 3)
+        self.assertEqual(sorted(response.data['skipped']), ['__MACOSX/scans/._a.png', 'scans/readme.md'])
+        self.assertEqual(sorted(Prescription.objects.values_list('source_name', flat=True)),
+                         ['c.png', 'scans/a.png', 'scans/b.jpg'])
+
+    def test_invalid_zip_is_rejected(self):
+        response = self.post(upload('scans.zip', b'not a zip'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not a valid ZIP', response.data['error'])
+
+    @override_settings(BATCH_MAX_FILE_SIZE=10)
+    def test_oversized_files_are_skipped(self):
+        response = self.post(upload('a.png', b'small'), upload('b.png', b'x' * 11))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['skipped'], ['b.png'])
+        self.assertEqual(len(self.stored_files()), 1)
+
+    @override_settings(BATCH_MAX_TOTAL_SIZE=1000)
+    def test_total_size_limit_rejects_the_batch(self):
+        archive = zip_upload('scans.zip', {f'{i}.png': os.urandom(300) for i in range(4)})
+        response = self.post(archive)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1000 bytes in total', response.data['error'])
+        self.assertFalse(Prescription.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_zip_bomb_is_rejected(self):
+        archive = zip_upload('scans.zip', {'a.png': b'first', 'b.png': bytes(10 * 1024 * 1024)})
+        self.assertLess(len(archive.getvalue()), 100 * 1024)
+        response = self.post(archive)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('b.png in scans.zip has a suspicious compression ratio', response.data['error'])
+        self.assertEqual(self.stored_files(), [])
+
+
+class MedicineSearchTests(TestCase):
+    def setUp(self):
+        # Name matches outrank composition matches, which outrank manufacturer matches
+        self.by_manufacturer = Medicine.objects.create(
+            name='Omeprazole 20mg', composition='Omeprazole', manufacturer='Zentiva', stock_quantity=50)
+        self.by_name = Medicine.objects.create(
+            name='Zentel 400mg', composition='Albendazole', stock_quantity=2, reorder_point=10)
+        self.by_composition = Medicine.objects.create(
+            name='Albenza 200mg', composition='Zentel albendazole', stock_quantity=1, reorder_point=10)
+        reset_medicine_indexes()
+
+    def search_ids(self, query, **kwargs):
+        return [medicine.id for medicine in search_medicines(query, fuzzy=False, **kwargs)]
+
+    def assert_ranked_and_counted(self):
+        self.assertEqual(self.search_ids('zent'), [self.by_name.id, self.by_composition.id, self.by_manufacturer.id])
+        self.assertEqual(self.search_ids('zentel 400'), [self.by_name.id])
+        self.assertEqual(self.search_ids('zentel', limit=1), [self.by_name.id])
+        self.assertEqual(self.search_ids('nothing'), [])
+        self.assertEqual(count_needs_reorder('zent'), 2)
+        self.assertEqual(count_needs_reorder('omeprazole'), 0)
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 backend')
+    def test_fts5_ranking(self):
+        self.assertEqual(get_search_backend().name, 'sqlite')
+        self.assert_ranked_and_counted()
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 backend')
+    def test_fts5_triggers_follow_writes_that_skip_signals(self):
+        Medicine.objects.filter(id=self.by_name.id).update(name='Vermox 100mg')
+        self.assertEqual(self.search_ids('vermox'), [self.by_name.id])
+        self.assertNotIn(self.by_name.id, self.search_ids('zentel'))
+        # Stock changes leave the FTS table alone but reach the count
+        Medicine.objects.filter(id=self.by_name.id).update(needs_reorder=False)
+        self.assertEqual(count_needs_reorder('zent'), 1)
+        Medicine.objects.filter(id=self.by_composition.id).delete()
+        self.assertEqual(self.search_ids('zent'), [self.by_manufacturer.id])
+
+    @override_settings(MEDICINE_SEARCH_BACKEND='python')
+    def test_python_fallback_ranking(self):
+        self.assertEqual(get_search_backend().name, 'python')
+        self.assert_ranked_and_counted()
+
+    @override_settings(MEDICINE_SEARCH_BACKEND='python')
+    def test_python_fallback_follows_reindexing(self):
+        Medicine.objects.filter(id=self.by_name.id).update(name='Vermox 100mg')
+        reset_medicine_indexes()
+        self.assertEqual(self.search_ids('vermox'), [self.by_name.id])
+        self.assertNotIn(self.by_name.id, self.search_ids('zentel'))
+
+    @override_settings(MEDICINE_SEARCH_MAX_RESULTS=1)
+    def test_inventory_counts_low_stock_over_every_match(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', role='admin'))
+        for backend in ('auto', 'python'):
+            with self.subTest(backend), override_settings(MEDICINE_SEARCH_BACKEND=backend):
+                response = self.client.get(reverse('inventory'), {'search': 'zent'}, SERVER_NAME='localhost')
+                self.assertEqual(len(response.context['medicines']), 1)
+                self.assertEqual(response.context['low_stock_count'], 2)
+
+
+def catalogue(fields=('name', 'composition', 'stock_quantity', 'reorder_point', 'manufacturer')):
+    return sorted(Medicine.objects.values_list(*fields))
+
+
+def csv_catalogue(text):
+    return io.BytesIO(text.encode())
+
+
+class CatalogueImportTests(TestCase):
+    def setUp(self):
+        Medicine.objects.create(name='Testamol 500mg', composition='Testamol', stock_quantity=3,
+                                reorder_point=10, manufacturer='Acme')
+        Medicine.objects.create(name='Ibuprofen 200mg', composition=None, stock_quantity=40, reorder_point=5)
+
+    def test_csv_round_trip(self):
+        admin = User.objects.create_user('admin', password='x', role='admin')
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(admin)
+        before = catalogue()
+        exported = b''.join(client.get(reverse('api_export_medicines')).streaming_content)
+
+        Medicine.objects.all().delete()
+        response = client.post(reverse('api_import_medicines'),
+                                {'file': upload('medicines.csv', exported)}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['imported'], response.data['invalid']), (2, 0))
+        self.assertEqual(catalogue(), before)
+        self.assertEqual(sorted(Medicine.objects.values_list('name', 'needs_reorder')),
+                         [('Ibuprofen 200mg', False), ('Testamol 500mg', True)])
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'Parquet support needs pyarrow')
+    def test_parquet_round_trip(self):
+        before = catalogue()
+        fd, path = tempfile.mkstemp(suffix='.parquet')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.assertEqual(write_parquet_export(path), 2)
+
+        Medicine.objects.all().delete()
+        with open(path, 'rb') as file:
+            report = import_medicines_file(file, 'parquet')
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(catalogue(), before)
+
+    def test_upserts_on_name(self):
+        testamol_id = Medicine.objects.get(name='Testamol 500mg').id
+        report = import_medicines_file(csv_catalogue(
+            'name,composition,stock_quantity,reorder_point,manufacturer\n'
+            'Testamol 500mg,Testamol,5,10,Acme\n'
+            'Cetirizine 10mg,Cetirizine,30,10,\n'
+            'Testamol 500mg,Testamol,50,10,Acme\n'
+        ))
+        self.assertEqual(report['imported'], 2)
+        testamol = Medicine.objects.get(name='Testamol 500mg')
+        # The last row for a name wins, and the row keeps its id
+        self.assertEqual((testamol.id, testamol.stock_quantity, testamol.needs_reorder), (testamol_id, 50, False))
+        self.assertEqual(Medicine.objects.count(), 3)
+
+    def test_partial_columns_leave_the_others_untouched(self):
+        report = import_medicines_file(csv_catalogue(' Name ,Stock_Quantity\nTestamol 500mg,20\nNew 1mg,\n'))
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(catalogue(), [
+            ('Ibuprofen 200mg', None, 40, 5, None),
+            ('New 1mg', None, 0, settings.DEFAULT_REORDER_POINT, None),
+            ('Testamol 500mg', 'Testamol', 20, 10, 'Acme'),
+        ])
+        self.assertFalse(Medicine.objects.get(name='Testamol 500mg').needs_reorder)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        report = import_medicines_file(csv_catalogue(
+            'name,stock_quantity\n'
+            ',5\n'
+            'Negative 1mg,-1\n'
+            'Fraction 1mg,1.5\n'
+            'Word 1mg,many\n'
+            f'{"x" * 201},1\n'
+            'Valid 1mg,2.0\n'
+        ))
+        self.assertEqual((report['rows'], report['imported'], report['invalid']), (6, 1, 5))
+        self.assertEqual(report['errors'], [
+            {'line': 2, 'error': 'name is required'},
+            {'line': 3, 'error': 'stock_quantity cannot be negative'},
+            {'line': 4, 'error': "stock_quantity '1.5' is not a whole number"},
+            {'line': 5, 'error': "stock_quantity 'many' is not a number"},
+            {'line': 6, 'error': 'name is longer than 200 characters'},
+        ])
+        self.assertEqual(Medicine.objects.get(name='Valid 1mg').stock_quantity, 2)
+
+    def test_dry_run_and_unreadable_files(self):
+        report = import_medicines_file(csv_catalogue('name\nNew 1mg\n'), dry_run=True)
+        self.assertEqual(report['imported'], 1)
+        self.assertFalse(Medicine.objects.filter(name='New 1mg').exists())
+        with self.assertRaisesMessage(CatalogueImportError, "'name' column"):
+            import_medicines_file(csv_catalogue('title,stock_quantity\nNew 1mg,1\n'))
+        with self.assertRaisesMessage(CatalogueImportError, 'Could not read the file'):
+            import_medicines_file(io.BytesIO(b'name\n\xff\xfe\n'))
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        # The demand counts are cached in memory, across tests
+        get_cache('demand').clear()
+        self.prescription = Prescription.objects.create(file='prescriptions/test.png')
+        self.lines = 0
+
+    def medicine(self, name, stock, reorder_point=10, demand=0):
+        medicine = Medicine.objects.create(name=name, stock_quantity=stock, reorder_point=reorder_point)
+        PrescriptionLine.objects.bulk_create([
+            PrescriptionLine(prescription=self.prescription, position=self.lines + i, medicine=medicine,
+                             medicine_name=name, status=PrescriptionLine.STATUS_AVAILABLE,
+                             created_at=timezone.now())
+            for i in range(demand)
+        ])
+        self.lines += demand
+        return medicine
+
+    def flag(self, medicine):
+        return Medicine.objects.values_list('needs_reorder', flat=True).get(id=medicine.id)
+
+    def test_save_maintains_the_flag(self):
+        medicine = self.medicine('Testamol 10mg', 3)
+        self.assertTrue(self.flag(medicine))
+        medicine.stock_quantity = '20'
+        medicine.save(update_fields=['stock_quantity'])
+        self.assertFalse(self.flag(medicine))
+        medicine.reorder_point = 25
+        medicine.save(update_fields=['reorder_point'])
+        self.assertTrue(self.flag(medicine))
+
+    def test_refresh_after_writes_that_bypass_save(self):
+        low, high = self.medicine('Low 1mg', 3), self.medicine('High 1mg', 30)
+        Medicine.objects.filter(id=low.id).update(stock_quantity=30)
+        Medicine.objects.filter(id=high.id).update(stock_quantity=3)
+        self.assertEqual(refresh_reorder_flags(), 2)
+        self.assertEqual((self.flag(low), self.flag(high)), (False, True))
+
+    def test_dispensing_turns_the_flag_on(self):
+        medicine, other = self.medicine('Testamol 10mg', 12), self.medicine('Other 10mg', 30)
+        dispense_medicines({medicine.id: 2, other.id: 1})
+        self.assertEqual((self.flag(medicine), self.flag(other)), (False, False))
+        dispense_medicine(medicine.id, 1)
+        self.assertEqual((self.flag(medicine), self.flag(other)), (True, False))
+
+    def test_queue_is_ordered_by_days_of_cover_then_shortfall(self):
+        # 30-day window: 10 lines is 1/3 a day, 30 lines is 1 a day
+        slow = self.medicine('Slow 1mg', 2, demand=10)
+        fast = self.medicine('Fast 1mg', 5, demand=30)
+        empty = self.medicine('Empty 1mg', 0)
+        nearly = self.medicine('Nearly 1mg', 8)
+        self.medicine('Stocked 1mg', 50, demand=5)
+
+        queue = reorder_queue(30)
+        self.assertEqual([row['id'] for row in queue], [fast.id, slow.id, empty.id, nearly.id])
+        self.assertEqual([row['days_of_cover'] for row in queue], [5.0, 6.0, None, None])
+        self.assertEqual(queue[0]['daily_demand'], 1.0)
+
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(User.objects.create_user('admin', password='x', role='admin'))
+        response = client.get(reverse('api_reorder_queue'), {'days': 30, 'limit': 2, 'offset': 1})
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual([row['id'] for row in response.data['results']], [slow.id, empty.id])
+        self.assertEqual(client.get(reverse('api_reorder_queue'), {'days': 'x'}).status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        create_catalogue(3)
+        self.admin = User.objects.create_user('admin', password='x', role='admin')
+        for _ in range(3):
+            Prescription.objects.create(file='prescriptions/test.png', uploaded_by=self.admin)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def get(self, url_name, **params):
+        return self.client.get(reverse(url_name), params)
+
+    def test_follows_next_cursor(self):
+        for url_name in ('api_medicines', 'api_prescription_history'):
+            first = self.get(url_name, page_size=2)
+            second = self.get(url_name, page_size=2, cursor=first.data['next_cursor'])
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(len(first.data['results']) + len(second.data['results']), 3)
+            self.assertIsNone(second.data['next_cursor'])
+
+    def test_tampered_cursors_are_rejected(self):
+        for values in (['x', 'y'], [None, None], [['x'], {'y': 1}], ['x']):
+            for url_name in ('api_medicines', 'api_prescription_history'):
+                response = self.get(url_name, cursor=encode_cursor(values))
+                self.assertEqual(response.status_code, 400, (url_name, values))
+                self.assertEqual(response.data, {'error': 'Invalid cursor.'})
+        self.assertEqual(self.get('api_medicines', cursor='not base64!').status_code, 400)
+
+
+class DashboardTests(TestCase):
+    def test_badges_follow_the_prescription_status(self):
+        admin = User.objects.create_user('admin', password='x', role='admin')
+        for status in (Prescription.STATUS_COMPLETED, Prescription.STATUS_FAILED,
+                       Prescription.STATUS_PROCESSING):
+            # No medicines found; the badge must not depend on results_count
+            Prescription.objects.create(file='prescriptions/test.png', uploaded_by=admin,
+                                        status=status, results_count=0)
+        self.client.force_login(admin)
+        for url_name in ('dashboard', 'admin_dashboard'):
+            response = self.client.get(reverse(url_name))
+            self.assertContains(response, 'badge-success">Processed', count=1)
+            self.assertContains(response, 'badge-error">Failed', count=1)
+            self.assertContains(response, 'badge-warning">Processing', count=1)
+
+
+@override_settings(INDEX_SYNC_SECONDS=3600)
+class DashboardCounterTests(TestCase):
+    def assert_counters_match_a_recount(self):
+        self.assertEqual(dashboard_stats.snapshot(), count_dashboard_stats())
+
+    def test_counters_follow_writes(self):
+        create_catalogue(4)
+        get_dashboard_stats()
+        # The handlers adjust the counters when each write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            low = Medicine.objects.create(name='Low 1mg', stock_quantity=1)
+            high = Medicine.objects.create(name='High 1mg', stock_quantity=50)
+        self.assert_counters_match_a_recount()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            loaded = Medicine.objects.get(id=high.id)
+            loaded.stock_quantity = 2
+            loaded.save()
+            low.stock_quantity = 30
+            low.save(update_fields=['stock_quantity'])
+        self.assert_counters_match_a_recount()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.get(id=high.id).delete()
+            prescription = Prescription.objects.create(
+                file='prescriptions/test.png', status=Prescription.STATUS_COMPLETED,
+                results_json=[{'medicine_name': 'Low 1mg', 'status': 'Available'}])
+            Prescription.objects.create(file='prescriptions/test.png').delete()
+        self.assert_counters_match_a_recount()
+
+        # 30 - 25 drops below the reorder point of 10
+        with self.captureOnCommitCallbacks(execute=True):
+            dispense_prescription(prescription, {'Low 1mg': 25})
+        self.assertEqual(Medicine.objects.get(id=low.id).stock_quantity, 5)
+        self.assert_counters_match_a_recount()
+
+
+@override_settings(INDEX_SYNC_SECONDS=3600)
+class MedicineSignalTests(TestCase):
+    def setUp(self):
+        self.medicines = create_catalogue(2)
+        get_autocomplete_index()
+        get_alternatives_graph()
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(User.objects.create_user('admin', password='x', role='admin'))
+
+    def assert_indexed_stock(self, medicine_id, prefix, stock):
+        self.assertIn((medicine_id, stock), [(m, s) for m, _, s in get_autocomplete_index().complete(prefix)])
+        self.assertEqual(alternatives_graph._nodes[medicine_id][0], stock)
+
+    def test_string_stock_from_the_api_is_indexed_as_an_int(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                reverse('api_medicine_detail', args=[self.medicines[1].id]),
+                {'stock_quantity': '5'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assert_indexed_stock(self.medicines[1].id, 'testamol 20', 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('api_medicines'), {'name': 'Ibuprofen 400mg', 'stock_quantity': '7'}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assert_indexed_stock(response.data['id'], 'ibu', 7)
+
+
+class DispenseTests(TestCase):
+    def setUp(self):
+        self.medicines = create_catalogue(2)
+        self.prescription = Prescription.objects.create(
+            file='prescriptions/test.png', status=Prescription.STATUS_COMPLETED,
+            results_json=resolve_medicines(['Testamol 10mg', 'Testamol 20mg'])
+        )
+
+    def test_out_of_stock_lines_are_skipped_unless_requested(self):
+        available, out_of_stock = (medicine.id for medicine in self.medicines)
+        self.assertEqual(prescription_quantities(self.prescription), {available: 1})
+        self.assertEqual(
+            prescription_quantities(self.prescription, {'Testamol 20mg': 2}),
+            {available: 1, out_of_stock: 2}
+        )
+
+    def test_dispense_medicine_endpoint(self):
+        url = reverse('api_dispense_medicine', args=[self.medicines[0].id])
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(User.objects.create_user('staff', password='x', role='staff'))
+        response = client.post(url, {'quantity': 2}, format='json')
+        self.assertEqual((response.status_code, response.data['stock_quantity']), (200, 18))
+        response = client.post(url, {'quantity': 19}, format='json')
+        self.assertEqual((response.status_code, response.data['stock_quantity']), (409, 18))
+        self.assertEqual(client.post(url, {'quantity': 0}, format='json').status_code, 400)
+
+
+class ConcurrentDispenseTests(TransactionTestCase):
+    """Writers need their own connections and committed rows, so no TestCase."""
+
+    writers = 32
+    attempts = 10
+
+    def test_no_lost_updates(self):
+        initial = self.writers * self.attempts // 2
+        medicine = Medicine.objects.create(name='Testamol 10mg', stock_quantity=initial)
+        errors = []
+
+        def writer(_):
+            succeeded = 0
+            try:
+                for _ in range(self.attempts):
+                    try:
+                        dispense_medicine(medicine.id, 1)
+                        succeeded += 1
+                    except InsufficientStock:
+                        pass
+                    except OperationalError as e:
+                        # SQLite refuses concurrent writers outright; MySQL waits for the row lock
+                        errors.append(e)
+                return succeeded
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.writers) as executor:
+            succeeded = sum(executor.map(writer, range(self.writers)))
+
+        final = Medicine.objects.get(id=medicine.id).stock_quantity
+        self.assertGreater(succeeded, 0)
+        self.assertGreaterEqual(final, 0)
+        # Every successful dispense took exactly one unit
+        self.assertEqual(initial - final, succeeded)
+        if not errors:
+            self.assertEqual(final, 0)
+
+
+@override_settings(QUERY_PROFILING=True, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    def test_every_route_is_within_its_budget(self):
+        # Raises CommandError naming the routes over budget
+        call_command('check_query_budgets', rows=25, stdout=io.StringIO())
+
+    def test_budgets_hold_with_real_authentication(self):
+        create_catalogue(4)
+        staff = User.objects.create_user('staff', password='x', role='staff')
+        prescription = Prescription.objects.create(file='prescriptions/test.png', uploaded_by=staff)
+
+        # Session: one query for the session and one for the user
+        session = APIClient(SERVER_NAME='localhost')
+        session.force_login(staff)
+        response = session.get(reverse('api_prescription_status', args=[prescription.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.query_profile['queries'], 3)
+
+        # JWT: one query for the user, plus building the cold index
+        reset_medicine_indexes()
+        jwt = APIClient(SERVER_NAME='localhost')
+        jwt.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(staff).access_token}')
+        response = jwt.get(reverse('api_autocomplete_medicine'), {'q': 'testa'})
+        self.assertEqual(len(response.data), 4)
+        self.assertGreater(response.query_profile['upkeep_queries'], 0)
+        self.assertEqual(response.query_profile['queries'], 1 + response.query_profile['upkeep_queries'])
+        response = jwt.get(reverse('api_autocomplete_medicine'), {'q': 'testa'})
+        self.assertEqual(response.query_profile['queries'], 1)
+
+    @override_settings(QUERY_BUDGET_STRICT=True,
+                       QUERY_BUDGETS={'api_autocomplete_medicine': {'queries': 1, 'cold_queries': 0}})
+    def test_upkeep_queries_count_against_the_cold_budget(self):
+        create_catalogue(4)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(User.objects.create_user('staff', password='x', role='staff'))
+        reset_medicine_indexes()
+        with self.assertRaisesMessage(QueryBudgetExceeded, '(cold)'):
+            client.get(reverse('api_autocomplete_medicine'), {'q': 'testa'})
+        # Warm, the same request is checked against 'queries'
+        self.assertEqual(client.get(reverse('api_autocomplete_medicine'), {'q': 'testa'}).status_code, 200)
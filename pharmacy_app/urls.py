@@ -18,9 +18,20 @@ from .views import (
     register_user,
     api_upload_prescription,
     api_prescription_history,
+    api_prescription_status,
+    api_upload_prescription_batch,
+    api_prescription_batch_status,
     api_search_medicine,
+    api_autocomplete_medicine,
     api_medicines,
     api_medicine_detail,
+    api_dispense_medicine,
+    api_import_medicines,
+    api_export_medicines,
+    api_reorder_queue,
+    api_demand_analytics,
+    api_dispense_prescription,
+    metrics_view,
 )
 
 urlpatterns = [
@@ -45,9 +56,24 @@ urlpatterns = [
     # API endpoints - Prescriptions
     path('api/prescriptions/upload/', api_upload_prescription, name='api_upload_prescription'),
     path('api/prescriptions/history/', api_prescription_history, name='api_prescription_history'),
+    path('api/prescriptions/<int:prescription_id>/status/', api_prescription_status, name='api_prescription_status'),
+    path('api/prescriptions/batch/', api_upload_prescription_batch, name='api_upload_prescription_batch'),
+    path('api/prescriptions/batch/<int:batch_id>/', api_prescription_batch_status, name='api_prescription_batch_status'),
+    path('api/prescriptions/<int:prescription_id>/dispense/', api_dispense_prescription, name='api_dispense_prescription'),
     
     # API endpoints - Medicines
     path('api/medicines/', api_medicines, name='api_medicines'),
     path('api/medicines/<int:medicine_id>/', api_medicine_detail, name='api_medicine_detail'),
+    path('api/medicines/<int:medicine_id>/dispense/', api_dispense_medicine, name='api_dispense_medicine'),
+    path('api/medicines/import/', api_import_medicines, name='api_import_medicines'),
+    path('api/medicines/export/', api_export_medicines, name='api_export_medicines'),
+    path('api/medicines/reorder/', api_reorder_queue, name='api_reorder_queue'),
     path('api/medicines/search/', api_search_medicine, name='api_search_medicine'),
+    path('api/medicines/autocomplete/', api_autocomplete_medicine, name='api_autocomplete_medicine'),
+    
+    # API endpoints - Analytics
+    path('api/analytics/demand/', api_demand_analytics, name='api_demand_analytics'),
+    
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -2,25 +2,41 @@
 Views for Pharmacy AI application.
 Includes both API endpoints and template-based views.
 """
+import hmac
 import json
 import os
+from datetime import date, timedelta
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q
+from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .models import User, Medicine, Alternative, Prescription
+from .models import User, Medicine, Alternative, Prescription, PrescriptionBatch
 from .forms import PrescriptionUploadForm, MedicineForm, AlternativeForm
-from .ocr_utils import perform_ocr
-from .ai_utils import extract_medicine_names
+from .ocr_utils import compute_file_hash
+from .pipeline import submit_prescription, prescription_status_data
+from .batch_utils import create_batch, batch_status_data, BatchUploadError
+from .pagination import KeysetPagination, iter_keyset
+from .catalogue_utils import (
+    CATALOGUE_FORMATS, CatalogueImportError, detect_format, import_medicines_file, iter_csv_export,
+)
+from .inventory_utils import (
+    dispense_medicine, dispense_prescription, InsufficientStock, AlreadyDispensed,
+)
+from .search_utils import count_needs_reorder, search_medicines, get_autocomplete_index
+from .stats_utils import get_dashboard_stats
+from .reorder_utils import reorder_queue
+from .rollup_utils import daily_totals, medicine_daily_totals, medicine_totals
+from .metrics_utils import Trace, pipeline_metrics
 
 
 # ==================== Authentication Views ====================
@@ -138,7 +154,7 @@ def dashboard_view(request):
     user = request.user
     recent_prescriptions = Prescription.objects.filter(
         uploaded_by=user
-    ).order_by('-created_at')[:5]
+    ).only('id', 'created_at', 'status').order_by('-created_at')[:5]
     
     context = {
         'user': user,
@@ -155,83 +171,17 @@ def upload_prescription_view(request):
         if form.is_valid():
             prescription = form.save(commit=False)
             prescription.uploaded_by = request.user
+            file = form.cleaned_data['file']
+            prescription.file_hash = compute_file_hash(file)
+            trace = Trace()
+            with trace.span('file_save'):
+                prescription.file.save(file.name, file, save=False)
+            prescription.timings = trace.as_json()
             prescription.save()
             
-            # Process prescription asynchronously (in production, use Celery)
-            try:
-                # Perform OCR
-                file_path = prescription.file.path
-                extracted_text = perform_ocr(file_path)
-                prescription.extracted_text = extracted_text
-                
-                # Extract medicine names using AI
-                medicine_names = extract_medicine_names(extracted_text)
-                
-                # Check inventory and prepare results
-                results = []
-                for med_name in medicine_names:
-                    # Search for medicine (case-insensitive, partial match)
-                    medicines = Medicine.objects.filter(
-                        Q(name__icontains=med_name) | Q(name__iexact=med_name)
-                    )
-                    
-                    if medicines.exists():
-                        medicine = medicines.first()
-                        if medicine.stock_quantity > 0:
-                            # Available
-                            alternative = None
-                            # Check for alternatives if needed
-                            alternatives = Alternative.objects.filter(
-                                medicine=medicine
-                            ).select_related('alternative_medicine')
-                            
-                            if alternatives.exists():
-                                alt_med = alternatives.first().alternative_medicine
-                                if alt_med.stock_quantity > 0:
-                                    alternative = alt_med.name
-                            
-                            results.append({
-                                'medicine_name': medicine.name,
-                                'status': 'Available',
-                                'stock': medicine.stock_quantity,
-                                'alternative': alternative
-                            })
-                        else:
-                            # Out of stock - suggest alternative
-                            alternative = None
-                            alternatives = Alternative.objects.filter(
-                                medicine=medicine
-                            ).select_related('alternative_medicine')
-                            
-                            if alternatives.exists():
-                                alt_med = alternatives.first().alternative_medicine
-                                if alt_med.stock_quantity > 0:
-                                    alternative = alt_med.name
-                            
-                            results.append({
-                                'medicine_name': medicine.name,
-                                'status': 'Out of Stock',
-                                'stock': 0,
-                                'alternative': alternative
-                            })
-                    else:
-                        # Medicine not found
-                        results.append({
-                            'medicine_name': med_name,
-                            'status': 'Not Found',
-                            'stock': None,
-                            'alternative': None
-                        })
-                
-                prescription.results_json = results
-                prescription.save()
-                
-                return redirect('results', prescription_id=prescription.id)
-            except Exception as e:
-                return render(request, 'upload_prescription.html', {
-                    'form': form,
-                    'error': f'Error processing prescription: {str(e)}'
-                })
+            # Process prescription in the background; results page polls status
+            submit_prescription(prescription)
+            return redirect('results', prescription_id=prescription.id)
     else:
         form = PrescriptionUploadForm()
     
@@ -244,7 +194,7 @@ def results_view(request, prescription_id):
     prescription = get_object_or_404(Prescription, id=prescription_id)
     
     # Ensure user can only view their own prescriptions (unless admin)
-    if not request.user.is_admin() and prescription.uploaded_by != request.user:
+    if not request.user.is_admin() and prescription.uploaded_by_id != request.user.id:
         return HttpResponse('Unauthorized', status=403)
     
     results = prescription.results_json if prescription.results_json else []
@@ -262,18 +212,15 @@ def inventory_view(request):
     if not request.user.is_admin():
         return HttpResponse('Unauthorized - Admin access required', status=403)
     
-    medicines = Medicine.objects.all().order_by('name')
     search_query = request.GET.get('search', '')
     
     if search_query:
-        medicines = medicines.filter(
-            Q(name__icontains=search_query) |
-            Q(composition__icontains=search_query) |
-            Q(manufacturer__icontains=search_query)
-        )
-    
-    
-    low_stock_count = medicines.filter(stock_quantity__lt=10).count()
+        # Ranked full-text matches instead of a scan of three columns
+        medicines = search_medicines(search_query, limit=settings.MEDICINE_SEARCH_MAX_RESULTS)
+        low_stock_count = count_needs_reorder(search_query)
+    else:
+        medicines = Medicine.objects.all().order_by('name')
+        low_stock_count = get_dashboard_stats()['low_stock_medicines']
 
     context = {
         'medicines': medicines,
@@ -289,17 +236,14 @@ def admin_dashboard_view(request):
     if not request.user.is_admin():
         return HttpResponse('Unauthorized - Admin access required', status=403)
     
-    total_medicines = Medicine.objects.count()
-    low_stock_medicines = Medicine.objects.filter(stock_quantity__lt=10).count()
-    total_prescriptions = Prescription.objects.count()
-    recent_prescriptions = Prescription.objects.order_by('-created_at')[:10]
+    recent_prescriptions = Prescription.objects.select_related('uploaded_by').only(
+        'id', 'created_at', 'status', 'uploaded_by__username'
+    ).order_by('-created_at')[:10]
     
-    context = {
-        'total_medicines': total_medicines,
-        'low_stock_medicines': low_stock_medicines,
-        'total_prescriptions': total_prescriptions,
-        'recent_prescriptions': recent_prescriptions,
-    }
+    today = timezone.localdate()
+    trend = daily_totals(today - timedelta(days=settings.DASHBOARD_TREND_DAYS - 1), today)
+    
+    context = dict(get_dashboard_stats(), recent_prescriptions=recent_prescriptions, trend=trend)
     return render(request, 'admin_dashboard.html', context)
 
 
@@ -324,11 +268,10 @@ def manage_alternatives_view(request):
         return redirect('manage_alternatives')
     
     alternatives = Alternative.objects.select_related('medicine', 'alternative_medicine').all()
-    medicines = Medicine.objects.all().order_by('name')
     
+    # Medicines are picked with the autocomplete API, not a full-catalogue <select>
     return render(request, 'manage_alternatives.html', {
-        'alternatives': alternatives,
-        'medicines': medicines
+        'alternatives': alternatives
     })
 
 
@@ -365,113 +308,112 @@ def api_upload_prescription(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Create prescription record
-    prescription = Prescription.objects.create(
-        file=file,
-        uploaded_by=request.user
+    # Create prescription record, timing the write to storage
+    prescription = Prescription(file_hash=compute_file_hash(file), uploaded_by=request.user)
+    trace = Trace()
+    with trace.span('file_save'):
+        prescription.file.save(file.name, file, save=False)
+    prescription.timings = trace.as_json()
+    prescription.save()
+    
+    # Process prescription in the background; clients poll the status endpoint
+    submit_prescription(prescription)
+    
+    return Response(
+        prescription_status_data(prescription),
+        status=status.HTTP_202_ACCEPTED
     )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_prescription_status(request, prescription_id):
+    """Get the processing status (and results, once done) of a prescription."""
+    try:
+        prescription = Prescription.objects.get(id=prescription_id)
+    except Prescription.DoesNotExist:
+        return Response(
+            {'error': 'Prescription not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    if not request.user.is_admin() and prescription.uploaded_by_id != request.user.id:
+        return Response(
+            {'error': 'Unauthorized'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response(prescription_status_data(prescription), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_upload_prescription_batch(request):
+    """API endpoint for uploading many prescriptions (files and/or ZIP archives)."""
+    uploaded_files = request.FILES.getlist('files') + request.FILES.getlist('file')
+    if not uploaded_files:
+        return Response(
+            {'error': 'No files provided'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     try:
-        # Perform OCR
-        file_path = prescription.file.path
-        extracted_text = perform_ocr(file_path)
-        prescription.extracted_text = extracted_text
-        
-        # Extract medicine names using AI
-        medicine_names = extract_medicine_names(extracted_text)
-        
-        # Check inventory and prepare results
-        results = []
-        for med_name in medicine_names:
-            medicines = Medicine.objects.filter(
-                Q(name__icontains=med_name) | Q(name__iexact=med_name)
-            )
-            
-            if medicines.exists():
-                medicine = medicines.first()
-                if medicine.stock_quantity > 0:
-                    alternative = None
-                    alternatives = Alternative.objects.filter(
-                        medicine=medicine
-                    ).select_related('alternative_medicine')
-                    
-                    if alternatives.exists():
-                        alt_med = alternatives.first().alternative_medicine
-                        if alt_med.stock_quantity > 0:
-                            alternative = {
-                                'name': alt_med.name,
-                                'stock': alt_med.stock_quantity
-                            }
-                    
-                    results.append({
-                        'medicine_name': medicine.name,
-                        'status': 'Available',
-                        'stock': medicine.stock_quantity,
-                        'alternative': alternative
-                    })
-                else:
-                    alternative = None
-                    alternatives = Alternative.objects.filter(
-                        medicine=medicine
-                    ).select_related('alternative_medicine')
-                    
-                    if alternatives.exists():
-                        alt_med = alternatives.first().alternative_medicine
-                        if alt_med.stock_quantity > 0:
-                            alternative = {
-                                'name': alt_med.name,
-                                'stock': alt_med.stock_quantity
-                            }
-                    
-                    results.append({
-                        'medicine_name': medicine.name,
-                        'status': 'Out of Stock',
-                        'stock': 0,
-                        'alternative': alternative
-                    })
-            else:
-                results.append({
-                    'medicine_name': med_name,
-                    'status': 'Not Found',
-                    'stock': None,
-                    'alternative': None
-                })
-        
-        prescription.results_json = results
-        prescription.save()
-        
-        return Response({
-            'prescription_id': prescription.id,
-            'extracted_text': extracted_text,
-            'medicines_found': medicine_names,
-            'results': results
-        }, status=status.HTTP_201_CREATED)
-        
-    except Exception as e:
+        batch, skipped = create_batch(request.user, uploaded_files)
+    except BatchUploadError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    data = batch_status_data(batch)
+    data['skipped'] = skipped
+    return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_prescription_batch_status(request, batch_id):
+    """Get per-file processing progress of a batch upload."""
+    try:
+        batch = PrescriptionBatch.objects.get(id=batch_id)
+    except PrescriptionBatch.DoesNotExist:
         return Response(
-            {'error': f'Error processing prescription: {str(e)}'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'error': 'Batch not found'},
+            status=status.HTTP_404_NOT_FOUND
         )
+    
+    if not request.user.is_admin() and batch.uploaded_by_id != request.user.id:
+        return Response(
+            {'error': 'Unauthorized'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response(batch_status_data(batch), status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_prescription_history(request):
-    """Get prescription history for authenticated user."""
+    """Get prescription history for authenticated user, newest first, one page at a time."""
     prescriptions = Prescription.objects.filter(
         uploaded_by=request.user
-    ).order_by('-created_at')
+    ).only('id', 'file', 'status', 'results_count', 'created_at')
+    
+    # Served by the (uploaded_by, created_at) index
+    paginator = KeysetPagination(('-created_at', '-id'))
+    page = paginator.paginate_queryset(prescriptions, request)
     
     data = []
-    for presc in prescriptions:
+    for presc in page:
         data.append({
             'id': presc.id,
             'file_url': presc.file.url if presc.file else None,
+            'status': presc.status,
             'created_at': presc.created_at.isoformat(),
-            'results_count': len(presc.results_json) if presc.results_json else 0
+            'results_count': presc.results_count
         })
     
-    return Response(data, status=status.HTTP_200_OK)
+    return paginator.get_paginated_response(data)
 
 
 @api_view(['GET'])
@@ -486,11 +428,8 @@ def api_search_medicine(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    medicines = Medicine.objects.filter(
-        Q(name__icontains=query) |
-        Q(composition__icontains=query) |
-        Q(manufacturer__icontains=query)
-    )[:20]
+    # Full-text matches by relevance, topped up with fuzzy name matches
+    medicines = search_medicines(query, limit=20)
     
     data = []
     for med in medicines:
@@ -506,6 +445,51 @@ def api_search_medicine(request):
     return Response(data, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_autocomplete_medicine(request):
+    """Typeahead suggestions: medicines with a name word starting with q, most stock first."""
+    query = request.GET.get('q', '')
+    
+    if not query.strip():
+        return Response(
+            {'error': 'Query parameter "q" is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        limit = int(request.GET.get('limit', settings.MEDICINE_AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = settings.MEDICINE_AUTOCOMPLETE_LIMIT
+    limit = max(1, min(limit, settings.MEDICINE_AUTOCOMPLETE_MAX_LIMIT))
+    
+    data = [
+        {
+            'id': medicine_id,
+            'name': name,
+            'stock_quantity': stock,
+            'is_available': stock > 0
+        }
+        for medicine_id, name, stock in get_autocomplete_index().complete(query, limit=limit)
+    ]
+    
+    return Response(data, status=status.HTTP_200_OK)
+
+
+MEDICINE_LIST_FIELDS = (
+    'id', 'name', 'composition', 'stock_quantity', 'reorder_point', 'needs_reorder',
+    'manufacturer', 'created_at',
+)
+MEDICINE_LIST_ORDERING = ('name', 'id')
+
+
+def medicine_list_data(row):
+    """Serialize a Medicine values() row for the medicines listing."""
+    data = dict(row)
+    data['created_at'] = row['created_at'].isoformat()
+    return data
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def api_medicines(request):
@@ -517,18 +501,19 @@ def api_medicines(request):
         )
     
     if request.method == 'GET':
-        medicines = Medicine.objects.all().order_by('name')
-        data = []
-        for med in medicines:
-            data.append({
-                'id': med.id,
-                'name': med.name,
-                'composition': med.composition,
-                'stock_quantity': med.stock_quantity,
-                'manufacturer': med.manufacturer,
-                'created_at': med.created_at.isoformat(),
-            })
-        return Response(data, status=status.HTTP_200_OK)
+        medicines = Medicine.objects.values(*MEDICINE_LIST_FIELDS)
+        
+        # Whole catalogue as newline-delimited JSON, read in bounded chunks
+        if request.query_params.get('stream') == 'ndjson':
+            rows = iter_keyset(medicines, MEDICINE_LIST_ORDERING)
+            return StreamingHttpResponse(
+                (json.dumps(medicine_list_data(row)) + '\n' for row in rows),
+                content_type='application/x-ndjson'
+            )
+        
+        paginator = KeysetPagination(MEDICINE_LIST_ORDERING)
+        page = paginator.paginate_queryset(medicines, request)
+        return paginator.get_paginated_response([medicine_list_data(row) for row in page])
     
     elif request.method == 'POST':
         name = request.data.get('name')
@@ -538,6 +523,9 @@ def api_medicines(request):
             stock_quantity = 0
         
         manufacturer = request.data.get('manufacturer', '')
+        reorder_point = request.data.get('reorder_point')
+        if reorder_point is None:
+            reorder_point = settings.DEFAULT_REORDER_POINT
         
         if not name:
             return Response(
@@ -549,6 +537,7 @@ def api_medicines(request):
             name=name,
             composition=composition,
             stock_quantity=stock_quantity,
+            reorder_point=reorder_point,
             manufacturer=manufacturer
         )
         
@@ -557,10 +546,182 @@ def api_medicines(request):
             'name': medicine.name,
             'composition': medicine.composition,
             'stock_quantity': medicine.stock_quantity,
+            'reorder_point': medicine.reorder_point,
+            'needs_reorder': medicine.needs_reorder,
             'manufacturer': medicine.manufacturer,
         }, status=status.HTTP_201_CREATED)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_import_medicines(request):
+    """Upsert medicines from an uploaded CSV or Parquet catalogue, matched by name."""
+    if not request.user.is_admin():
+        return Response(
+            {'error': 'Admin access required'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if 'file' not in request.FILES:
+        return Response(
+            {'error': 'No file provided'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    file = request.FILES['file']
+    file_format = request.query_params.get('format') or detect_format(file.name)
+    if file_format not in CATALOGUE_FORMATS:
+        return Response(
+            {'error': 'Invalid format. Allowed: csv, parquet'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        report = import_medicines_file(
+            file,
+            file_format=file_format,
+            chunk_size=settings.CATALOGUE_IMPORT_CHUNK_SIZE,
+            dry_run=request.query_params.get('dry_run') == 'true'
+        )
+    except CatalogueImportError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return Response(report, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_export_medicines(request):
+    """Stream the whole catalogue as CSV, in the format the import accepts."""
+    if not request.user.is_admin():
+        return Response(
+            {'error': 'Admin access required'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    response = StreamingHttpResponse(iter_csv_export(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="medicines.csv"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_reorder_queue(request):
+    """Medicines below their reorder point, fewest days of cover first."""
+    if not request.user.is_admin():
+        return Response(
+            {'error': 'Admin access required'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        days = int(request.GET.get('days', settings.REORDER_DEMAND_DAYS))
+        limit = int(request.GET.get('limit', settings.REORDER_QUEUE_LIMIT))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return Response(
+            {'error': 'days, limit and offset must be whole numbers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    days = max(1, min(days, settings.REORDER_DEMAND_MAX_DAYS))
+    limit = max(1, min(limit, settings.REORDER_QUEUE_MAX_LIMIT))
+    offset = max(0, offset)
+    
+    queue = reorder_queue(days)
+    return Response({
+        'count': len(queue),
+        'demand_days': days,
+        'results': queue[offset:offset + limit],
+    }, status=status.HTTP_200_OK)
+
+
+def parse_date_range(request):
+    """
+    Read start/end (YYYY-MM-DD, end inclusive) query parameters.
+
+    Returns:
+        tuple: (start, end) dates, both inclusive
+
+    Raises:
+        ValueError: With a message for the client
+    """
+    today = timezone.localdate()
+    try:
+        end = date.fromisoformat(request.GET['end']) if 'end' in request.GET else today
+        start = (
+            date.fromisoformat(request.GET['start']) if 'start' in request.GET
+            else end - timedelta(days=settings.ANALYTICS_DEFAULT_DAYS - 1)
+        )
+    except ValueError:
+        raise ValueError('start and end must be dates (YYYY-MM-DD)')
+    if start > end:
+        raise ValueError('start must not be after end')
+    if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+        raise ValueError(f'The range can cover at most {settings.ANALYTICS_MAX_DAYS} days')
+    return start, end
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_demand_analytics(request):
+    """Demand, stock-out rate and substitution rate by medicine or by day, from the daily rollups."""
+    if not request.user.is_admin():
+        return Response(
+            {'error': 'Admin access required'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    group_by = request.GET.get('group_by', 'medicine')
+    if group_by not in ('medicine', 'day'):
+        return Response(
+            {'error': 'group_by must be medicine or day'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        start, end = parse_date_range(request)
+        medicine_id = int(request.GET['medicine_id']) if 'medicine_id' in request.GET else None
+        limit = int(request.GET.get('limit', 100))
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    limit = max(1, min(limit, settings.ANALYTICS_MAX_LIMIT))
+    
+    if group_by == 'day' and medicine_id is not None:
+        results = medicine_daily_totals(medicine_id, start, end)
+    elif group_by == 'day':
+        results = daily_totals(start, end)
+    else:
+        results = medicine_totals(start, end, medicine_id=medicine_id, limit=limit)
+    
+    return Response({
+        'group_by': group_by,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'results': results,
+    }, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    """Pipeline stage latencies, paths taken and cache hit rates, in the Prometheus text format."""
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token_ok = bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        authorization.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()
+    )
+    if not token_ok and not (request.user.is_authenticated and request.user.is_admin()):
+        return HttpResponse('Unauthorized - Admin access required', status=403)
+    
+    return HttpResponse(
+        pipeline_metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def api_medicine_detail(request, medicine_id):
@@ -585,6 +746,8 @@ def api_medicine_detail(request, medicine_id):
             'name': medicine.name,
             'composition': medicine.composition,
             'stock_quantity': medicine.stock_quantity,
+            'reorder_point': medicine.reorder_point,
+            'needs_reorder': medicine.needs_reorder,
             'manufacturer': medicine.manufacturer,
         }, status=status.HTTP_200_OK)
     
@@ -594,15 +757,23 @@ def api_medicine_detail(request, medicine_id):
         if 'stock_quantity' in request.data:
             val = request.data.get('stock_quantity')
             medicine.stock_quantity = val if val is not None else 0
+        if 'reorder_point' in request.data:
+            val = request.data.get('reorder_point')
+            medicine.reorder_point = val if val is not None else settings.DEFAULT_REORDER_POINT
 
         medicine.manufacturer = request.data.get('manufacturer', medicine.manufacturer)
-        medicine.save()
+        # Only write the fields sent, so an edit does not overwrite stock
+        # dispensed since this request read the row
+        fields = {'name', 'composition', 'stock_quantity', 'reorder_point', 'manufacturer'} & set(request.data)
+        medicine.save(update_fields=sorted(fields) + ['updated_at'])
         
         return Response({
             'id': medicine.id,
             'name': medicine.name,
             'composition': medicine.composition,
             'stock_quantity': medicine.stock_quantity,
+            'reorder_point': medicine.reorder_point,
+            'needs_reorder': medicine.needs_reorder,
             'manufacturer': medicine.manufacturer,
         }, status=status.HTTP_200_OK)
     
@@ -612,3 +783,120 @@ def api_medicine_detail(request, medicine_id):
             {'message': 'Medicine deleted successfully'},
             status=status.HTTP_200_OK
         )
+
+
+def parse_quantity(value):
+    """Return value as a positive int, or None if it is not one."""
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity > 0 else None
+
+
+def shortage_data(error, names):
+    """Serialize the shortages of an InsufficientStock error."""
+    return [
+        {
+            'medicine_id': medicine_id,
+            'name': names.get(medicine_id),
+            'requested': requested,
+            'stock_quantity': available,
+        }
+        for medicine_id, (requested, available) in error.shortages.items()
+    ]
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_dispense_medicine(request, medicine_id):
+    """Take a quantity of a medicine out of stock, atomically."""
+    quantity = parse_quantity(request.data.get('quantity', 1))
+    if quantity is None:
+        return Response(
+            {'error': 'quantity must be a positive integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        stock = dispense_medicine(medicine_id, quantity)
+    except Medicine.DoesNotExist:
+        return Response(
+            {'error': 'Medicine not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except InsufficientStock as e:
+        requested, available = e.shortages[medicine_id]
+        return Response(
+            {'error': 'Insufficient stock', 'requested': requested, 'stock_quantity': available},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    return Response({
+        'medicine_id': medicine_id,
+        'dispensed': quantity,
+        'stock_quantity': stock,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_dispense_prescription(request, prescription_id):
+    """Dispense every medicine on a processed prescription, all or nothing."""
+    try:
+        prescription = Prescription.objects.get(id=prescription_id)
+    except Prescription.DoesNotExist:
+        return Response(
+            {'error': 'Prescription not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    if not request.user.is_admin() and prescription.uploaded_by_id != request.user.id:
+        return Response(
+            {'error': 'Unauthorized'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if prescription.status != Prescription.STATUS_COMPLETED:
+        return Response(
+            {'error': 'Prescription has not been processed yet'},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    quantities = request.data.get('quantities') or {}
+    if not isinstance(quantities, dict) or any(
+        not isinstance(q, int) or isinstance(q, bool) or q < 0 for q in quantities.values()
+    ):
+        return Response(
+            {'error': 'quantities must map medicine names to non-negative integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        stocks = dispense_prescription(prescription, quantities)
+    except AlreadyDispensed:
+        return Response(
+            {'error': 'Prescription was already dispensed'},
+            status=status.HTTP_409_CONFLICT
+        )
+    except InsufficientStock as e:
+        names = dict(Medicine.objects.filter(id__in=e.shortages).values_list('id', 'name'))
+        return Response(
+            {'error': 'Insufficient stock', 'shortages': shortage_data(e, names)},
+            status=status.HTTP_409_CONFLICT
+        )
+    except Medicine.DoesNotExist:
+        return Response(
+            {'error': 'Medicine not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    names = dict(Medicine.objects.filter(id__in=stocks).values_list('id', 'name'))
+    return Response({
+        'prescription_id': prescription.id,
+        'dispensed_at': prescription.dispensed_at.isoformat(),
+        'medicines': [
+            {'medicine_id': medicine_id, 'name': names.get(medicine_id), 'stock_quantity': stock}
+            for medicine_id, stock in sorted(stocks.items())
+        ],
+    }, status=status.HTTP_200_OK)